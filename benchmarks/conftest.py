@@ -0,0 +1,22 @@
+import tracemalloc
+
+import pytest
+
+
+@pytest.fixture
+def measure_peak_memory(benchmark):
+    """
+    Runs a function once under `tracemalloc` and reports its peak memory
+    use in the benchmark's `extra_info`, next to the timings.
+    """
+    def measure(fn, *args, **kwargs):
+        tracemalloc.start()
+        try:
+            fn(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_memory_bytes"] = peak
+        return peak
+
+    return measure
@@ -0,0 +1,136 @@
+import copy
+import json
+import random
+from pathlib import Path
+
+import yaml
+
+
+TEST_DATA_DIR = Path(__file__).parent.parent / "tests" / "test_data"
+
+
+def sparql_result(
+    vars_: list[str],
+    columns: list[list[str | None]],
+) -> dict:
+    # Each column holds the values of one variable; None is unbound
+    return {
+        "head": {"vars": vars_},
+        "results": {"bindings": [
+            {
+                var: {"type": "literal", "value": value}
+                for var, value in zip(vars_, row)
+                if value is not None
+            }
+            for row in zip(*columns)
+        ]},
+    }
+
+
+def sparql_results_pair(
+    num_rows: int,
+    num_columns: int,
+    num_extra_columns: int = 0,
+    ordered: bool = False,
+    matching: bool = True,
+    num_distinct: int = 1000,
+    seed: int = 0,
+) -> tuple[dict, dict, list[str]]:
+    """
+    Generates a reference SPARQL result and an actual one with renamed and
+    reordered variables, plus `num_extra_columns` unrelated variables. The
+    actual rows are shuffled unless the results are ordered. If not
+    `matching`, one cell of the actual result is changed.
+
+    Returns:
+        tuple[dict, dict, list[str]]: The reference result, the actual
+        result and the required variables.
+    """
+    rng = random.Random(seed)
+    reference_vars = [f"r{i}" for i in range(num_columns)]
+    reference_columns = [
+        [
+            None if rng.random() < 0.05 else f"value-{rng.randrange(num_distinct)}"
+            for _ in range(num_rows)
+        ]
+        for _ in range(num_columns)
+    ]
+    rows = list(zip(*reference_columns))
+    if not ordered:
+        rng.shuffle(rows)
+    actual_columns = [list(column) for column in zip(*rows)]
+    actual_columns += [
+        [f"extra-{rng.randrange(num_distinct)}" for _ in range(num_rows)]
+        for _ in range(num_extra_columns)
+    ]
+    if not matching:
+        actual_columns[0][num_rows // 2] = "mismatch"
+    permutation = list(range(len(actual_columns)))
+    rng.shuffle(permutation)
+    actual_vars = [f"a{i}" for i in permutation]
+    actual_columns = [actual_columns[i] for i in permutation]
+    return (
+        sparql_result(reference_vars, reference_columns),
+        sparql_result(actual_vars, actual_columns),
+        reference_vars,
+    )
+
+
+def steps_pair(
+    num_actual_steps: int,
+    num_rows: int = 100,
+    num_columns: int = 3,
+    seed: int = 0,
+) -> tuple[list[list[dict]], list[dict]]:
+    """
+    Generates reference steps with one SPARQL query step, and actual steps in
+    which only the last one matches it. The other actual steps are SPARQL
+    queries with other results, or failed steps.
+    """
+    reference_result, actual_result, required_vars = sparql_results_pair(
+        num_rows, num_columns, num_extra_columns=1, seed=seed
+    )
+    reference_steps = [[{
+        "name": "sparql_query",
+        "args": {"query": "SELECT * WHERE { ?s ?p ?o }"},
+        "output": json.dumps(reference_result),
+        "output_media_type": "application/sparql-results+json",
+        "required_columns": required_vars,
+    }]]
+    actual_steps = []
+    for i in range(num_actual_steps - 1):
+        _, other_result, _ = sparql_results_pair(
+            num_rows, num_columns, num_extra_columns=1, matching=False, seed=seed + i + 1
+        )
+        actual_steps.append({
+            "name": "sparql_query",
+            "args": {"query": f"SELECT * WHERE {{ ?s ?p ?o }} LIMIT {i}"},
+            "id": f"call_{i}",
+            "status": "error" if i % 5 == 4 else "success",
+            "output": json.dumps(other_result),
+        })
+    actual_steps.append({
+        "name": "sparql_query",
+        "args": {"query": "SELECT * WHERE { ?s ?p ?o }"},
+        "id": f"call_{num_actual_steps - 1}",
+        "status": "success",
+        "output": json.dumps(actual_result),
+    })
+    return reference_steps, actual_steps
+
+
+def evaluation_results(num_results: int, num_templates: int = 50) -> list[dict]:
+    """
+    Generates per-question evaluation results by copying the sample results
+    in the test data, with new question and template IDs.
+    """
+    samples = yaml.safe_load(
+        (TEST_DATA_DIR / "evaluation_1.yaml").read_text(encoding="utf-8")
+    )
+    results = []
+    for i in range(num_results):
+        result = copy.deepcopy(samples[i % len(samples)])
+        result["question_id"] = f"question-{i}"
+        result["template_id"] = f"template-{i % num_templates}"
+        results.append(result)
+    return results
@@ -0,0 +1,19 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from graphrag_eval import compute_aggregates
+from graphrag_eval.steps.outputs import STEP_OUTPUT_CACHE
+from benchmarks.generators import evaluation_results
+
+
+@pytest.mark.parametrize("num_results", [100, 10_000])
+def test_compute_aggregates(benchmark, measure_peak_memory, num_results):
+    results = evaluation_results(num_results)
+    benchmark.group = "compute_aggregates"
+    STEP_OUTPUT_CACHE.clear()
+    measure_peak_memory(compute_aggregates, results)
+    aggregates = benchmark.pedantic(
+        compute_aggregates, args=(results,), setup=STEP_OUTPUT_CACHE.clear, rounds=5
+    )
+    assert aggregates["per_template"]
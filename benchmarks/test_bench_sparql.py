@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from graphrag_eval import compare_sparql_results
+from benchmarks.generators import sparql_results_pair
+
+
+@pytest.mark.parametrize("num_rows, num_columns", [
+    (100, 3),
+    (10_000, 3),
+    (10_000, 10),
+    (100_000, 3),
+])
+@pytest.mark.parametrize("ordered", [False, True], ids=["unordered", "ordered"])
+@pytest.mark.parametrize("num_extra_columns", [0, 5])
+@pytest.mark.parametrize("matching", [True, False], ids=["match", "mismatch"])
+def test_compare_sparql_results(
+    benchmark,
+    measure_peak_memory,
+    num_rows,
+    num_columns,
+    ordered,
+    num_extra_columns,
+    matching,
+):
+    reference, actual, required_vars = sparql_results_pair(
+        num_rows, num_columns, num_extra_columns, ordered, matching
+    )
+    benchmark.group = f"compare_sparql_results {num_rows}x{num_columns}"
+    measure_peak_memory(compare_sparql_results, reference, actual, required_vars, ordered)
+    score = benchmark(compare_sparql_results, reference, actual, required_vars, ordered)
+    assert score == float(matching)
@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from graphrag_eval import get_steps_matches
+from graphrag_eval.steps.outputs import STEP_OUTPUT_CACHE
+from benchmarks.generators import steps_pair
+
+
+@pytest.mark.parametrize("num_actual_steps", [1, 10, 50])
+@pytest.mark.parametrize("num_rows", [10, 1000])
+def test_get_steps_matches(benchmark, measure_peak_memory, num_actual_steps, num_rows):
+    reference_steps, actual_steps = steps_pair(num_actual_steps, num_rows)
+    benchmark.group = f"get_steps_matches {num_rows} rows"
+
+    def run():
+        return get_steps_matches(reference_steps, actual_steps)
+
+    # Step outputs are decoded in each round, as for a new question
+    STEP_OUTPUT_CACHE.clear()
+    measure_peak_memory(run)
+    matches = benchmark.pedantic(run, setup=STEP_OUTPUT_CACHE.clear, rounds=10)
+    assert [match[2] for match in matches] == [num_actual_steps - 1]
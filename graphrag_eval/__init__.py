@@ -1,4 +1,10 @@
 from .aggregation import *
+from .checkpoint import *
+from .estimation import *
 from .evaluation import *
+from .llm_cache import *
+from .rate_limit import *
+from .records import *
 from .steps import *
 from .steps.sparql import *
+from .streaming import *
@@ -1,8 +1,10 @@
-import json
 from collections import defaultdict
+from fractions import Fraction
 from statistics import mean, median
 from typing import Any, Iterable
 
+from .steps.outputs import StepOutputStore, get_step_output, has_empty_bindings
+
 
 METRICS = [
     "answer_recall",
@@ -11,12 +13,19 @@ METRICS = [
     "answer_relevance_cost",
     "answer_f1",
     "steps_score",
+    "retrieval_recall",
+    "retrieval_precision",
+    "retrieval_ndcg",
+    "retrieval_reciprocal_rank",
+    "retrieval_average_precision",
     "input_tokens",
     "output_tokens",
     "total_tokens",
     "elapsed_sec"
 ]
 
+SKETCH_SIZE = 1024
+
 PROTECTED_METRICS = [
     "input_tokens",
     "output_tokens",
@@ -49,12 +58,24 @@ def update_stats_per_template(
 def update_steps_summary_per_template(
     sample: dict,
     steps_summary_per_template: dict,
-    template_id: str
+    template_id: str,
+    output_store: StepOutputStore | None = None,
+):
+    _update_steps_summary(
+        sample.get("actual_steps", []),
+        steps_summary_per_template[template_id],
+        output_store,
+    )
+
+
+def _update_steps_summary(
+    actual_steps: list[dict],
+    template_steps_summary: dict,
+    output_store: StepOutputStore | None,
 ):
     seen = set()
-    for step in sample.get("actual_steps", []):
+    for step in actual_steps:
         name = step["name"]
-        template_steps_summary = steps_summary_per_template[template_id]
         template_steps_summary["total"][name] += 1
         if step["status"] == "error":
             template_steps_summary["errors"][name] += 1
@@ -62,90 +83,305 @@ def update_steps_summary_per_template(
             seen.add(name)
             template_steps_summary["once_per_sample"][name] += 1
 
-        if step["status"] != "error":
-            try:
-                res = json.loads(step["output"])
-                if "results" in res and "bindings" in res["results"]:
-                    if not res["results"]["bindings"]:
-                        template_steps_summary["empty_results"][name] += 1
-            except json.decoder.JSONDecodeError:
-                pass
+        if step["status"] != "error" \
+                and has_empty_bindings(get_step_output(step, output_store)):
+            template_steps_summary["empty_results"][name] += 1
 
 
-def compute_aggregates(samples: list[dict]) -> dict:
-    number_of_samples_per_template_by_status = defaultdict(lambda: defaultdict(int))
-    stats_per_template = defaultdict(lambda: defaultdict(list))
-    steps_summary_per_template = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+class QuantileSketch:
+    """
+    Mergeable sketch of a series of numbers for estimating the median.
 
-    # Compute per-template stats
-    templates_ids = set()
-    for sample in samples:
-        template_id = sample["template_id"]
-        templates_ids.add(template_id)
+    Values are kept exactly until there are `size` of them. After that, a
+    full level is sorted and every other value is promoted to the next
+    level, where it stands for twice as many values (as in the KLL sketch),
+    so memory grows only logarithmically with the number of values.
+    """
+
+    def __init__(self, size: int = SKETCH_SIZE):
+        self.size = size
+        self.levels: list[list] = [[]]
+        self.count = 0
+        self._offset = 0
+
+    def add(self, value: int | float) -> None:
+        self.levels[0].append(value)
+        self.count += 1
+        if len(self.levels[0]) > self.size:
+            self._compact()
+
+    def merge(self, other: "QuantileSketch") -> None:
+        for level, values in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append([])
+            self.levels[level].extend(values)
+        self.count += other.count
+        self._compact()
+
+    def _compact(self) -> None:
+        for level in range(len(self.levels)):
+            values = self.levels[level]
+            if len(values) <= self.size:
+                continue
+            values.sort()
+            # An odd value out stays at this level, so that the total
+            # weight is preserved
+            leftover = [values.pop()] if len(values) % 2 else []
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            self.levels[level + 1].extend(values[self._offset::2])
+            self._offset = 1 - self._offset
+            self.levels[level] = leftover
 
+    @property
+    def is_exact(self) -> bool:
+        return len(self.levels) == 1
+
+    def median(self) -> int | float:
+        if self.count == 0:
+            return 0
+        if self.is_exact:
+            return median(self.levels[0])
+        weighted = sorted(
+            (value, 2 ** level)
+            for level, values in enumerate(self.levels)
+            for value in values
+        )
+        cumulative_weight = 0
+        for value, weight in weighted:
+            cumulative_weight += weight
+            if 2 * cumulative_weight >= self.count:
+                return value
+        return weighted[-1][0]
+
+
+def _add_to_partials(partials: list[float], value: float) -> None:
+    # Shewchuk's algorithm, as in `math.fsum`: the partials are
+    # non-overlapping floats whose sum is exactly the sum of the values added
+    i = 0
+    for partial in partials:
+        if abs(value) < abs(partial):
+            value, partial = partial, value
+        high = value + partial
+        low = partial - (high - value)
+        if low:
+            partials[i] = low
+            i += 1
+        value = high
+    partials[i:] = [value]
+
+
+class SeriesStats:
+    """
+    Online statistics of a series of numbers, with the same summary as
+    `stats_for_series`. Integers are summed as integers, and floats as the
+    exact partials of `math.fsum`, so merging in any order gives the same
+    result. Exact fractions are only used for the summary.
+    """
+
+    def __init__(self, sketch_size: int = SKETCH_SIZE):
+        self.count = 0
+        self.int_sum = 0
+        self.float_partials: list[float] = []
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch(sketch_size)
+
+    def add(self, value: int | float) -> None:
+        self.count += 1
+        if isinstance(value, int):
+            self.int_sum += value
+        else:
+            _add_to_partials(self.float_partials, value)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.sketch.add(value)
+
+    def merge(self, other: "SeriesStats") -> None:
+        if other.count == 0:
+            return
+        self.count += other.count
+        self.int_sum += other.int_sum
+        for partial in other.float_partials:
+            _add_to_partials(self.float_partials, partial)
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    def summary(self) -> dict[str, float]:
+        if self.count == 0:
+            return stats_for_series([])
+        if self.float_partials:
+            exact_sum = sum(map(Fraction, self.float_partials), Fraction(self.int_sum))
+            total = float(exact_sum)
+            # Correctly rounded, as by `statistics.mean`
+            mean_value = float(exact_sum / self.count)
+        else:
+            total = self.int_sum
+            mean_value = Fraction(self.int_sum, self.count)
+            mean_value = int(mean_value) if mean_value.denominator == 1 else float(mean_value)
+        return {
+            "sum": total,
+            "mean": mean_value,
+            "median": self.sketch.median(),
+            "min": self.min,
+            "max": self.max,
+        }
+
+
+def _new_steps_summary():
+    return defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+
+
+class EvaluationAggregator:
+    """
+    Incremental version of `compute_aggregates`. Samples are added one at a
+    time, partial aggregators (e.g., from several workers) can be merged,
+    and `summary()` returns the same structure as `compute_aggregates`.
+    Results whose actual steps reference their outputs by ID need the
+    output store of the evaluation.
+    """
+
+    def __init__(
+        self,
+        sketch_size: int = SKETCH_SIZE,
+        output_store: StepOutputStore | None = None,
+    ):
+        self.sketch_size = sketch_size
+        self.output_store = output_store
+        self.number_of_samples_per_template_by_status = defaultdict(lambda: defaultdict(int))
+        self.stats_per_template = defaultdict(dict)
+        self.steps_summary_per_template = _new_steps_summary()
+        self.micro_stats = {}
+
+    def _series(self, stats: dict, metric: str) -> SeriesStats:
+        if metric not in stats:
+            stats[metric] = SeriesStats(self.sketch_size)
+        return stats[metric]
+
+    def add(self, sample: dict) -> None:
+        template_id = sample["template_id"]
+        status_counts = self.number_of_samples_per_template_by_status[template_id]
         if "error" in sample:
-            number_of_samples_per_template_by_status[template_id]["error"] += 1
-            continue
-        number_of_samples_per_template_by_status[template_id]["success"] += 1
+            status_counts["error"] += 1
+            return
+        status_counts["success"] += 1
 
-        update_stats_per_template(sample, stats_per_template, template_id)
+        template_stats = self.stats_per_template[template_id]
+        for metric in METRICS:
+            value = sample.get(metric)
+            if value is not None:
+                self._series(template_stats, metric).add(value)
+                self._series(self.micro_stats, metric).add(value)
         update_steps_summary_per_template(
             sample,
-            steps_summary_per_template,
-            template_id
+            self.steps_summary_per_template,
+            template_id,
+            self.output_store,
         )
 
-    summary = {"per_template": {}}
+    def add_table(self, table) -> None:
+        """
+        Adds the results in an `EvaluationTable`, iterating its metric
+        columns directly instead of looking up each metric in each result.
+        """
+        template_ids = table.template_ids
+        for template_id, has_error in zip(template_ids, table.has_error):
+            status = "error" if has_error else "success"
+            self.number_of_samples_per_template_by_status[template_id][status] += 1
+        for metric, column in table.columns.items():
+            if not column:
+                continue
+            micro_series = self._series(self.micro_stats, metric)
+            series_by_template = {}
+            for row, value in zip(column.rows, column.values()):
+                template_id = template_ids[row]
+                if template_id not in series_by_template:
+                    series_by_template[template_id] = self._series(
+                        self.stats_per_template[template_id], metric
+                    )
+                series_by_template[template_id].add(value)
+                micro_series.add(value)
+        for template_id, actual_steps in zip(template_ids, table.actual_steps):
+            if actual_steps:
+                _update_steps_summary(
+                    actual_steps,
+                    self.steps_summary_per_template[template_id],
+                    self.output_store,
+                )
 
-    # Add per-template stats
-    for template_id in templates_ids:
-        template_summary: dict[str, Any] = {
-            "number_of_error_samples": number_of_samples_per_template_by_status[template_id]["error"],
-            "number_of_success_samples": number_of_samples_per_template_by_status[template_id]["success"],
-        }
-        steps_summary = {
-            k1: {k2: v2 for k2, v2 in v1.items()}
-            for k1, v1 in steps_summary_per_template[template_id].items()
+    def merge(self, other: "EvaluationAggregator") -> None:
+        for template_id, counts in other.number_of_samples_per_template_by_status.items():
+            for status, count in counts.items():
+                self.number_of_samples_per_template_by_status[template_id][status] += count
+        for template_id, template_stats in other.stats_per_template.items():
+            for metric, series in template_stats.items():
+                self._series(self.stats_per_template[template_id], metric).merge(series)
+        for metric, series in other.micro_stats.items():
+            self._series(self.micro_stats, metric).merge(series)
+        for template_id, summary in other.steps_summary_per_template.items():
+            for key, counts in summary.items():
+                for name, count in counts.items():
+                    self.steps_summary_per_template[template_id][key][name] += count
+
+    def summary(self) -> dict:
+        summary = {"per_template": {}}
+
+        # Add per-template stats
+        by_status = self.number_of_samples_per_template_by_status
+        for template_id in by_status:
+            template_summary: dict[str, Any] = {
+                "number_of_error_samples": by_status[template_id]["error"],
+                "number_of_success_samples": by_status[template_id]["success"],
+            }
+            steps_summary = {
+                k1: {k2: v2 for k2, v2 in v1.items()}
+                for k1, v1 in self.steps_summary_per_template.get(template_id, {}).items()
+            }
+            if steps_summary:
+                template_summary.update({"steps": steps_summary})
+            template_stats = self.stats_per_template.get(template_id, {})
+            for metric in METRICS:
+                if metric in template_stats or metric in PROTECTED_METRICS:
+                    template_summary[metric] = template_stats.get(
+                        metric, SeriesStats()
+                    ).summary()
+            summary["per_template"][template_id] = template_summary
+
+        # Add micro stats
+        summary["micro"] = {
+            "number_of_error_samples": sum(
+                values["error"] for values in by_status.values()
+            ),
+            "number_of_success_samples": sum(
+                values["success"] for values in by_status.values()
+            ),
         }
-        if steps_summary:
-            template_summary.update({"steps": steps_summary})
         for metric in METRICS:
-            results_for_template = stats_per_template[template_id]
-            series = results_for_template.get(metric, [])
-            if series or metric in PROTECTED_METRICS:
-                template_summary[metric] = stats_for_series(series)
-
-        summary["per_template"][template_id] = template_summary
-
-    # Add micro stats
-    values_ = number_of_samples_per_template_by_status.values()
-    summary["micro"] = {
-        "number_of_error_samples": sum(
-            values["error"] for values in values_
-        ),
-        "number_of_success_samples": sum(
-            values["success"] for values in values_
-        ),
-    }
-    for metric in METRICS:
-        series = [
-            i
-            for values in stats_per_template.values()
-            for i in values[metric]
-            if values.get(metric) is not None
-        ]
-        if series or metric in PROTECTED_METRICS:
-            summary["micro"][metric] = stats_for_series(series)
-
-    # Add macro stats
-    summary["macro"] = {}
-    for metric in METRICS:
-        means = [
-            values[metric]["mean"]
-            for template_id, values in summary["per_template"].items()
-            if values.get(metric) is not None
-        ]
-        if means or metric in PROTECTED_METRICS:
-            summary["macro"][metric] = {"mean": mean(means) if means else 0}
-
-    return summary
+            if metric in self.micro_stats or metric in PROTECTED_METRICS:
+                summary["micro"][metric] = self.micro_stats.get(
+                    metric, SeriesStats()
+                ).summary()
+
+        # Add macro stats
+        summary["macro"] = {}
+        for metric in METRICS:
+            means = [
+                values[metric]["mean"]
+                for template_id, values in summary["per_template"].items()
+                if values.get(metric) is not None
+            ]
+            if means or metric in PROTECTED_METRICS:
+                summary["macro"][metric] = {"mean": mean(means) if means else 0}
+
+        return summary
+
+
+def compute_aggregates(
+    samples: Iterable[dict],
+    output_store: StepOutputStore | None = None,
+) -> dict:
+    aggregator = EvaluationAggregator(output_store=output_store)
+    for sample in samples:
+        aggregator.add(sample)
+    return aggregator.summary()
@@ -1,9 +1,19 @@
+import asyncio
 import csv
+import json
+import tempfile
+import time
+from contextvars import ContextVar
+from itertools import islice
 from pathlib import Path
 
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from tqdm import tqdm
 
+from graphrag_eval.concurrency import SingleFlight, ordered_map
+from graphrag_eval.llm_cache import CACHE_FILE_PATH, LLMCache, make_cache_key
+from graphrag_eval.rate_limit import MAX_RETRIES, LLMScheduler, estimate_tokens
+
 
 IN_FILE_PATH = "../data/data-1.tsv"
 PROMPT_FILE_PATH = "prompts/template.md"
@@ -11,6 +21,18 @@ OUT_FILE_PATH = "results/data-1.tsv"
 OUT_FIELDS = ["#Reference", "#PTarget", "#Matching", "Reasoning", "Error"]
 LLM_MODEL = "gpt-4o-mini"
 TEMPERATURE = 0.0
+MAX_CONCURRENCY = 16
+WRITE_BATCH_SIZE = 100
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_POLL_INTERVAL_SEC = 30.0
+BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# The async client of the running `get_correctness_dicts_async` call, if it
+# has been created, which is seen by the tasks the call creates
+_RUN_ASYNC_OPENAI_CLIENT: ContextVar[list[AsyncOpenAI] | None] = ContextVar(
+    "_RUN_ASYNC_OPENAI_CLIENT", default=None
+)
 
 
 
@@ -57,27 +79,146 @@ def extract_response_values(
     return n_ref, n_target, n_matching, vals[3], ""
 
 
+def build_correctness_dict(
+    reference_answer: str,
+    values: tuple[int | None, int | None, int | None, str, str],
+) -> dict:
+    result = {}
+    result["reference_answer"] = reference_answer
+    num_ref_claims, num_actual_claims, num_matching_claims, reason, error = values
+    if error:
+        result["answer_eval_error"] = error
+    else:
+        result.update({
+            "answer_reference_claims_count": num_ref_claims,
+            "answer_actual_claims_count": num_actual_claims,
+            "answer_matching_claims_count": num_matching_claims,
+            "answer_correctness_reason": reason,
+        })
+        recall, precision, f1 = compute_recall_precision_f1(
+            num_ref_claims, num_actual_claims, num_matching_claims
+        )
+        if recall is not None:
+            result["answer_recall"] = recall
+        if precision is not None:
+            result["answer_precision"] = precision
+        if f1 is not None:
+            result["answer_f1"] = f1
+    return result
+
+
 class AnswerCorrectnessEvaluator:
     def __init__(
         self,
         prompt_file_path: str | Path = PROMPT_FILE_PATH,
-        temperature : float = TEMPERATURE
+        temperature : float = TEMPERATURE,
+        cache: LLMCache | None = None,
+        scheduler: LLMScheduler | None = None,
+        deduplicate: bool = False,
     ):
         with open(prompt_file_path, encoding="utf-8") as f:
             self.prompt_template = f.read()
         self.openai_client = OpenAI()
+        self._async_openai_client = None
         self.temperature = temperature
+        self.cache = cache
+        self.scheduler = scheduler
+        # If deduplicating, identical prompts are sent to the LLM once per
+        # evaluator, unless the request fails or the response is invalid
+        self.single_flight = SingleFlight(
+            is_error=lambda values: bool(values[4])
+        ) if deduplicate else None
+
+    @property
+    def async_openai_client(self) -> AsyncOpenAI:
+        # The pooled connections of a client belong to the event loop that
+        # opened them, and fail once it is closed (e.g., by `asyncio.run`).
+        # `get_correctness_dicts_async` closes its own client when it
+        # returns; other calls share a client per event loop, created on
+        # first use, so that synchronous use does not need it.
+        run_client = _RUN_ASYNC_OPENAI_CLIENT.get()
+        if run_client is not None:
+            if not run_client:
+                run_client.append(AsyncOpenAI())
+            return run_client[0]
+        loop = asyncio.get_running_loop()
+        if self._async_openai_client is None or self._async_openai_client[0] is not loop:
+            self._async_openai_client = (loop, AsyncOpenAI())
+        return self._async_openai_client[1]
+
+    def render_prompt(
+        self,
+        question: str,
+        reference_answer: str,
+        actual_answer: str
+    ) -> str:
+        return self.prompt_template.format(
+            question=question,
+            reference_answer=reference_answer,
+            candidate_answer=actual_answer,
+        )
+
+    def cache_key(self, prompt: str) -> str:
+        return make_cache_key(
+            "answer_correctness", LLM_MODEL, self.temperature, prompt
+        )
+
+    def completion_params(self, prompt: str) -> dict:
+        return {
+            "model": LLM_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.temperature,
+        }
+
+    def create_completion(self, prompt: str):
+        # Retryable errors are retried by the scheduler, if any, and only
+        # raised once its retries are exhausted
+        kwargs = self.completion_params(prompt)
+        if self.scheduler is None:
+            return self.openai_client.chat.completions.create(**kwargs)
+        return self.scheduler.call(
+            self.openai_client.chat.completions.create,
+            estimated_tokens=estimate_tokens(prompt),
+            **kwargs
+        )
+
+    async def create_completion_async(self, prompt: str):
+        kwargs = self.completion_params(prompt)
+        if self.scheduler is None:
+            return await self.async_openai_client.chat.completions.create(**kwargs)
+        return await self.scheduler.call_async(
+            self.async_openai_client.chat.completions.create,
+            estimated_tokens=estimate_tokens(prompt),
+            **kwargs
+        )
 
     def call_llm(self, prompt: str) -> str:
+        if self.cache is not None:
+            cached = self.cache.get(self.cache_key(prompt))
+            if cached is not None:
+                return cached
+        try:
+            response = self.create_completion(prompt)
+        except Exception as e:
+            return str(e).replace("\n", "    ")
+        content = response.choices[0].message.content.strip("\n")
+        if self.cache is not None:
+            self.cache.put(self.cache_key(prompt), content)
+        return content
+
+    async def call_llm_async(self, prompt: str) -> str:
+        if self.cache is not None:
+            cached = self.cache.get(self.cache_key(prompt))
+            if cached is not None:
+                return cached
         try:
-            response = self.openai_client.chat.completions.create(
-                model=LLM_MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=self.temperature
-            )
-            return response.choices[0].message.content.strip("\n")
+            response = await self.create_completion_async(prompt)
         except Exception as e:
             return str(e).replace("\n", "    ")
+        content = response.choices[0].message.content.strip("\n")
+        if self.cache is not None:
+            self.cache.put(self.cache_key(prompt), content)
+        return content
 
     def evaluate_answer(
         self,
@@ -85,69 +226,323 @@ class AnswerCorrectnessEvaluator:
         reference_answer: str,
         actual_answer: str
     ):
-        prompt = self.prompt_template.format(
-            question=question,
-            reference_answer=reference_answer,
-            candidate_answer=actual_answer,
+        prompt = self.render_prompt(question, reference_answer, actual_answer)
+        if self.single_flight is None:
+            return self.judge_prompt(prompt)
+        return self.single_flight.do(
+            self.cache_key(prompt), self.judge_prompt, prompt
+        )
+
+    def judge_prompt(self, prompt: str):
+        return extract_response_values(self.call_llm(prompt))
+
+    async def judge_prompt_async(self, prompt: str):
+        return extract_response_values(await self.call_llm_async(prompt))
+
+    async def evaluate_answer_async(
+        self,
+        question: str,
+        reference_answer: str,
+        actual_answer: str
+    ):
+        prompt = self.render_prompt(question, reference_answer, actual_answer)
+        if self.single_flight is None:
+            return await self.judge_prompt_async(prompt)
+        return await self.single_flight.do_async(
+            self.cache_key(prompt), self.judge_prompt_async, prompt
         )
-        response_str = self.call_llm(prompt)
-        return extract_response_values(response_str)
 
     def get_correctness_dict(
         self,
         reference: dict,
         target: dict,
     ):
-        result = {}
-        result["reference_answer"] = reference["reference_answer"]
-        num_ref_claims, num_actual_claims, num_matching_claims, reason, error = \
-        self.evaluate_answer(
+        values = self.evaluate_answer(
             reference["question_text"],
             reference["reference_answer"],
             target["actual_answer"],
         )
-        if error:
-            result["answer_eval_error"] = error
-        else:
-            result.update({
-                "answer_reference_claims_count": num_ref_claims,
-                "answer_actual_claims_count": num_actual_claims,
-                "answer_matching_claims_count": num_matching_claims,
-                "answer_correctness_reason": reason,
-            })
-            recall, precision, f1 = compute_recall_precision_f1(
-                num_ref_claims, num_actual_claims, num_matching_claims
-            )
-            if recall is not None:
-                result["answer_recall"] = recall
-            if precision is not None:
-                result["answer_precision"] = precision
-            if f1 is not None:
-                result["answer_f1"] = f1
-        return result
+        return build_correctness_dict(reference["reference_answer"], values)
+
+    async def get_correctness_dict_async(
+        self,
+        reference: dict,
+        target: dict,
+    ):
+        values = await self.evaluate_answer_async(
+            reference["question_text"],
+            reference["reference_answer"],
+            target["actual_answer"],
+        )
+        return build_correctness_dict(reference["reference_answer"], values)
+
+    async def get_correctness_dicts_async(
+        self,
+        references_and_targets: list[tuple[dict, dict]],
+        max_concurrency: int = MAX_CONCURRENCY,
+    ) -> list[dict]:
+        # At most `max_concurrency` requests are in flight at any time; the
+        # results are in the order of the input pairs
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def evaluate(reference: dict, target: dict) -> dict:
+            async with semaphore:
+                return await self.get_correctness_dict_async(reference, target)
+
+        run_client = []
+        token = _RUN_ASYNC_OPENAI_CLIENT.set(run_client)
+        try:
+            return await asyncio.gather(*(
+                evaluate(reference, target)
+                for reference, target in references_and_targets
+            ))
+        finally:
+            _RUN_ASYNC_OPENAI_CLIENT.reset(token)
+            if run_client:
+                await run_client[0].close()
+
+    def get_correctness_dicts(
+        self,
+        references_and_targets: list[tuple[dict, dict]],
+        max_concurrency: int = MAX_CONCURRENCY,
+    ) -> list[dict]:
+        return asyncio.run(
+            self.get_correctness_dicts_async(references_and_targets, max_concurrency)
+        )
+
+    def write_batch_file(
+        self,
+        prompts: dict[str, str],
+        batch_file_path: str | Path,
+    ) -> None:
+        with open(batch_file_path, "w", encoding="utf-8") as f:
+            for custom_id, prompt in prompts.items():
+                request = {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": self.completion_params(prompt),
+                }
+                f.write(json.dumps(request, ensure_ascii=False))
+                f.write("\n")
+
+    def wait_for_batch(
+        self,
+        batch_id: str,
+        poll_interval_sec: float = BATCH_POLL_INTERVAL_SEC,
+        timeout_sec: float | None = None,
+    ):
+        started = time.monotonic()
+        while True:
+            batch = self.openai_client.batches.retrieve(batch_id)
+            if batch.status in BATCH_FINAL_STATUSES:
+                return batch
+            if timeout_sec is not None and time.monotonic() - started > timeout_sec:
+                raise TimeoutError(
+                    f"Batch {batch_id} is still {batch.status} after {timeout_sec} s"
+                )
+            time.sleep(poll_interval_sec)
+
+    def read_batch_results(self, batch) -> tuple[dict[str, str], dict[str, str]]:
+        # Returns the response contents and the error messages by custom ID
+        contents = {}
+        errors = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            text = self.openai_client.files.content(file_id).text
+            for line in text.splitlines():
+                if not line.strip():
+                    continue
+                output = json.loads(line)
+                response = output.get("response") or {}
+                body = response.get("body") or {}
+                if output.get("error"):
+                    error = output["error"].get("message", str(output["error"]))
+                elif response.get("status_code") != 200:
+                    error = (body.get("error") or {}).get("message", str(body))
+                else:
+                    content = body["choices"][0]["message"]["content"]
+                    contents[output["custom_id"]] = content.strip("\n")
+                    continue
+                errors[output["custom_id"]] = error.replace("\n", "    ")
+        return contents, errors
+
+    def call_llm_batch(
+        self,
+        prompts: list[str],
+        batch_file_path: str | Path | None = None,
+        poll_interval_sec: float = BATCH_POLL_INTERVAL_SEC,
+        timeout_sec: float | None = None,
+    ) -> list[str]:
+        """
+        Calls the LLM on many prompts through the OpenAI Batch API, which is
+        cheaper but may take up to 24 hours.
+
+        Args:
+            prompts (list[str]): The rendered prompts.
+            batch_file_path (str | Path | None): Where to write the batch
+                request file. A temporary file is used by default.
+            poll_interval_sec (float): Time between checks of the batch status.
+            timeout_sec (float | None): Maximum time to wait for the batch.
+
+        Returns:
+            list[str]: The responses, or error messages, in the order of the
+            prompts.
+
+        Raises:
+            TimeoutError: If the batch is not finished within `timeout_sec`.
+        """
+        responses = [None] * len(prompts)
+        if self.cache is not None:
+            for i, prompt in enumerate(prompts):
+                responses[i] = self.cache.get(self.cache_key(prompt))
+        pending = {str(i): prompt for i, prompt in enumerate(prompts) if responses[i] is None}
+        if not pending:
+            return responses
+        with tempfile.TemporaryDirectory() as temp_dir:
+            if batch_file_path is None:
+                batch_file_path = Path(temp_dir) / "batch_requests.jsonl"
+            self.write_batch_file(pending, batch_file_path)
+            with open(batch_file_path, "rb") as f:
+                input_file = self.openai_client.files.create(file=f, purpose="batch")
+        batch = self.openai_client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW,
+        )
+        batch = self.wait_for_batch(batch.id, poll_interval_sec, timeout_sec)
+        contents, errors = self.read_batch_results(batch)
+        for custom_id, prompt in pending.items():
+            if custom_id in contents:
+                responses[int(custom_id)] = contents[custom_id]
+                if self.cache is not None:
+                    self.cache.put(self.cache_key(prompt), contents[custom_id])
+            else:
+                responses[int(custom_id)] = errors.get(
+                    custom_id, f"No result in batch {batch.id}, which is {batch.status}"
+                )
+        return responses
+
+    def evaluate_answers_batch(
+        self,
+        questions_and_answers: list[tuple[str, str, str]],
+        **kwargs,
+    ) -> list[tuple[int | None, int | None, int | None, str, str]]:
+        # Each tuple contains a question, reference answer and actual answer.
+        # The keyword arguments are passed to `call_llm_batch`.
+        prompts = [self.render_prompt(*qa) for qa in questions_and_answers]
+        return [
+            extract_response_values(response_str)
+            for response_str in self.call_llm_batch(prompts, **kwargs)
+        ]
+
+    def get_correctness_dicts_batch(
+        self,
+        references_and_targets: list[tuple[dict, dict]],
+        **kwargs,
+    ) -> list[dict]:
+        all_values = self.evaluate_answers_batch(
+            [
+                (
+                    reference["question_text"],
+                    reference["reference_answer"],
+                    target["actual_answer"],
+                )
+                for reference, target in references_and_targets
+            ],
+            **kwargs,
+        )
+        return [
+            build_correctness_dict(reference["reference_answer"], values)
+            for (reference, _), values in zip(references_and_targets, all_values)
+        ]
+
+
+def count_written_rows(out_file_path: str | Path) -> int:
+    """
+    Counts the complete result rows in an output file, excluding the header.
+    An incompletely written last row is removed from the file. The file is
+    read line by line.
+    """
+    consumed = 0
+    line_is_complete = False
+
+    def iter_lines(f):
+        nonlocal consumed, line_is_complete
+        for line in f:
+            consumed += len(line)
+            line_is_complete = line.endswith(b"\n")
+            # An incomplete last line may end within a character
+            yield line.decode("utf-8", errors="replace")
+
+    num_records = 0
+    complete_length = 0
+    with open(out_file_path, "rb") as f:
+        try:
+            for _ in csv.reader(iter_lines(f), delimiter="\t"):
+                if not line_is_complete:
+                    break
+                num_records += 1
+                complete_length = consumed
+        except csv.Error:
+            pass
+    if complete_length < Path(out_file_path).stat().st_size:
+        with open(out_file_path, "r+b") as f:
+            f.truncate(complete_length)
+    return max(num_records - 1, 0)
 
 
 def evaluate_and_write(
     in_file_path: str | Path,
     out_file_path: str | Path,
+    cache: LLMCache | None = None,
+    workers: int = 1,
+    resume: bool = False,
+    write_batch_size: int = WRITE_BATCH_SIZE,
+    scheduler: LLMScheduler | None = None,
+    use_batch_api: bool = False,
 ) -> None:
-    evaluator = AnswerCorrectnessEvaluator(PROMPT_FILE_PATH)
-    with open(in_file_path, encoding="utf-8") as f:
-        reader = csv.DictReader(f, delimiter="\t")
-        rows = [row for row in reader]
+    evaluator = AnswerCorrectnessEvaluator(
+        PROMPT_FILE_PATH, cache=cache, scheduler=scheduler
+    )
+    num_done = 0
+    if resume and Path(out_file_path).exists():
+        num_done = count_written_rows(out_file_path)
+        print(f"Skipping {num_done} rows already in {out_file_path}")
     print(f"Writing results to {out_file_path}")
     Path(out_file_path).parent.mkdir(parents=True, exist_ok=True)
-    with open(out_file_path, "w", encoding="utf-8") as f:
+
+    def evaluate_row(row: dict):
+        return evaluator.evaluate_answer(
+            row["Question"],
+            row["Reference answer"],
+            row["Actual answer"]
+        )
+
+    with open(in_file_path, encoding="utf-8") as in_f, \
+            open(out_file_path, "a" if num_done else "w", encoding="utf-8") as f:
+        reader = csv.DictReader(in_f, delimiter="\t")
         writer = csv.writer(f, delimiter="\t")
-        writer.writerow(OUT_FIELDS)
-        for row in tqdm(rows):
-            vals = evaluator.evaluate_answer(
-                row["Question"],
-                row["Reference answer"],
-                row["Actual answer"]
-            )
-            writer.writerow(vals)
-            f.flush()
+        if not num_done:
+            writer.writerow(OUT_FIELDS)
+        rows = islice(reader, num_done, None)
+        if use_batch_api:
+            results = evaluator.evaluate_answers_batch([
+                (row["Question"], row["Reference answer"], row["Actual answer"])
+                for row in rows
+            ])
+        else:
+            results = ordered_map(evaluate_row, tqdm(rows), workers)
+        # Results are written in the order of the input rows, in batches
+        batch = []
+        for vals in results:
+            batch.append(vals)
+            if len(batch) >= write_batch_size:
+                writer.writerows(batch)
+                f.flush()
+                batch.clear()
+        writer.writerows(batch)
 
 
 def main():
@@ -155,8 +550,63 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--in-file", type=str, default=IN_FILE_PATH)
     parser.add_argument("-o", "--out-file", type=str, default=OUT_FILE_PATH)
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of rows evaluated concurrently",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip rows already present in the output file and append to it",
+    )
+    parser.add_argument("--cache-file", type=str, default=CACHE_FILE_PATH)
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write cached LLM responses",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=float,
+        default=None,
+        help="Maximum LLM requests per minute",
+    )
+    parser.add_argument(
+        "--tpm",
+        type=float,
+        default=None,
+        help="Maximum estimated LLM tokens per minute",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=MAX_RETRIES,
+        help="Retries of rate-limited or failed LLM requests",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Submit all rows as one OpenAI batch and wait for its results",
+    )
     args = parser.parse_args()
+    cache = LLMCache(args.cache_file, enabled=not args.no_cache)
+    scheduler = LLMScheduler(
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        max_retries=args.max_retries,
+    )
     evaluate_and_write(
         in_file_path=args.in_file,
         out_file_path=args.out_file,
+        cache=cache,
+        workers=args.workers,
+        resume=args.resume,
+        scheduler=scheduler,
+        use_batch_api=args.batch,
     )
+    print(f"LLM cache: {cache.stats()}")
+    print(f"LLM requests: {scheduler.stats()}")
+    cache.close()
@@ -1,37 +1,232 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from langevals_core.base_evaluator import EvaluationResultSkipped
+from langevals_ragas.lib.common import (
+    RagasResult,
+    capture_cost,
+    check_max_tokens,
+    prepare_llm,
+)
 from langevals_ragas.response_relevancy import (
     RagasResponseRelevancyEvaluator,
     RagasResponseRelevancyEntry
 )
+from pydantic import PrivateAttr
+from ragas import SingleTurnSample
+from ragas.metrics import ResponseRelevancy
+
+from graphrag_eval.concurrency import SingleFlight
+from graphrag_eval.estimation import (
+    RELEVANCE_EMBEDDING_CALLS,
+    RELEVANCE_LLM_CALLS,
+    RELEVANCE_PROMPT_TOKENS,
+)
+from graphrag_eval.llm_cache import LLMCache, make_cache_key
+from graphrag_eval.rate_limit import LLMScheduler, estimate_tokens
+
+
+LLM_MODEL = 'openai/gpt-4o-mini'
+MAX_TOKENS = 65_536
+MAX_WORKERS = 16
+# The temperature of the LLM generating questions from the answer, as in
+# `RagasResponseRelevancyEvaluator`
+RELEVANCE_TEMPERATURE = 0.7
+
+
+class SharedClientsRelevancyEvaluator(RagasResponseRelevancyEvaluator):
+    """
+    `RagasResponseRelevancyEvaluator` whose LangChain LLM and embeddings
+    clients are prepared once, on first use, and shared by all its
+    evaluations, rather than prepared again for each evaluation.
+    """
+
+    _clients: tuple | None = PrivateAttr(default=None)
+    _clients_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def prepare_clients(self) -> tuple:
+        with self._clients_lock:
+            if self._clients is None:
+                self._clients = prepare_llm(
+                    self, self.settings, temperature=RELEVANCE_TEMPERATURE
+                )
+            return self._clients
+
+    def evaluate(self, entry: RagasResponseRelevancyEntry):
+        # As `RagasResponseRelevancyEvaluator.evaluate`, with the shared
+        # clients
+        llm, embeddings = self.prepare_clients()
+        skip = check_max_tokens(
+            input=entry.input,
+            output=entry.output,
+            settings=self.settings,
+        )
+        if skip:
+            return skip
+        scorer = ResponseRelevancy(llm=llm, embeddings=embeddings)
+        calculate_similarity = scorer.calculate_similarity
+        calculate_score = scorer._calculate_score
+        similarity = 0
+        answers = []
+
+        def record_similarity(question, generated_questions):
+            nonlocal similarity
+            result = calculate_similarity(question, generated_questions)
+            similarity += result
+            return result
+
+        def record_answers(generated_answers, row):
+            answers.extend(generated_answers)
+            return calculate_score(generated_answers, row)
+
+        scorer.calculate_similarity = record_similarity
+        scorer._calculate_score = record_answers
+        with capture_cost(llm) as cost:
+            score = scorer.single_turn_score(
+                SingleTurnSample(user_input=entry.input, response=entry.output)
+            )
+        if not any(answer.question for answer in answers):
+            return EvaluationResultSkipped(
+                details="No questions could be generated from output.",
+            )
+        generated_questions = "\n".join(f"- {answer.question}" for answer in answers)
+        any_noncommittal = any(answer.noncommittal for answer in answers)
+        return RagasResult(
+            score=score,
+            cost=cost,
+            details=f"Questions generated from output:\n\n{generated_questions}\n\n"
+            f"Similarity to original question: {similarity}\n"
+            f"Evasive answer: {any_noncommittal}",
+        )
+
+
+def _without_cost(relevance_dict: dict) -> dict:
+    if "answer_relevance_cost" not in relevance_dict:
+        return relevance_dict
+    return {**relevance_dict, "answer_relevance_cost": 0.0}
+
+
+class AnswerRelevanceEvaluator:
+    def __init__(
+        self,
+        model_name : str = LLM_MODEL,
+        max_tokens: int = MAX_TOKENS,
+        cache: LLMCache | None = None,
+        scheduler: LLMScheduler | None = None,
+        deduplicate: bool = False,
+    ):
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        self.cache = cache
+        self.scheduler = scheduler
+        # If deduplicating, identical questions and answers are judged once
+        # per evaluator, unless the judgment fails. The shared judgments cost
+        # nothing, so that the aggregated cost is that of the calls made.
+        self.single_flight = SingleFlight(
+            is_error=lambda relevance_dict: "answer_relevance_error" in relevance_dict,
+            shared_result=_without_cost,
+        ) if deduplicate else None
+        # Created once and shared by all questions and threads, with its LLM
+        # and embeddings clients
+        self.ragas_evaluator = SharedClientsRelevancyEvaluator(
+            settings={
+                'model': model_name,
+                'max_tokens': max_tokens
+            }
+        )
+
+    def cache_key(self, question_text: str, actual_answer: str) -> str:
+        return make_cache_key(
+            "answer_relevance",
+            self.model_name,
+            self.max_tokens,
+            question_text,
+            actual_answer,
+        )
+
+    def get_relevance_dict(
+        self,
+        question_text: str,
+        actual_answer: str,
+    ) -> dict:
+        if self.single_flight is None:
+            return self.judge_relevance(question_text, actual_answer)
+        relevance_dict = self.single_flight.do(
+            self.cache_key(question_text, actual_answer),
+            self.judge_relevance,
+            question_text,
+            actual_answer,
+        )
+        # The same result is shared by all callers
+        return dict(relevance_dict)
+
+    def judge_relevance(
+        self,
+        question_text: str,
+        actual_answer: str,
+    ) -> dict:
+        if self.cache is not None:
+            cached = self.cache.get_json(self.cache_key(question_text, actual_answer))
+            if cached is not None:
+                return cached
+        entry = RagasResponseRelevancyEntry(
+            input=question_text,
+            output=actual_answer
+        )
+        try:
+            if self.scheduler is None:
+                result = self.ragas_evaluator.evaluate(entry)
+            else:
+                # One judgment makes several LLM and embeddings requests,
+                # each LLM prompt with the answer
+                result = self.scheduler.call(
+                    self.ragas_evaluator.evaluate,
+                    entry,
+                    estimated_tokens=RELEVANCE_LLM_CALLS
+                    * (RELEVANCE_PROMPT_TOKENS + estimate_tokens(actual_answer)),
+                    num_requests=RELEVANCE_LLM_CALLS + RELEVANCE_EMBEDDING_CALLS,
+                )
+            if result.status == "processed":
+                relevance_dict = {
+                    "answer_relevance": result.score,
+                    "answer_relevance_cost": result.cost.amount,
+                    "answer_relevance_reason": result.details,
+                }
+                if self.cache is not None:
+                    self.cache.put_json(
+                        self.cache_key(question_text, actual_answer),
+                        relevance_dict
+                    )
+                return relevance_dict
+            else:
+                return {
+                    "answer_relevance_error": result.details
+                }
+        except Exception as e:
+            return {
+                "answer_relevance_error": str(e),
+            }
+
+    def get_relevance_dicts(
+        self,
+        questions_and_answers: list[tuple[str, str]],
+        max_workers: int = MAX_WORKERS,
+    ) -> list[dict]:
+        # The results are in the order of the input pairs
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(
+                lambda question_and_answer: self.get_relevance_dict(*question_and_answer),
+                questions_and_answers,
+            ))
 
 
 def get_relevance_dict(
     question_text: str,
     actual_answer: str,
-    model_name : str = 'openai/gpt-4o-mini',
-    max_tokens: int = 65_536
+    model_name : str = LLM_MODEL,
+    max_tokens: int = MAX_TOKENS,
+    cache: LLMCache | None = None,
+    scheduler: LLMScheduler | None = None,
 ) -> dict:
-    settings_dict = {
-        'model': model_name,
-        'max_tokens': max_tokens
-    }
-    entry = RagasResponseRelevancyEntry(
-        input=question_text,
-        output=actual_answer
-    )
-    evaluator = RagasResponseRelevancyEvaluator(settings=settings_dict)
-    try:
-        result = evaluator.evaluate(entry)
-        if result.status == "processed":
-            return {
-                "answer_relevance": result.score,
-                "answer_relevance_cost": result.cost.amount,
-                "answer_relevance_reason": result.details,
-            }
-        else:
-            return {
-                "answer_relevance_error": result.details
-            }
-    except Exception as e:
-        return {
-            "answer_relevance_error": str(e),
-        }
+    evaluator = AnswerRelevanceEvaluator(model_name, max_tokens, cache, scheduler)
+    return evaluator.get_relevance_dict(question_text, actual_answer)
@@ -0,0 +1,85 @@
+import json
+import os
+import threading
+import warnings
+from pathlib import Path
+
+
+class EvaluationCheckpoint:
+    """
+    Durable append-only log of per-question evaluation results, in JSONL
+    format, keyed by `question_id`.
+
+    The log is indexed on creation; only the byte offset of each result is
+    kept in memory. A trailing line that was not completely written (e.g.,
+    because the process was killed) is discarded. Complete lines which are
+    not results with a `question_id` are skipped with a warning. Each
+    appended result is flushed and synced to disk.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._offsets = {}
+        self._lock = threading.Lock()
+        self._size = 0
+        if self.path.exists():
+            with open(self.path, "rb") as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.endswith(b"\n"):
+                        break
+                    question_id = _read_question_id(line)
+                    if question_id is None:
+                        warnings.warn(
+                            f"Skipping malformed line {line_number} of {self.path}"
+                        )
+                    else:
+                        self._offsets[question_id] = self._size
+                    self._size += len(line)
+        self._file = open(self.path, "ab")
+        self._file.truncate(self._size)
+        self._reader = open(self.path, "rb")
+
+    def __contains__(self, question_id: str) -> bool:
+        return question_id in self._offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def get(self, question_id: str) -> dict | None:
+        if question_id not in self._offsets:
+            return None
+        with self._lock:
+            self._reader.seek(self._offsets[question_id])
+            line = self._reader.readline()
+        return json.loads(line)
+
+    def append(self, result: dict) -> None:
+        line = json.dumps(result, ensure_ascii=False).encode("utf-8") + b"\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._offsets[result["question_id"]] = self._size
+            self._size += len(line)
+
+    def close(self) -> None:
+        self._file.close()
+        self._reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def _read_question_id(line: bytes) -> str | None:
+    # Returns None if the line is not a result with a question ID
+    try:
+        result = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(result, dict) or not isinstance(result.get("question_id"), str):
+        return None
+    return result["question_id"]
@@ -0,0 +1,183 @@
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Awaitable, Callable, Iterable, Iterator, TypeVar
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# The default number of results kept by `SingleFlight`
+SINGLE_FLIGHT_MAX_RESULTS = 1024
+
+
+def ordered_map(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    max_workers: int = 1,
+) -> Iterator[R]:
+    """
+    Lazily applies a function to items, like `map`, on up to `max_workers`
+    threads.
+
+    At most `2 * max_workers` items are submitted ahead of the oldest
+    pending one, so memory stays bounded for long inputs, and the results
+    are yielded in the order of the items.
+
+    Args:
+        fn (Callable): The function to apply.
+        items (Iterable): The items, consumed lazily.
+        max_workers (int): The number of threads. With 1 or less, the items
+            are processed in the calling thread.
+
+    Returns:
+        Iterator: The results, in the order of the items.
+    """
+    if max_workers <= 1:
+        yield from map(fn, items)
+        return
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = deque()
+        for item in items:
+            if len(in_flight) >= 2 * max_workers:
+                yield in_flight.popleft().result()
+            in_flight.append(executor.submit(fn, item))
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def run_concurrently(
+    calls: list[Callable[[], R]],
+    executor: Executor | None = None,
+) -> list[R]:
+    """
+    Runs independent calls at the same time, the last one in the calling
+    thread and the others on the executor.
+
+    Put a CPU-bound call last, so that it runs while the others wait on I/O.
+
+    Args:
+        calls (list[Callable]): The calls.
+        executor (Executor | None): Runs all calls but the last. Its tasks
+            must not wait on it, or it can deadlock. None for a temporary
+            thread pool with a thread for each call.
+
+    Returns:
+        list: The results, in the order of the calls.
+    """
+    if len(calls) <= 1:
+        return [call() for call in calls]
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=len(calls) - 1) as executor:
+            return run_concurrently(calls, executor)
+    futures = [executor.submit(call) for call in calls[:-1]]
+    last_result = calls[-1]()
+    return [future.result() for future in futures] + [last_result]
+
+
+class SingleFlight:
+    """
+    Collapses calls with the same key into a single call: the first caller
+    runs the function, concurrent callers with the same key wait for its
+    result, and later callers get the kept result without a call.
+
+    Up to `max_results` results are kept, and the least recently used one is
+    dropped beyond that, so memory stays bounded for long runs. Exceptions
+    are raised to all concurrent callers, but are not kept, so a later call
+    with the same key runs the function again. Neither are the results for
+    which `is_error` is true, such as the error results of a judge that
+    catches its exceptions. Works across threads and, with `do_async`,
+    across asyncio tasks.
+
+    Args:
+        is_error (Callable | None): Tells whether a result is an error, which
+            is returned to the concurrent callers but not kept.
+        shared_result (Callable | None): Makes the result returned to the
+            callers that did not run the function from the result of the
+            call, e.g., with its cost set to zero. None to return the same
+            result to all callers.
+        max_results (int): The number of results kept. With 0, only
+            concurrent calls are collapsed.
+    """
+
+    def __init__(
+        self,
+        is_error: Callable[[R], bool] | None = None,
+        shared_result: Callable[[R], R] | None = None,
+        max_results: int = SINGLE_FLIGHT_MAX_RESULTS,
+    ):
+        self.is_error = is_error
+        self.shared_result = shared_result
+        self.max_results = max_results
+        self.calls = 0
+        self.shared = 0
+        self._results = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key) -> tuple[Future, bool]:
+        # Returns the future of the key's result, and whether the caller
+        # must run the function
+        with self._lock:
+            if key in self._results:
+                self.shared += 1
+                self._results.move_to_end(key)
+                future = Future()
+                future.set_result(self._results[key])
+                return future, False
+            if key in self._in_flight:
+                self.shared += 1
+                return self._in_flight[key], False
+            future = Future()
+            self._in_flight[key] = future
+            self.calls += 1
+            return future, True
+
+    def _share(self, result: R) -> R:
+        if self.shared_result is None:
+            return result
+        return self.shared_result(result)
+
+    def _finish(
+        self,
+        key,
+        future: Future,
+        result=None,
+        error: BaseException | None = None,
+    ) -> None:
+        with self._lock:
+            del self._in_flight[key]
+            if error is None and self.max_results > 0 \
+                    and not (self.is_error and self.is_error(result)):
+                self._results[key] = result
+                if len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def do(self, key, fn: Callable[..., R], *args, **kwargs) -> R:
+        future, is_leader = self._join(key)
+        if not is_leader:
+            return self._share(future.result())
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def do_async(self, key, fn: Callable[..., Awaitable[R]], *args, **kwargs) -> R:
+        future, is_leader = self._join(key)
+        if not is_leader:
+            return self._share(await asyncio.wrap_future(future))
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
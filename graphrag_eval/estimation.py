@@ -0,0 +1,244 @@
+import hashlib
+import os
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Iterable, Mapping
+
+from .rate_limit import estimate_tokens
+
+
+# As in `answer_correctness` and `answer_relevance`, which need OpenAI
+PROMPT_FILE_PATH = "prompts/template.md"
+CORRECTNESS_MODEL = "gpt-4o-mini"
+RELEVANCE_MODEL = "gpt-4o-mini"
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# USD per million input and output tokens
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "text-embedding-ada-002": (0.10, 0.0),
+}
+
+# The correctness judge outputs three counts and a short explanation
+CORRECTNESS_OUTPUT_TOKENS = 150
+# The RAGAS relevance judge generates a question from the answer three times,
+# each with a prompt of instructions and examples, and embeds the question
+# and the generated questions
+RELEVANCE_LLM_CALLS = 3
+RELEVANCE_PROMPT_TOKENS = 270
+RELEVANCE_OUTPUT_TOKENS = 30
+RELEVANCE_EMBEDDING_CALLS = 2
+LLM_LATENCY_SEC = 2.0
+EMBEDDING_LATENCY_SEC = 0.3
+
+
+# Where tiktoken downloads the encodings from, and caches them
+TIKTOKEN_ENCODING_URL = "https://openaipublic.blob.core.windows.net/encodings/{}.tiktoken"
+
+
+def _tiktoken_cache_path(encoding_name: str) -> Path | None:
+    # tiktoken has no API telling whether an encoding is cached, so this
+    # mirrors `tiktoken.load.read_file_cached` as of tiktoken 0.11. The tests
+    # check it against tiktoken itself, so that a change there fails them
+    # instead of silently making the estimates fall back to characters.
+    # None if caching is disabled, so that every load downloads.
+    if "TIKTOKEN_CACHE_DIR" in os.environ:
+        cache_dir = os.environ["TIKTOKEN_CACHE_DIR"]
+    elif "DATA_GYM_CACHE_DIR" in os.environ:
+        cache_dir = os.environ["DATA_GYM_CACHE_DIR"]
+    else:
+        cache_dir = os.path.join(tempfile.gettempdir(), "data-gym-cache")
+    if not cache_dir:
+        return None
+    url = TIKTOKEN_ENCODING_URL.format(encoding_name)
+    return Path(cache_dir) / hashlib.sha1(url.encode()).hexdigest()
+
+
+def get_token_counter(model: str, download: bool = False) -> Callable[[str], int]:
+    """
+    Returns a function counting the tokens of a text for a model, with
+    tiktoken if it is installed and has the model's encoding, or else
+    estimated from the number of characters.
+
+    tiktoken reads its encodings from its cache (`TIKTOKEN_CACHE_DIR`), and
+    downloads an encoding which is not there. Unless `download` is True, an
+    encoding which is not in the cache is not used, so that no network
+    access is made.
+    """
+    try:
+        import tiktoken
+        encoding_name = tiktoken.encoding_name_for_model(model)
+        if not download:
+            cache_path = _tiktoken_cache_path(encoding_name)
+            if cache_path is None or not cache_path.exists():
+                return estimate_tokens
+        encoding = tiktoken.get_encoding(encoding_name)
+    except Exception:
+        return estimate_tokens
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def _new_template_estimate() -> dict:
+    return {
+        "questions": 0,
+        "correctness_calls": 0,
+        "relevance_calls": 0,
+        "embedding_calls": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "embedding_tokens": 0,
+        "cost_usd": 0.0,
+        "latency_sec": 0.0,
+    }
+
+
+def _cost_usd(
+    prices: Mapping[str, tuple[float, float]],
+    model: str,
+    input_tokens: int,
+    output_tokens: int,
+) -> float:
+    input_price, output_price = prices.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def _wall_time_sec(
+    estimate: dict,
+    max_workers: int,
+    requests_per_minute: float | None,
+    tokens_per_minute: float | None,
+) -> float:
+    # The slowest of the bounds by concurrency, requests and tokens per minute
+    bounds = [estimate["latency_sec"] / max(max_workers, 1)]
+    if requests_per_minute:
+        # As counted by `LLMScheduler`, which counts embeddings requests too
+        requests = estimate["correctness_calls"] + estimate["relevance_calls"] \
+            + estimate["embedding_calls"]
+        bounds.append(60 * requests / requests_per_minute)
+    if tokens_per_minute:
+        tokens = estimate["input_tokens"] + estimate["output_tokens"]
+        bounds.append(60 * tokens / tokens_per_minute)
+    return max(bounds)
+
+
+def estimate_evaluation(
+    qa_dataset: Iterable[dict],
+    responses_dict: Mapping | None = None,
+    max_workers: int = 1,
+    requests_per_minute: float | None = None,
+    tokens_per_minute: float | None = None,
+    prompt_file_path: str | Path = PROMPT_FILE_PATH,
+    count_tokens: Callable[[str], int] | None = None,
+    prices: Mapping[str, tuple[float, float]] = MODEL_PRICES,
+    llm_latency_sec: float = LLM_LATENCY_SEC,
+    embedding_latency_sec: float = EMBEDDING_LATENCY_SEC,
+    download_encodings: bool = False,
+) -> dict:
+    """
+    Estimates the LLM tokens, cost and time of `run_evaluation`, without
+    calling any LLM (a dry run).
+
+    Every answer correctness prompt is rendered from the prompt template and
+    its tokens are counted locally. The relevance judge is estimated from
+    the length of the answer and the number of calls it makes.
+
+    Args:
+        qa_dataset (Iterable[dict]): The reference templates.
+        responses_dict (Mapping | None): The responses by question ID. For a
+            question without a response (e.g., before the system under
+            evaluation is run), the reference answer stands for the actual
+            answer. Questions with error responses are not judged.
+        max_workers (int): The number of questions evaluated concurrently.
+        requests_per_minute (float | None): The LLM requests rate limit.
+        tokens_per_minute (float | None): The LLM tokens rate limit.
+        prompt_file_path (str | Path): The answer correctness prompt template.
+        count_tokens (Callable[[str], int] | None): Counts the tokens of a
+            text. By default, tiktoken with a cached encoding (see
+            `get_token_counter`) or an estimate of 4 characters per token.
+        prices (Mapping[str, tuple[float, float]]): USD per million input
+            and output tokens, by model.
+        llm_latency_sec (float): The average time of an LLM call.
+        embedding_latency_sec (float): The average time of an embeddings
+            call.
+        download_encodings (bool): Whether tiktoken may download encodings
+            which are not in its cache. By default, no network access is
+            made.
+
+    Returns:
+        dict: For each template in `per_template`, and in `total`, the
+        number of questions, calls, input, output and embedding tokens,
+        `cost_usd` and `wall_time_sec`, the expected time of the evaluation
+        at the given concurrency and rate limits.
+    """
+    with open(prompt_file_path, encoding="utf-8") as f:
+        prompt_template = f.read()
+    responses_dict = responses_dict if responses_dict is not None else {}
+    if count_tokens is None:
+        count_correctness_tokens = get_token_counter(CORRECTNESS_MODEL, download_encodings)
+        count_relevance_tokens = get_token_counter(RELEVANCE_MODEL, download_encodings)
+        count_embedding_tokens = get_token_counter(EMBEDDING_MODEL, download_encodings)
+    else:
+        count_correctness_tokens = count_tokens
+        count_relevance_tokens = count_tokens
+        count_embedding_tokens = count_tokens
+
+    per_template = defaultdict(_new_template_estimate)
+    for template in qa_dataset:
+        estimate = per_template[template["template_id"]]
+        for question in template["questions"]:
+            estimate["questions"] += 1
+            if question["id"] in responses_dict:
+                actual_result = responses_dict[question["id"]]
+                if "error" in actual_result:
+                    continue
+                actual_answer = actual_result.get("actual_answer")
+            else:
+                actual_answer = question.get("reference_answer")
+            if actual_answer is None:
+                continue
+
+            answer_tokens = count_relevance_tokens(actual_answer)
+            input_tokens = RELEVANCE_LLM_CALLS * (RELEVANCE_PROMPT_TOKENS + answer_tokens)
+            output_tokens = RELEVANCE_LLM_CALLS * RELEVANCE_OUTPUT_TOKENS
+            embedding_tokens = count_embedding_tokens(question["question_text"]) \
+                + RELEVANCE_LLM_CALLS * RELEVANCE_OUTPUT_TOKENS
+            estimate["relevance_calls"] += RELEVANCE_LLM_CALLS
+            estimate["embedding_calls"] += RELEVANCE_EMBEDDING_CALLS
+            estimate["input_tokens"] += input_tokens
+            estimate["output_tokens"] += output_tokens
+            estimate["embedding_tokens"] += embedding_tokens
+            estimate["cost_usd"] += \
+                _cost_usd(prices, RELEVANCE_MODEL, input_tokens, output_tokens) \
+                + _cost_usd(prices, EMBEDDING_MODEL, embedding_tokens, 0)
+            # The relevance judge makes its calls one after the other
+            latency_sec = RELEVANCE_LLM_CALLS * llm_latency_sec \
+                + RELEVANCE_EMBEDDING_CALLS * embedding_latency_sec
+
+            if "reference_answer" in question:
+                prompt = prompt_template.format(
+                    question=question["question_text"],
+                    reference_answer=question["reference_answer"],
+                    candidate_answer=actual_answer,
+                )
+                input_tokens = count_correctness_tokens(prompt)
+                estimate["correctness_calls"] += 1
+                estimate["input_tokens"] += input_tokens
+                estimate["output_tokens"] += CORRECTNESS_OUTPUT_TOKENS
+                estimate["cost_usd"] += _cost_usd(
+                    prices, CORRECTNESS_MODEL, input_tokens, CORRECTNESS_OUTPUT_TOKENS
+                )
+                # The two judges of a question run at the same time
+                latency_sec = max(latency_sec, llm_latency_sec)
+            estimate["latency_sec"] += latency_sec
+
+    total = _new_template_estimate()
+    for estimate in per_template.values():
+        for key, value in estimate.items():
+            total[key] += value
+    for estimate in [*per_template.values(), total]:
+        estimate["wall_time_sec"] = _wall_time_sec(
+            estimate, max_workers, requests_per_minute, tokens_per_minute
+        )
+        del estimate["latency_sec"]
+    return {"per_template": dict(per_template), "total": total}
@@ -1,62 +1,303 @@
-from .steps import get_steps_evaluation_result_dict
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Callable, Container, Iterable, Iterator, Mapping
 
+from .checkpoint import EvaluationCheckpoint
+from .concurrency import ordered_map, run_concurrently
+from .llm_cache import LLMCache
+from .rate_limit import LLMScheduler
+from .steps import (
+    RETRIEVAL_PAIRS_KEY,
+    get_steps_evaluation_result_dict,
+    retrieval_result_dicts,
+)
+from .steps.outputs import StepOutputStore
 
-def run_evaluation(
-        qa_dataset: list[dict],
-        responses_dict: dict,
-) -> list[dict]:
+
+# The number of results, in the order of the questions, whose retrieval steps
+# are scored in one batch
+RETRIEVAL_BATCH_SIZE = 256
+
+
+def evaluate_question(
+        template_id: str,
+        question: dict,
+        actual_result: dict,
+        answer_correctness_evaluator=None,
+        answer_relevance_evaluator=None,
+        steps_evaluator: Callable[[dict, dict], dict] | None = None,
+        executor: Executor | None = None,
+) -> dict:
     # Output metrics are not nested, for simpler aggregation
-    answer_correctess_evaluator = None
-    evaluation_results = []
+    eval_result = {
+        "template_id": template_id,
+        "question_id": actual_result["question_id"],
+        "question_text": question["question_text"]
+    }
+    if "reference_answer" in question:
+        eval_result["reference_answer"] = question["reference_answer"]
+    if "reference_steps" in question:
+        eval_result["reference_steps"] = question["reference_steps"]
+    if "error" in actual_result:
+        eval_result.update({
+            "status": "error",
+            "error": actual_result["error"],
+        })
+        return eval_result
+    eval_result["status"] = "success"
+    # The LLM judges and the steps scoring are independent, so they run at
+    # the same time, with the CPU-bound steps scoring in this thread while
+    # the judges wait on the network. The judges run on the executor, if
+    # given, or on a thread each.
+    calls = []
+    if "actual_answer" in actual_result:
+        eval_result["actual_answer"] = actual_result["actual_answer"]
+        if not answer_relevance_evaluator:
+            from graphrag_eval.answer_relevance import AnswerRelevanceEvaluator
+            answer_relevance_evaluator = AnswerRelevanceEvaluator()
+        calls.append(partial(
+            answer_relevance_evaluator.get_relevance_dict,
+            question["question_text"],
+            actual_result["actual_answer"],
+        ))
+    if "reference_answer" in question and "actual_answer" in actual_result:
+        if not answer_correctness_evaluator:
+            from graphrag_eval.answer_correctness import AnswerCorrectnessEvaluator
+            answer_correctness_evaluator = AnswerCorrectnessEvaluator()
+        calls.append(partial(
+            answer_correctness_evaluator.get_correctness_dict,
+            question,
+            actual_result,
+        ))
+    if "steps" in actual_result:
+        steps_evaluator = steps_evaluator or get_steps_evaluation_result_dict
+        calls.append(partial(steps_evaluator, question, actual_result))
+    for result_dict in run_concurrently(calls, executor):
+        eval_result.update(result_dict)
+    eval_result.update({
+        "input_tokens": actual_result["input_tokens"],
+        "output_tokens": actual_result["output_tokens"],
+        "total_tokens": actual_result["total_tokens"],
+        "elapsed_sec": actual_result["elapsed_sec"],
+    })
+    return eval_result
+
+
+def iter_evaluation_tasks(
+        qa_dataset: Iterable[dict],
+        responses_dict: Mapping,
+        cache: LLMCache | None = None,
+        skip_question_ids: Container[str] = (),
+        scheduler: LLMScheduler | None = None,
+        deduplicate: bool = True,
+) -> Iterator[tuple]:
+    # The answer evaluators are created on first use and shared by all
+    # questions. Skipped questions do not need them. If deduplicating,
+    # identical judge inputs in the run are judged once, and the result is
+    # shared.
+    answer_correctness_evaluator = None
+    answer_relevance_evaluator = None
     for template in qa_dataset:
         template_id = template["template_id"]
         for question in template["questions"]:
             actual_result = responses_dict[question["id"]]
-            eval_result = {
-                "template_id": template_id,
-                "question_id": actual_result["question_id"],
-                "question_text": question["question_text"]
-            }
-            if "reference_answer" in question:
-                eval_result["reference_answer"] = question["reference_answer"]
-            if "reference_steps" in question:
-                eval_result["reference_steps"] = question["reference_steps"]
-            if "error" in actual_result:
-                eval_result.update({
-                    "status": "error",
-                    "error": actual_result["error"],
-                })
-                evaluation_results.append(eval_result)
-                continue
-            eval_result["status"] = "success"
-            if "actual_answer" in actual_result:
-                eval_result["actual_answer"] = actual_result["actual_answer"]
-                from graphrag_eval import answer_relevance
-                eval_result.update(
-                    answer_relevance.get_relevance_dict(
-                        question["question_text"],
-                        actual_result["actual_answer"],
+            if "actual_answer" in actual_result \
+                    and "error" not in actual_result \
+                    and question["id"] not in skip_question_ids:
+                if not answer_relevance_evaluator:
+                    from graphrag_eval.answer_relevance import AnswerRelevanceEvaluator
+                    answer_relevance_evaluator = AnswerRelevanceEvaluator(
+                        cache=cache, scheduler=scheduler, deduplicate=deduplicate
                     )
-                )
-            if "reference_answer" in question and "actual_answer" in actual_result:
-                from graphrag_eval.answer_correctness import AnswerCorrectnessEvaluator
-                if not answer_correctess_evaluator:
-                    answer_correctess_evaluator = AnswerCorrectnessEvaluator()
-                eval_result.update(
-                    answer_correctess_evaluator.get_correctness_dict(
-                        question,
-                        actual_result,
+                if "reference_answer" in question and not answer_correctness_evaluator:
+                    from graphrag_eval.answer_correctness import AnswerCorrectnessEvaluator
+                    answer_correctness_evaluator = AnswerCorrectnessEvaluator(
+                        cache=cache, scheduler=scheduler, deduplicate=deduplicate
                     )
-                )
-            if "steps" in actual_result:
-                eval_result.update(
-                    get_steps_evaluation_result_dict(question, actual_result)
-                )
-            eval_result.update({
-                "input_tokens": actual_result["input_tokens"],
-                "output_tokens": actual_result["output_tokens"],
-                "total_tokens": actual_result["total_tokens"],
-                "elapsed_sec": actual_result["elapsed_sec"],
-            })
-            evaluation_results.append(eval_result)
-    return evaluation_results
+            yield (
+                template_id,
+                question,
+                actual_result,
+                answer_correctness_evaluator,
+                answer_relevance_evaluator,
+            )
+
+
+def _evaluate_and_checkpoint(
+        task: tuple,
+        checkpoint: EvaluationCheckpoint | None,
+        steps_evaluator: Callable[[dict, dict], dict] | None = None,
+        executor: Executor | None = None,
+) -> dict:
+    eval_result = evaluate_question(*task, steps_evaluator, executor)
+    # Results with retrieval steps are checkpointed once these are scored
+    if checkpoint is not None and RETRIEVAL_PAIRS_KEY not in eval_result:
+        checkpoint.append(eval_result)
+    return eval_result
+
+
+def _with_retrieval_metrics(eval_result: dict, retrieval_dict: dict) -> dict:
+    # The retrieval metrics replace the retrieval pairs, in the same place
+    result = {}
+    for key, value in eval_result.items():
+        if key == RETRIEVAL_PAIRS_KEY:
+            result.update(retrieval_dict)
+        else:
+            result[key] = value
+    return result
+
+
+def _score_retrieval_in_batches(
+        results: Iterator[dict],
+        checkpoint: EvaluationCheckpoint | None,
+) -> Iterator[dict]:
+    # The retrieval steps of up to `RETRIEVAL_BATCH_SIZE` consecutive results
+    # are scored in one vectorized pass, and the results are yielded in order
+    pending = []
+
+    def score_pending() -> Iterator[dict]:
+        batch = [result for result in pending if RETRIEVAL_PAIRS_KEY in result]
+        retrieval_dicts = iter(retrieval_result_dicts(
+            [result[RETRIEVAL_PAIRS_KEY] for result in batch]
+        ))
+        for eval_result in pending:
+            if RETRIEVAL_PAIRS_KEY in eval_result:
+                eval_result = _with_retrieval_metrics(eval_result, next(retrieval_dicts))
+                if checkpoint is not None:
+                    checkpoint.append(eval_result)
+            yield eval_result
+        pending.clear()
+
+    for eval_result in results:
+        if not pending and RETRIEVAL_PAIRS_KEY not in eval_result:
+            yield eval_result
+            continue
+        pending.append(eval_result)
+        if len(pending) >= RETRIEVAL_BATCH_SIZE:
+            yield from score_pending()
+    yield from score_pending()
+
+
+def _iter_evaluation(
+        qa_dataset: Iterable[dict],
+        responses_dict: Mapping,
+        max_workers: int,
+        cache: LLMCache | None,
+        checkpoint: EvaluationCheckpoint | None,
+        scheduler: LLMScheduler | None,
+        steps_processes: int = 0,
+        output_store: StepOutputStore | None = None,
+        deduplicate: bool = True,
+) -> Iterator[dict]:
+    skip_question_ids = checkpoint if checkpoint is not None else ()
+    steps_pool = None
+    # The retrieval steps are scored in batches by `_score_retrieval_in_batches`
+    steps_evaluator = partial(
+        get_steps_evaluation_result_dict, output_store=output_store, score_retrieval=False
+    )
+    tasks = iter_evaluation_tasks(
+        qa_dataset, responses_dict, cache, skip_question_ids, scheduler, deduplicate
+    )
+    if steps_processes > 0:
+        from graphrag_eval.steps.parallel import StepsProcessPool
+        steps_pool = StepsProcessPool(steps_processes, output_store)
+        tasks = _submit_steps_ahead(tasks, steps_pool, steps_processes, skip_question_ids)
+    # The judges of all questions share the run's threads: the relevance and
+    # correctness judges of up to `max_workers` questions run at once, and
+    # none of them waits on another task of the pool
+    judges_executor = ThreadPoolExecutor(max_workers=2 * max(max_workers, 1))
+
+    def evaluate(task: tuple) -> dict:
+        question_id = task[1]["id"]
+        if question_id in skip_question_ids:
+            return checkpoint.get(question_id)
+        if steps_pool is None:
+            return _evaluate_and_checkpoint(
+                task, checkpoint, steps_evaluator, judges_executor
+            )
+        *task, steps_future = task
+        return _evaluate_and_checkpoint(
+            task, checkpoint, lambda *_: steps_future.result(), judges_executor
+        )
+
+    try:
+        yield from _score_retrieval_in_batches(
+            ordered_map(evaluate, tasks, max_workers), checkpoint
+        )
+    finally:
+        judges_executor.shutdown()
+        if steps_pool is not None:
+            steps_pool.close()
+
+
+def _submit_steps_ahead(
+        tasks: Iterator[tuple],
+        steps_pool,
+        steps_processes: int,
+        skip_question_ids: Container[str],
+) -> Iterator[tuple]:
+    # The steps of each question are submitted to the worker processes up
+    # to `2 * steps_processes` questions ahead of the one being evaluated,
+    # so that the processes are kept busy independently of the number of
+    # threads running the LLM judges. Each task is extended with the future
+    # of its steps result, or None.
+    pending = deque()
+    for task in tasks:
+        _, question, actual_result, *_ = task
+        steps_future = None
+        if question["id"] not in skip_question_ids \
+                and "error" not in actual_result \
+                and "steps" in actual_result:
+            steps_future = steps_pool.submit(question, actual_result, score_retrieval=False)
+        pending.append((*task, steps_future))
+        if len(pending) > 2 * steps_processes:
+            yield pending.popleft()
+    yield from pending
+
+
+def iter_evaluation(
+        qa_dataset: Iterable[dict],
+        responses_dict: Mapping,
+        max_workers: int = 1,
+        cache: LLMCache | None = None,
+        checkpoint_path: str | Path | None = None,
+        scheduler: LLMScheduler | None = None,
+        steps_processes: int = 0,
+        output_store: StepOutputStore | None = None,
+        deduplicate: bool = True,
+) -> Iterator[dict]:
+    if checkpoint_path is None:
+        yield from _iter_evaluation(
+            qa_dataset, responses_dict, max_workers, cache, None, scheduler,
+            steps_processes, output_store, deduplicate,
+        )
+        return
+    if output_store is not None:
+        # Output IDs are valid only in the store of the run that assigned them
+        raise ValueError("An output store cannot be used with a checkpoint")
+    # Questions with a result in the checkpoint are not evaluated again, and
+    # each new result is appended to the checkpoint as soon as it is ready
+    with EvaluationCheckpoint(checkpoint_path) as checkpoint:
+        yield from _iter_evaluation(
+            qa_dataset, responses_dict, max_workers, cache, checkpoint, scheduler,
+            steps_processes, deduplicate=deduplicate,
+        )
+
+
+def run_evaluation(
+        qa_dataset: list[dict],
+        responses_dict: dict,
+        max_workers: int = 1,
+        cache: LLMCache | None = None,
+        checkpoint_path: str | Path | None = None,
+        scheduler: LLMScheduler | None = None,
+        steps_processes: int = 0,
+        output_store: StepOutputStore | None = None,
+        deduplicate: bool = True,
+) -> list[dict]:
+    return list(iter_evaluation(
+        qa_dataset, responses_dict, max_workers, cache, checkpoint_path, scheduler,
+        steps_processes, output_store, deduplicate,
+    ))
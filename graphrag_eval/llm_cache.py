@@ -0,0 +1,164 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+CACHE_FILE_PATH = ".graphrag_eval_cache/llm_cache.sqlite"
+MAX_CACHE_SIZE_BYTES = 512 * 1024 * 1024
+# The number of access times of cache hits kept in memory before they are
+# written to the file
+ACCESS_FLUSH_SIZE = 1024
+
+
+def make_cache_key(*parts) -> str:
+    """
+    Computes a content-addressed cache key.
+
+    Args:
+        *parts: JSON-serializable values identifying an LLM call, such as
+            the metric name, model, temperature and rendered prompt.
+
+    Returns:
+        str: The SHA-256 hex digest of the serialized parts.
+    """
+    serialized = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Persistent cache of LLM judgments, stored in a local SQLite file.
+
+    When the total size of the cached values exceeds `max_size_bytes`, the
+    least recently used entries are evicted. The access times of cache hits
+    are written in batches, on `put`, on `close`, or every
+    `ACCESS_FLUSH_SIZE` hits, so that reads do not commit. A cache created
+    with `enabled=False` never stores anything and misses on every lookup.
+    """
+
+    def __init__(
+        self,
+        path: str | Path = CACHE_FILE_PATH,
+        max_size_bytes: int = MAX_CACHE_SIZE_BYTES,
+        enabled: bool = True,
+    ):
+        self.path = Path(path)
+        self.max_size_bytes = max_size_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._size_bytes = 0
+        # Access times of cache hits, by key, not yet written to the file
+        self._accessed = {}
+        if enabled:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+            )
+            self._connection.commit()
+            self._size_bytes = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()[0]
+
+    def get(self, key: str) -> str | None:
+        if not self.enabled:
+            self.misses += 1
+            return None
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._accessed[key] = time.time()
+            if len(self._accessed) >= ACCESS_FLUSH_SIZE:
+                self._flush_accessed()
+                self._connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        if not self.enabled:
+            return
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            # Eviction takes the access times of earlier hits into account
+            self._flush_accessed()
+            previous = self._connection.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            self._size_bytes += size - (previous[0] if previous else 0)
+            self._evict()
+            self._connection.commit()
+
+    def _flush_accessed(self) -> None:
+        if self._accessed:
+            self._connection.executemany(
+                "UPDATE entries SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._accessed.items()],
+            )
+            self._accessed.clear()
+
+    def _evict(self) -> None:
+        while self._size_bytes > self.max_size_bytes:
+            rows = self._connection.execute(
+                "SELECT key, size FROM entries ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._size_bytes = 0
+                return
+            for key, size in rows:
+                if self._size_bytes <= self.max_size_bytes:
+                    return
+                self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._size_bytes -= size
+                self.evictions += 1
+
+    def get_json(self, key: str):
+        value = self.get(key)
+        return None if value is None else json.loads(value)
+
+    def put_json(self, key: str, value) -> None:
+        self.put(key, json.dumps(value, ensure_ascii=False))
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size_bytes
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size_bytes": self._size_bytes,
+        }
+
+    def close(self) -> None:
+        if self._connection is not None:
+            with self._lock:
+                self._flush_accessed()
+                self._connection.commit()
+                self._connection.close()
+                self._connection = None
+            self.enabled = False
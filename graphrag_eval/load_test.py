@@ -0,0 +1,221 @@
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from graphrag_eval.evaluation import run_evaluation
+from graphrag_eval.mock_server import MockOpenAIServer, lognormal_latency
+from graphrag_eval.rate_limit import MAX_RETRIES, LLMScheduler
+
+
+WORDS = (
+    "graph", "node", "edge", "query", "entity", "relation", "class", "property",
+    "literal", "resource", "dataset", "ontology", "triple", "label", "value",
+)
+
+
+def synthetic_corpus(
+    num_questions: int,
+    num_templates: int = 10,
+    seed: int = 0,
+) -> tuple[list[dict], dict]:
+    """
+    Generates reference templates and responses with a reference and an
+    actual answer for each question. All questions and answers are distinct,
+    so that none of the judge calls are deduplicated.
+
+    Returns:
+        tuple[list[dict], dict]: The reference templates and the responses by
+        question ID, as taken by `run_evaluation`.
+    """
+    rng = random.Random(seed)
+    qa_dataset = [
+        {"template_id": f"template_{i}", "questions": []}
+        for i in range(min(num_templates, num_questions))
+    ]
+    responses_dict = {}
+    for i in range(num_questions):
+        question_id = f"question_{i}"
+        words = " ".join(rng.choices(WORDS, k=8))
+        qa_dataset[i % len(qa_dataset)]["questions"].append({
+            "id": question_id,
+            "question_text": f"What is the {words} of item {i}?",
+            "reference_answer": f"The {words} of item {i} is {rng.randint(0, 1000)}.",
+        })
+        responses_dict[question_id] = {
+            "question_id": question_id,
+            "actual_answer": f"It is {rng.randint(0, 1000)}, the {words} of item {i}.",
+            "input_tokens": rng.randint(100, 1000),
+            "output_tokens": rng.randint(10, 100),
+            "total_tokens": 0,
+            "elapsed_sec": rng.uniform(0.5, 5.0),
+        }
+        response = responses_dict[question_id]
+        response["total_tokens"] = response["input_tokens"] + response["output_tokens"]
+    return qa_dataset, responses_dict
+
+
+@contextmanager
+def openai_environment(base_url: str) -> Iterator[None]:
+    # The OpenAI client and litellm read the server URL and key from the
+    # environment when they are created or called
+    names = ("OPENAI_BASE_URL", "OPENAI_API_KEY")
+    previous = {name: os.environ.get(name) for name in names}
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "mock-key"
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def run_load_test(
+    num_questions: int = 100,
+    max_workers: int = 8,
+    latency: Callable[[], float] | None = None,
+    error_rate: float = 0.0,
+    rate_limit_rate: float = 0.0,
+    server_requests_per_minute: float | None = None,
+    retry_after_sec: float = 0.1,
+    scheduler: LLMScheduler | None = None,
+    seed: int = 0,
+) -> dict:
+    """
+    Runs `run_evaluation` on a synthetic corpus against a local
+    `MockOpenAIServer`, which stands in for the OpenAI chat completions and
+    embeddings APIs, to measure throughput and retry behaviour offline.
+
+    The OpenAI client retries 429 and 500 errors itself (twice, by default)
+    before they reach the scheduler, so the server counts more rate-limited
+    requests than the scheduler does.
+
+    Args:
+        num_questions (int): The size of the synthetic corpus.
+        max_workers (int): The number of questions evaluated concurrently.
+        latency (Callable[[], float] | None): Returns the time in seconds of
+            each request to the server, e.g. `lognormal_latency(1.0)`. None
+            for no added latency.
+        error_rate (float): The fraction of requests failing with 500.
+        rate_limit_rate (float): The fraction of requests rejected with 429.
+        server_requests_per_minute (float | None): The server's rate limit,
+            beyond which requests are rejected with 429.
+        retry_after_sec (float): The `retry-after` of random 429 errors.
+        scheduler (LLMScheduler | None): Throttles and retries the judges'
+            calls, as in `run_evaluation`.
+        seed (int): Seeds the corpus and the server's random errors.
+
+    Returns:
+        dict: The number of questions, `max_workers`, `elapsed_sec`,
+        `questions_per_sec`, the number of questions with judge errors in
+        `evaluation_errors`, and the `server` and `scheduler` stats.
+    """
+    qa_dataset, responses_dict = synthetic_corpus(num_questions, seed=seed)
+    server = MockOpenAIServer(
+        latency=latency,
+        error_rate=error_rate,
+        rate_limit_rate=rate_limit_rate,
+        requests_per_minute=server_requests_per_minute,
+        retry_after_sec=retry_after_sec,
+        seed=seed,
+    )
+    with server, openai_environment(server.base_url):
+        start = time.perf_counter()
+        results = run_evaluation(
+            qa_dataset, responses_dict, max_workers=max_workers, scheduler=scheduler
+        )
+        elapsed_sec = time.perf_counter() - start
+    return {
+        "questions": len(results),
+        "max_workers": max_workers,
+        "elapsed_sec": elapsed_sec,
+        "questions_per_sec": len(results) / elapsed_sec,
+        "evaluation_errors": sum(
+            1 for result in results
+            if "answer_eval_error" in result or "answer_relevance_error" in result
+        ),
+        "server": server.stats(),
+        "scheduler": scheduler.stats() if scheduler is not None else None,
+    }
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Load test of the evaluation against a local mock OpenAI server"
+    )
+    parser.add_argument("-n", "--questions", type=int, default=100)
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8, 16],
+        help="Numbers of questions evaluated concurrently, one run for each",
+    )
+    parser.add_argument(
+        "--latency-sec",
+        type=float,
+        default=0.5,
+        help="Median latency of the mock server's responses",
+    )
+    parser.add_argument(
+        "--latency-sigma",
+        type=float,
+        default=0.5,
+        help="Spread of the log-normal latency of the mock server's responses",
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--server-rpm",
+        type=float,
+        default=None,
+        help="Requests per minute beyond which the mock server responds with 429",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=float,
+        default=None,
+        help="Maximum LLM requests per minute of the scheduler",
+    )
+    parser.add_argument(
+        "--tpm",
+        type=float,
+        default=None,
+        help="Maximum estimated LLM tokens per minute of the scheduler",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=MAX_RETRIES,
+        help="Retries of rate-limited or failed LLM requests",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for workers in args.workers:
+        scheduler = LLMScheduler(
+            requests_per_minute=args.rpm,
+            tokens_per_minute=args.tpm,
+            max_retries=args.max_retries,
+        )
+        report = run_load_test(
+            num_questions=args.questions,
+            max_workers=workers,
+            latency=lognormal_latency(args.latency_sec, args.latency_sigma, args.seed),
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            server_requests_per_minute=args.server_rpm,
+            scheduler=scheduler,
+            seed=args.seed,
+        )
+        print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+import base64
+import hashlib
+import json
+import math
+import random
+import struct
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from graphrag_eval.rate_limit import estimate_tokens
+
+
+MOCK_RESPONSE_CONTENT = "1\t1\t1\tMock response"
+EMBEDDING_DIMENSIONS = 1536
+RETRY_AFTER_SEC = 1.0
+
+
+def constant_latency(sec: float) -> Callable[[], float]:
+    return lambda: sec
+
+
+def uniform_latency(
+    min_sec: float,
+    max_sec: float,
+    seed: int | None = None,
+) -> Callable[[], float]:
+    rng = random.Random(seed)
+    return lambda: rng.uniform(min_sec, max_sec)
+
+
+def lognormal_latency(
+    median_sec: float,
+    sigma: float = 0.5,
+    seed: int | None = None,
+) -> Callable[[], float]:
+    # Long-tailed, like the latency of real LLM APIs
+    rng = random.Random(seed)
+    return lambda: rng.lognormvariate(math.log(median_sec), sigma)
+
+
+def default_chat_responder(body: dict) -> str:
+    """
+    Answers the answer correctness prompt with `MOCK_RESPONSE_CONTENT`, and
+    the RAGAS question generation prompt of the answer relevance judge with
+    the JSON it expects.
+    """
+    prompt = str(body["messages"][-1].get("content", ""))
+    if "noncommittal" in prompt:
+        return json.dumps({"question": "What is the mock question?", "noncommittal": 0})
+    return MOCK_RESPONSE_CONTENT
+
+
+def mock_chat_completion(body: dict, content: str) -> dict:
+    prompt_tokens = sum(
+        estimate_tokens(str(message.get("content", "")))
+        for message in body.get("messages", [])
+    )
+    n = body.get("n") or 1
+    completion_tokens = n * estimate_tokens(content)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", ""),
+        "choices": [
+            {
+                "index": i,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+            for i in range(n)
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def mock_embedding(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> list[float]:
+    # A unit vector determined by the text, so equal texts have similarity 1
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector]
+
+
+def mock_embeddings(body: dict) -> dict:
+    inputs = body["input"]
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    dimensions = body.get("dimensions") or EMBEDDING_DIMENSIONS
+    data = []
+    prompt_tokens = 0
+    for i, item in enumerate(inputs):
+        # Inputs may be texts or lists of token IDs
+        text = item if isinstance(item, str) else json.dumps(item)
+        prompt_tokens += estimate_tokens(text) if isinstance(item, str) else len(item)
+        embedding = mock_embedding(text, dimensions)
+        if body.get("encoding_format") == "base64":
+            embedding = base64.b64encode(
+                struct.pack(f"<{len(embedding)}f", *embedding)
+            ).decode("ascii")
+        data.append({"object": "embedding", "index": i, "embedding": embedding})
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model", ""),
+        "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+    }
+
+
+class MockOpenAIServer:
+    """
+    Local HTTP server imitating the OpenAI chat completions, embeddings,
+    Files and Batch APIs, for exercising evaluation offline.
+
+    Point an OpenAI client at it with `base_url=server.base_url` (or the
+    `OPENAI_BASE_URL` environment variable). Each chat completion request,
+    direct or in a batch, is answered with `responder(request_body)`, which
+    returns the message content. Embeddings are unit vectors determined by
+    the input text. A batch is reported as in progress on the first
+    `polls_to_complete - 1` retrievals and as completed afterwards.
+
+    Direct chat completion and embeddings requests take `latency()` seconds.
+    A `rate_limit_rate` fraction of them, and all beyond
+    `requests_per_minute`, are answered with a 429 error and a
+    `retry-after` header, and an `error_rate` fraction of the others with a
+    500 error. `stats()` counts the requests and their outcomes.
+    """
+
+    def __init__(
+        self,
+        responder: Callable[[dict], str] = default_chat_responder,
+        polls_to_complete: int = 1,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: Callable[[], float] | None = None,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        requests_per_minute: float | None = None,
+        retry_after_sec: float = RETRY_AFTER_SEC,
+        seed: int | None = None,
+    ):
+        self.responder = responder
+        self.polls_to_complete = polls_to_complete
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.requests_per_minute = requests_per_minute
+        self.retry_after_sec = retry_after_sec
+        self.files = {}
+        self.batches = {}
+        # Output file ID, number of failed requests and polls of each batch
+        self._batch_states = {}
+        self._counts = Counter()
+        self._request_times = deque()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the number of direct API requests, of chat completions and
+        embeddings answered, and of requests answered with 429 and 500
+        errors.
+        """
+        with self._lock:
+            return {
+                key: self._counts[key]
+                for key in ("requests", "chat_completions", "embeddings", "rate_limited", "errors")
+            }
+
+    def _admit(self) -> tuple[int, float | None]:
+        # Returns the error status of a request (or 200), and the seconds
+        # after which to retry a rate-limited one
+        with self._lock:
+            self._counts["requests"] += 1
+            now = time.monotonic()
+            if self.requests_per_minute is not None:
+                while self._request_times and now - self._request_times[0] >= 60.0:
+                    self._request_times.popleft()
+                if len(self._request_times) >= self.requests_per_minute:
+                    self._counts["rate_limited"] += 1
+                    return 429, 60.0 - (now - self._request_times[0])
+                self._request_times.append(now)
+            if self._rng.random() < self.rate_limit_rate:
+                self._counts["rate_limited"] += 1
+                return 429, self.retry_after_sec
+            if self._rng.random() < self.error_rate:
+                self._counts["errors"] += 1
+                return 500, None
+        return 200, None
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._counts[key] += 1
+
+    def _add_file(self, content: bytes, filename: str, purpose: str) -> dict:
+        file = {
+            "id": f"file-{uuid.uuid4().hex}",
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        with self._lock:
+            self.files[file["id"]] = (file, content)
+        return file
+
+    def _run_batch(self, input_content: bytes) -> tuple[bytes, int, int]:
+        outputs = []
+        num_failed = 0
+        for line in input_content.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            try:
+                content = self.responder(request["body"])
+                response = {
+                    "status_code": 200,
+                    "request_id": uuid.uuid4().hex,
+                    "body": mock_chat_completion(request["body"], content),
+                }
+                error = None
+            except Exception as e:
+                num_failed += 1
+                response = None
+                error = {"code": "server_error", "message": str(e)}
+            outputs.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": request["custom_id"],
+                "response": response,
+                "error": error,
+            }))
+        output = "".join(line + "\n" for line in outputs).encode("utf-8")
+        return output, len(outputs), num_failed
+
+    def _create_batch(self, params: dict) -> dict | None:
+        with self._lock:
+            if params["input_file_id"] not in self.files:
+                return None
+            _, input_content = self.files[params["input_file_id"]]
+        output, num_total, num_failed = self._run_batch(input_content)
+        output_file = self._add_file(output, "batch_output.jsonl", "batch_output")
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "endpoint": params["endpoint"],
+            "input_file_id": params["input_file_id"],
+            "completion_window": params["completion_window"],
+            "created_at": int(time.time()),
+            "status": "validating",
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": num_total, "completed": 0, "failed": 0},
+        }
+        with self._lock:
+            self.batches[batch["id"]] = batch
+            self._batch_states[batch["id"]] = [output_file["id"], num_failed, 0]
+        return batch
+
+    def _retrieve_batch(self, batch_id: str) -> dict | None:
+        with self._lock:
+            if batch_id not in self.batches:
+                return None
+            batch = self.batches[batch_id]
+            state = self._batch_states[batch_id]
+            state[2] += 1
+            output_file_id, num_failed, polls = state
+            if polls >= self.polls_to_complete:
+                total = batch["request_counts"]["total"]
+                batch.update({
+                    "status": "completed",
+                    "completed_at": int(time.time()),
+                    "output_file_id": output_file_id,
+                    "request_counts": {
+                        "total": total,
+                        "completed": total - num_failed,
+                        "failed": num_failed,
+                    },
+                })
+            else:
+                batch["status"] = "in_progress"
+            return dict(batch)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Connections are kept alive between requests, as by the API
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *_):
+                pass
+
+            def _send(
+                self,
+                status: int,
+                body: bytes,
+                content_type: str,
+                headers: dict[str, str] | None = None,
+            ) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(
+                self,
+                status: int,
+                obj: dict,
+                headers: dict[str, str] | None = None,
+            ) -> None:
+                self._send(status, json.dumps(obj).encode("utf-8"), "application/json", headers)
+
+            def _answer(self, respond: Callable[[dict], dict], body: dict, key: str) -> None:
+                status, retry_after_sec = server._admit()
+                if status == 429:
+                    self._send_json(429, {"error": {
+                        "message": "Rate limit reached",
+                        "type": "requests",
+                        "code": "rate_limit_exceeded",
+                    }}, {"retry-after": f"{retry_after_sec:.3f}"})
+                    return
+                if server.latency is not None:
+                    time.sleep(server.latency())
+                if status == 500:
+                    self._send_json(500, {"error": {
+                        "message": "The server had an error processing your request",
+                        "type": "server_error",
+                    }})
+                    return
+                response = respond(body)
+                server._count(key)
+                self._send_json(200, response)
+
+            def _not_found(self) -> None:
+                self._send_json(404, {"error": {
+                    "message": f"Not found: {self.path}",
+                    "type": "invalid_request_error",
+                }})
+
+            def _read_body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_POST(self):
+                if self.path == "/v1/chat/completions":
+                    self._answer(
+                        lambda body: mock_chat_completion(body, server.responder(body)),
+                        json.loads(self._read_body()),
+                        "chat_completions",
+                    )
+                elif self.path == "/v1/embeddings":
+                    self._answer(mock_embeddings, json.loads(self._read_body()), "embeddings")
+                elif self.path == "/v1/files":
+                    header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n"
+                    message = BytesParser(policy=HTTP).parsebytes(
+                        header.encode("utf-8") + self._read_body()
+                    )
+                    fields = {}
+                    for part in message.iter_parts():
+                        name = part.get_param("name", header="content-disposition")
+                        fields[name] = (part.get_filename(), part.get_payload(decode=True))
+                    filename, content = fields["file"]
+                    purpose = fields["purpose"][1].decode("utf-8")
+                    self._send_json(200, server._add_file(content, filename, purpose))
+                elif self.path == "/v1/batches":
+                    batch = server._create_batch(json.loads(self._read_body()))
+                    if batch is None:
+                        self._not_found()
+                    else:
+                        self._send_json(200, batch)
+                else:
+                    self._not_found()
+
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+                if parts[:2] == ["v1", "batches"] and len(parts) == 3:
+                    batch = server._retrieve_batch(parts[2])
+                    if batch is None:
+                        self._not_found()
+                    else:
+                        self._send_json(200, batch)
+                elif parts[:2] == ["v1", "files"] and parts[3:] == ["content"]:
+                    with server._lock:
+                        file = server.files.get(parts[2])
+                    if file is None:
+                        self._not_found()
+                    else:
+                        self._send(200, file[1], "application/octet-stream")
+                else:
+                    self._not_found()
+
+        return Handler
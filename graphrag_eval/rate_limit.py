@@ -0,0 +1,210 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable
+
+
+MAX_RETRIES = 6
+INITIAL_BACKOFF_SEC = 1.0
+MAX_BACKOFF_SEC = 60.0
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+RETRYABLE_ERROR_NAMES = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "RateLimitError",
+    "ServiceUnavailableError",
+    "Timeout",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly 4 characters per token for English text
+    return len(text) // 4 + 1
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Returns True for errors worth retrying: rate limits, timeouts, connection
+    errors and server errors. The error classes of OpenAI and LiteLLM are
+    recognized by name and status code, so that neither is imported here.
+    """
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int) and (
+        status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+    ):
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def get_retry_after(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `capacity_per_minute` per minute,
+    holding at most a minute's worth of tokens.
+
+    `reserve` takes tokens immediately, letting the balance go negative, and
+    returns how long the caller must wait before using them. Callers thus
+    queue up fairly without holding a lock while waiting.
+    """
+
+    def __init__(
+        self,
+        capacity_per_minute: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.capacity = capacity_per_minute
+        self.rate_per_sec = capacity_per_minute / 60
+        self.clock = clock
+        self.tokens = capacity_per_minute
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self.updated) * self.rate_per_sec
+            )
+            self.updated = now
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate_per_sec
+
+
+class LLMScheduler:
+    """
+    Shared scheduler for LLM calls, with optional requests-per-minute and
+    tokens-per-minute budgets, and retries with exponential backoff and full
+    jitter on retryable errors. A `retry-after` header, if present, is
+    respected. Counters are available through `stats()`.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_retries: int = MAX_RETRIES,
+        initial_backoff_sec: float = INITIAL_BACKOFF_SEC,
+        max_backoff_sec: float = MAX_BACKOFF_SEC,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        async_sleep: Callable[[float], Awaitable] = asyncio.sleep,
+        rng: random.Random | None = None,
+    ):
+        self.request_bucket = TokenBucket(requests_per_minute, clock) \
+            if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute, clock) \
+            if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.initial_backoff_sec = initial_backoff_sec
+        self.max_backoff_sec = max_backoff_sec
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+        self.rng = rng or random.Random()
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.throttled_sec = 0.0
+        self.backoff_sec = 0.0
+        self._lock = threading.Lock()
+
+    def _throttle_delay(self, estimated_tokens: int, num_requests: int) -> float:
+        delay = 0.0
+        if self.request_bucket is not None:
+            delay = max(delay, self.request_bucket.reserve(num_requests))
+        if self.token_bucket is not None and estimated_tokens:
+            delay = max(delay, self.token_bucket.reserve(estimated_tokens))
+        with self._lock:
+            self.requests += num_requests
+            self.throttled_sec += delay
+        return delay
+
+    def _backoff_delay(self, attempt: int, error: Exception) -> float | None:
+        # Returns None if the error must not be retried
+        with self._lock:
+            if getattr(error, "status_code", None) == 429:
+                self.rate_limited += 1
+            if not is_retryable(error) or attempt >= self.max_retries:
+                self.failures += 1
+                return None
+            self.retries += 1
+            delay = get_retry_after(error)
+            if delay is None:
+                delay = self.rng.uniform(
+                    0, min(self.max_backoff_sec, self.initial_backoff_sec * 2 ** attempt)
+                )
+            self.backoff_sec += delay
+        return delay
+
+    def call(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        estimated_tokens: int = 0,
+        num_requests: int = 1,
+        **kwargs,
+    ) -> Any:
+        # `fn` may make several API requests (`num_requests`) with
+        # `estimated_tokens` in all, which are reserved for each attempt
+        attempt = 0
+        while True:
+            delay = self._throttle_delay(estimated_tokens, num_requests)
+            if delay > 0:
+                self.sleep(delay)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._backoff_delay(attempt, e)
+                if delay is None:
+                    raise
+                self.sleep(delay)
+                attempt += 1
+
+    async def call_async(
+        self,
+        fn: Callable[..., Awaitable],
+        *args,
+        estimated_tokens: int = 0,
+        num_requests: int = 1,
+        **kwargs,
+    ) -> Any:
+        attempt = 0
+        while True:
+            delay = self._throttle_delay(estimated_tokens, num_requests)
+            if delay > 0:
+                await self.async_sleep(delay)
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._backoff_delay(attempt, e)
+                if delay is None:
+                    raise
+                await self.async_sleep(delay)
+                attempt += 1
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "failures": self.failures,
+                "throttled_sec": self.throttled_sec,
+                "backoff_sec": self.backoff_sec,
+            }
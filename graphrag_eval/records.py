@@ -0,0 +1,200 @@
+from array import array
+from dataclasses import dataclass, field, fields
+from typing import Any, Iterable, Iterator
+
+from .aggregation import METRICS, EvaluationAggregator
+from .steps.outputs import StepOutputStore
+
+
+@dataclass(slots=True)
+class EvaluationRecord:
+    """
+    Typed, slotted version of a per-question evaluation result dict, which
+    takes a fraction of its memory.
+
+    Each optional field is None if the key is not in the result. Keys not
+    known to this class, and known keys with None values, are kept in
+    `extra`, so that `from_dict` and `to_dict` are inverse of each other.
+    """
+
+    template_id: str
+    question_id: str
+    question_text: str
+    reference_answer: str | None = None
+    reference_steps: list[list[dict]] | None = None
+    status: str | None = None
+    error: str | None = None
+    actual_answer: str | None = None
+    answer_relevance: float | None = None
+    answer_relevance_cost: float | None = None
+    answer_relevance_reason: str | None = None
+    answer_relevance_error: str | None = None
+    answer_reference_claims_count: int | None = None
+    answer_actual_claims_count: int | None = None
+    answer_matching_claims_count: int | None = None
+    answer_correctness_reason: str | None = None
+    answer_eval_error: str | None = None
+    answer_recall: float | None = None
+    answer_precision: float | None = None
+    answer_f1: float | None = None
+    actual_steps: list[dict] | None = None
+    steps_score: float | None = None
+    retrieval_recall: float | None = None
+    retrieval_precision: float | None = None
+    retrieval_ndcg: float | None = None
+    retrieval_reciprocal_rank: float | None = None
+    retrieval_average_precision: float | None = None
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+    total_tokens: int | None = None
+    elapsed_sec: float | None = None
+    extra: dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, result: dict) -> "EvaluationRecord":
+        known = {}
+        extra = {}
+        for key, value in result.items():
+            if key in _RECORD_FIELDS and value is not None:
+                known[key] = value
+            else:
+                extra[key] = value
+        return cls(**known, extra=extra)
+
+    def to_dict(self) -> dict:
+        result = {}
+        for name in _RECORD_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                result[name] = value
+        result.update(self.extra)
+        return result
+
+
+# In the order of the keys of a result dict, for fast lookup
+_RECORD_FIELDS = dict.fromkeys(
+    f.name for f in fields(EvaluationRecord) if f.name != "extra"
+)
+
+
+def to_records(results: Iterable[dict]) -> list[EvaluationRecord]:
+    return [EvaluationRecord.from_dict(result) for result in results]
+
+
+def to_dicts(records: Iterable[EvaluationRecord]) -> list[dict]:
+    return [record.to_dict() for record in records]
+
+
+class MetricColumn:
+    """
+    Sparse column of a metric: the indices of the rows that have the metric
+    and their values, in typed arrays. Integer values are stored in an
+    integer array and other values in a float array, so that each value
+    keeps its own type, as in the results.
+    """
+
+    __slots__ = ("rows", "is_int", "ints", "floats")
+
+    def __init__(self):
+        self.rows = array("q")
+        self.is_int = array("b")
+        self.ints = array("q")
+        self.floats = array("d")
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def append(self, row: int, value: int | float) -> None:
+        self.rows.append(row)
+        if isinstance(value, int):
+            self.is_int.append(True)
+            self.ints.append(value)
+        else:
+            self.is_int.append(False)
+            self.floats.append(value)
+
+    def values(self) -> Iterator[int | float]:
+        ints = iter(self.ints)
+        floats = iter(self.floats)
+        return (next(ints) if is_int else next(floats) for is_int in self.is_int)
+
+
+class EvaluationTable:
+    """
+    Struct-of-arrays table of evaluation results, for aggregation.
+
+    Each metric is a sparse `MetricColumn`. Results with an error have no
+    metrics. `EvaluationAggregator.add_table` aggregates the columns
+    directly, with the same summary as for the results themselves.
+    """
+
+    def __init__(self):
+        self.template_ids: list[str] = []
+        self.has_error = array("b")
+        self.actual_steps: list[list[dict] | None] = []
+        self.columns: dict[str, MetricColumn] = {metric: MetricColumn() for metric in METRICS}
+
+    def __len__(self) -> int:
+        return len(self.template_ids)
+
+    def append(self, result: dict | EvaluationRecord) -> None:
+        if isinstance(result, EvaluationRecord):
+            result = _RecordView(result)
+        row = len(self.template_ids)
+        self.template_ids.append(result["template_id"])
+        if "error" in result:
+            self.has_error.append(True)
+            self.actual_steps.append(None)
+            return
+        self.has_error.append(False)
+        self.actual_steps.append(result.get("actual_steps"))
+        for metric, column in self.columns.items():
+            value = result.get(metric)
+            if value is not None:
+                column.append(row, value)
+
+    @classmethod
+    def from_results(
+        cls,
+        results: Iterable[dict | EvaluationRecord],
+    ) -> "EvaluationTable":
+        table = cls()
+        for result in results:
+            table.append(result)
+        return table
+
+
+def compute_table_aggregates(
+    table: EvaluationTable,
+    output_store: StepOutputStore | None = None,
+) -> dict:
+    aggregator = EvaluationAggregator(output_store=output_store)
+    aggregator.add_table(table)
+    return aggregator.summary()
+
+
+class _RecordView:
+    # Read-only mapping over the fields of a record, as in its dict
+    __slots__ = ("record",)
+
+    def __init__(self, record: EvaluationRecord):
+        self.record = record
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in _RECORD_FIELDS:
+            value = getattr(self.record, key)
+            if value is not None:
+                return value
+        return self.record.extra.get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+
+_MISSING = object()
@@ -1,8 +1,17 @@
-import json
 from collections import defaultdict
 
-from .retrieval import recall_at_k
-from .sparql import compare_sparql_results
+from .outputs import StepOutputStore, parse_step_output
+from .retrieval import batch_retrieval_metrics, recall_at_k
+from .sparql import compare_sparql_results, read_sparql_output
+
+
+RETRIEVAL_METRICS = (
+    "retrieval_recall",
+    "retrieval_precision",
+    "retrieval_ndcg",
+    "retrieval_reciprocal_rank",
+    "retrieval_average_precision",
+)
 
 
 def compare_steps_outputs(reference: dict, actual: dict) -> float:
@@ -10,13 +19,13 @@ def compare_steps_outputs(reference: dict, actual: dict) -> float:
     act_output = actual["output"]
     if reference.get("output_media_type") == "application/sparql-results+json":
         return compare_sparql_results(
-            json.loads(ref_output),
-            json.loads(act_output),
+            read_sparql_output(ref_output),
+            read_sparql_output(act_output),
             reference["required_columns"],
             reference.get("ordered", False),
         )
     if reference.get("output_media_type") == "application/json":
-        return float(json.loads(ref_output) == json.loads(act_output))
+        return float(parse_step_output(ref_output) == parse_step_output(act_output))
     if reference["name"] == "retrieval":
         k = reference["args"]["k"]
         return recall_at_k(ref_output, act_output, k)
@@ -93,28 +102,189 @@ def get_steps_matches(
     return match_group_by_output(reference_steps, -1, actual_steps, candidates)
 
 
+def _steps_score(
+    reference_steps_groups: list[list[dict]],
+    matches: list[tuple[int, int, int, float]],
+) -> float:
+    scores_by_group = defaultdict(float)
+    for ref_group_idx, _, _, score in matches:
+        scores_by_group[ref_group_idx] += score
+    group_ix = -1  # For now, consider only the last reference group of steps
+    return scores_by_group[group_ix] / len(reference_steps_groups[group_ix])
+
+
 def evaluate_steps(
     reference_steps_groups: list[list[dict]],
     actual_steps: list[dict]
 ) -> float:
     matches = get_steps_matches(reference_steps_groups, actual_steps)
-    matches_by_group = defaultdict(list)
-    scores_by_group = defaultdict(float)
-    for ref_group_idx, ref_match_idx, actual_idx, score in matches:
-        matches_by_group[ref_group_idx].append(ref_match_idx)
-        scores_by_group[ref_group_idx] += score
+    for ref_group_idx, ref_match_idx, actual_idx, _ in matches:
         reference_steps_groups[ref_group_idx][ref_match_idx]["matches"] \
             = actual_steps[actual_idx]["id"]
-    group_ix = -1  # For now, consider only the last reference group of steps
-    return scores_by_group[group_ix] / len(reference_steps_groups[group_ix])
+    return _steps_score(reference_steps_groups, matches)
+
 
+def score_steps(
+    reference_steps_groups: list[list[dict]],
+    actual_steps: list[dict]
+) -> tuple[float, list[list[dict]]]:
+    """
+    Like `evaluate_steps`, but does not modify the reference steps.
+
+    Returns:
+        tuple[float, list[list[dict]]]: The steps score, and new reference
+        steps groups in which each matched step is replaced by a copy with
+        `matches` set. The other steps are shared with the input.
+    """
+    matches = get_steps_matches(reference_steps_groups, actual_steps)
+    annotated_groups = [list(group) for group in reference_steps_groups]
+    for ref_group_idx, ref_match_idx, actual_idx, _ in matches:
+        annotated_groups[ref_group_idx][ref_match_idx] = {
+            **reference_steps_groups[ref_group_idx][ref_match_idx],
+            "matches": actual_steps[actual_idx]["id"],
+        }
+    return _steps_score(reference_steps_groups, matches), annotated_groups
 
-def get_steps_evaluation_result_dict(reference: dict, target: dict) -> dict:
+
+# The key under which `get_steps_evaluation_result_dict` returns the
+# retrieval pairs of a result, instead of its retrieval metrics, when these
+# are computed later for many results at once by `retrieval_result_dicts`
+RETRIEVAL_PAIRS_KEY = "_retrieval_pairs"
+
+
+def get_retrieval_pairs(
+    reference_steps_groups: list[list[dict]],
+    actual_steps: list[dict],
+) -> tuple[list[tuple[list, list, int]], int] | None:
+    # The relevant documents, retrieved documents and k of each retrieval
+    # step in the last reference group and its matched actual step, and the
+    # number of retrieval steps in the group, or None if there are none.
+    # Must be called after `evaluate_steps`, which sets the actual step
+    # matched to each reference step.
+    actual_by_id = {
+        step.get("id"): step for step in actual_steps
+        if step["name"] == "retrieval" and step.get("status") == "success"
+    }
+    reference_retrievals = [
+        step for step in reference_steps_groups[-1] if step["name"] == "retrieval"
+    ]
+    if not reference_retrievals:
+        return None
+    pairs = [
+        (
+            reference_step["output"],
+            actual_by_id[reference_step["matches"]]["output"],
+            reference_step["args"]["k"],
+        )
+        for reference_step in reference_retrievals
+        if reference_step.get("matches") in actual_by_id
+    ]
+    return pairs, len(reference_retrievals)
+
+
+def retrieval_result_dicts(
+    retrieval_pairs: list[tuple[list[tuple[list, list, int]], int] | None],
+) -> list[dict]:
+    """
+    Computes the retrieval metrics of many results in one pass of
+    `batch_retrieval_metrics`, over the matched retrieval steps of all of
+    them: the ranking metrics of each step, at the step's own k, averaged
+    over the retrieval steps of the last reference group. An unmatched
+    reference step scores 0.
+
+    Args:
+        retrieval_pairs (list): The result of `get_retrieval_pairs` for each
+            result.
+
+    Returns:
+        list[dict]: The retrieval metrics of each result, or an empty dict
+        for a result without reference retrieval steps.
+    """
+    all_pairs = [
+        pair for pairs_and_count in retrieval_pairs if pairs_and_count
+        for pair in pairs_and_count[0]
+    ]
+    if all_pairs:
+        ks = [k for _, _, k in all_pairs]
+        metrics = batch_retrieval_metrics(
+            [relevant for relevant, _, _ in all_pairs],
+            [retrieved for _, retrieved, _ in all_pairs],
+            ks,
+        )
+    result_dicts = []
+    start = 0
+    for pairs_and_count in retrieval_pairs:
+        if pairs_and_count is None:
+            result_dicts.append({})
+            continue
+        pairs, num_reference_retrievals = pairs_and_count
+        indices = range(start, start + len(pairs))
+        start += len(pairs)
+        sums = {
+            "retrieval_recall": sum(metrics[f"recall@{ks[i]}"][i] for i in indices),
+            "retrieval_precision": sum(metrics[f"precision@{ks[i]}"][i] for i in indices),
+            "retrieval_ndcg": sum(metrics[f"ndcg@{ks[i]}"][i] for i in indices),
+            "retrieval_reciprocal_rank": sum(metrics["reciprocal_rank"][i] for i in indices),
+            "retrieval_average_precision": sum(metrics["average_precision"][i] for i in indices),
+        } if pairs else dict.fromkeys(RETRIEVAL_METRICS, 0.0)
+        result_dicts.append({
+            name: value / num_reference_retrievals for name, value in sums.items()
+        })
+    return result_dicts
+
+
+def get_retrieval_evaluation_result_dict(
+    reference_steps_groups: list[list[dict]],
+    actual_steps: list[dict],
+) -> dict:
+    # Retrieval metrics of a single result, as by `retrieval_result_dicts`.
+    # Must be called after `evaluate_steps`.
+    return retrieval_result_dicts(
+        [get_retrieval_pairs(reference_steps_groups, actual_steps)]
+    )[0]
+
+
+def add_retrieval_metrics(
+    retrieval_pairs: tuple[list[tuple[list, list, int]], int] | None,
+    eval_result: dict,
+    score_retrieval: bool,
+) -> None:
+    # Adds the retrieval metrics to the result, or the pairs to score later
+    # under `RETRIEVAL_PAIRS_KEY`
+    if retrieval_pairs is None:
+        return
+    if score_retrieval:
+        eval_result.update(retrieval_result_dicts([retrieval_pairs])[0])
+    else:
+        eval_result[RETRIEVAL_PAIRS_KEY] = retrieval_pairs
+
+
+def get_steps_evaluation_result_dict(
+    reference: dict,
+    target: dict,
+    output_store: StepOutputStore | None = None,
+    score_retrieval: bool = True,
+) -> dict:
+    # With an output store, the actual steps in the result reference their
+    # outputs by ID in the store, and the reference steps are not modified:
+    # the result has its own reference steps, annotated with `matches`.
+    # Without `score_retrieval`, the retrieval pairs are returned under
+    # `RETRIEVAL_PAIRS_KEY`, to be scored with those of other results.
     act_steps = target["steps"]
     eval_result = {}
-    eval_result["actual_steps"] = act_steps
+    if output_store is None:
+        eval_result["actual_steps"] = act_steps
+    else:
+        eval_result["actual_steps"] = output_store.compact_steps(act_steps)
     if "reference_steps" in reference:
         ref_steps = reference["reference_steps"]
-        steps_score = evaluate_steps(ref_steps, act_steps)
+        if output_store is None:
+            steps_score = evaluate_steps(ref_steps, act_steps)
+        else:
+            steps_score, ref_steps = score_steps(ref_steps, act_steps)
+            eval_result["reference_steps"] = ref_steps
         eval_result["steps_score"] = steps_score
+        add_retrieval_metrics(
+            get_retrieval_pairs(ref_steps, act_steps), eval_result, score_retrieval
+        )
     return eval_result
@@ -0,0 +1,140 @@
+import io
+import json
+from typing import Any, Callable, Iterator
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import ijson
+except ImportError:
+    # Without ijson, large outputs are decoded in full
+    ijson = None
+
+
+# In order of preference. orjson decodes integers beyond 64 bits as floats,
+# msgspec keeps them exact, as the standard library does.
+JSON_BACKENDS = ("msgspec", "orjson", "json")
+# Step outputs at least this long are streamed, if possible
+STREAMING_MIN_LENGTH = 16 * 1024 * 1024
+
+
+def _loads_function(backend: str) -> Callable[[str | bytes], Any]:
+    if backend == "orjson" and orjson is not None:
+        return orjson.loads
+    if backend == "msgspec" and msgspec is not None:
+        return msgspec.json.decode
+    if backend == "json":
+        return json.loads
+    raise ValueError(f"JSON backend not available: {backend}")
+
+
+def available_json_backends() -> list[str]:
+    available = []
+    for backend in JSON_BACKENDS:
+        try:
+            _loads_function(backend)
+        except ValueError:
+            continue
+        available.append(backend)
+    return available
+
+
+_backend = available_json_backends()[0]
+_loads = _loads_function(_backend)
+
+
+def get_json_backend() -> str:
+    return _backend
+
+
+def set_json_backend(backend: str | None = None) -> str:
+    """
+    Selects the library that decodes step outputs.
+
+    Args:
+        backend (str | None): "msgspec", "orjson" or "json" (the standard
+            library), or None for the first available one, in this order.
+
+    Returns:
+        str: The selected backend.
+
+    Raises:
+        ValueError: If the backend is not installed or not known.
+    """
+    global _backend, _loads
+    if backend is None:
+        backend = available_json_backends()[0]
+    _loads = _loads_function(backend)
+    _backend = backend
+    return backend
+
+
+def loads(data: str | bytes) -> Any:
+    """
+    Decodes JSON with the selected backend, with the same result as
+    `json.loads`, except that orjson decodes integers beyond 64 bits as
+    floats.
+
+    Documents that a fast backend rejects (such as ones with NaN or lone
+    surrogates, which the standard library accepts) are decoded by the
+    standard library, which also raises the errors.
+
+    Raises:
+        json.decoder.JSONDecodeError: If the data is not valid JSON.
+    """
+    if _loads is not json.loads:
+        try:
+            return _loads(data)
+        except ValueError:
+            pass
+    return json.loads(data)
+
+
+def streaming_available() -> bool:
+    return ijson is not None
+
+
+def iter_sparql_json(data: str | bytes) -> Iterator[tuple[str, Any]]:
+    """
+    Reads a SPARQL JSON result incrementally, without building the object
+    tree of the whole document. Requires ijson.
+
+    Yields:
+        tuple[str, Any]: `("var", name)` for each variable in `head.vars`,
+        `("boolean", value)` for an ASK result, `("bindings", None)` at the
+        start of `results.bindings` and `("binding", binding)` for each
+        binding in it, in the order of the document.
+
+    Raises:
+        ValueError: If the data is not valid JSON.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    builder = None
+    try:
+        for prefix, event, value in ijson.parse(io.BytesIO(data), use_float=True):
+            if prefix == "results.bindings.item":
+                if event == "start_map":
+                    builder = ijson.ObjectBuilder()
+                elif event == "end_map":
+                    yield "binding", builder.value
+                    builder = None
+                    continue
+            if builder is not None:
+                builder.event(event, value)
+            elif prefix == "head.vars.item":
+                yield "var", value
+            elif prefix == "boolean":
+                yield "boolean", value
+            elif prefix == "results.bindings" and event == "start_array":
+                yield "bindings", None
+    except ijson.JSONError as e:
+        raise ValueError(str(e)) from e
@@ -0,0 +1,290 @@
+import hashlib
+import json
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from .json_backend import STREAMING_MIN_LENGTH, iter_sparql_json, loads, streaming_available
+
+
+# Bounds the estimated memory of the parsed outputs, not of their sources,
+# which are several times smaller
+PARSED_OUTPUTS_CACHE_BYTES = 256 * 1024 * 1024
+OUTPUT_FACTS_CACHE_SIZE = 65_536
+# A reference output compared with several candidates in turn stays cached
+# with the current candidate, however large they are
+MIN_PARSED_OUTPUTS = 2
+SIZE_SAMPLE = 64
+
+
+class _InvalidJson:
+    pass
+
+
+_INVALID_JSON = _InvalidJson()
+
+
+def output_digest(output: str) -> bytes:
+    """
+    A short digest identifying an output, so that caches do not keep the
+    output itself.
+    """
+    return hashlib.blake2b(
+        output.encode("utf-8", "surrogatepass"), digest_size=16
+    ).digest()
+
+
+def retained_size(obj: Any) -> int:
+    """
+    Estimates the memory of a decoded output: the sizes of its containers
+    and values, with dict keys, which decoders share, counted once. The
+    items of long lists are estimated from an evenly spaced sample of
+    `SIZE_SAMPLE` of them, so the estimate takes a fraction of the decoding
+    time.
+    """
+    size = 0.0
+    seen_keys = set()
+    # Items with the number of items each stands for
+    stack = [(obj, 1.0)]
+    while stack:
+        item, weight = stack.pop()
+        size += weight * sys.getsizeof(item)
+        if isinstance(item, dict):
+            for key in item:
+                if id(key) not in seen_keys:
+                    seen_keys.add(id(key))
+                    size += sys.getsizeof(key)
+            stack.extend((value, weight) for value in item.values())
+        elif isinstance(item, (list, tuple)):
+            if len(item) > SIZE_SAMPLE:
+                step = len(item) / SIZE_SAMPLE
+                stack.extend(
+                    (item[int(i * step)], weight * step) for i in range(SIZE_SAMPLE)
+                )
+            else:
+                stack.extend((value, weight) for value in item)
+        elif hasattr(item, "__slots__"):
+            stack.extend((getattr(item, name), weight) for name in item.__slots__)
+    return int(size)
+
+
+def _bindings_are_empty(parsed: Any) -> bool:
+    if not isinstance(parsed, dict):
+        return False
+    results = parsed.get("results")
+    return isinstance(results, dict) \
+        and "bindings" in results \
+        and not results["bindings"]
+
+
+class StepOutputCache:
+    """
+    Memoizes the decoding of step outputs, keyed by a digest of the output
+    string, so that steps matching and aggregation decode each payload only
+    once, and the cache does not keep the outputs themselves.
+
+    Parsed outputs are kept in an LRU cache bounded by their estimated
+    memory (see `retained_size`); the `MIN_PARSED_OUTPUTS` most recent ones
+    are always kept. Small facts derived from a parsed output (such as
+    whether it has empty SPARQL bindings) are kept in a separate, larger LRU
+    cache, so they outlive the parsed output. Parsed outputs are shared and
+    must not be modified.
+    """
+
+    def __init__(
+        self,
+        max_parsed_bytes: int = PARSED_OUTPUTS_CACHE_BYTES,
+        max_facts: int = OUTPUT_FACTS_CACHE_SIZE,
+    ):
+        self.max_parsed_bytes = max_parsed_bytes
+        self.max_facts = max_facts
+        self.decodes = 0
+        # Parsed output and its size, by decoder name and output digest
+        self._parsed = OrderedDict()
+        self._parsed_bytes = 0
+        self._empty_bindings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def decode(self, output: str, decoder: str, decode) -> Any:
+        """
+        Returns `decode(output)`, decoded once for each output and decoder
+        name while it stays in the cache.
+        """
+        key = (decoder, output_digest(output))
+        with self._lock:
+            if key in self._parsed:
+                self._parsed.move_to_end(key)
+                return self._parsed[key][0]
+        parsed = decode(output)
+        size = retained_size(parsed)
+        with self._lock:
+            self.decodes += 1
+            if key not in self._parsed:
+                self._parsed[key] = parsed, size
+                self._parsed_bytes += size
+            while self._parsed_bytes > self.max_parsed_bytes \
+                    and len(self._parsed) > MIN_PARSED_OUTPUTS:
+                _, (_, evicted_size) = self._parsed.popitem(last=False)
+                self._parsed_bytes -= evicted_size
+        return parsed
+
+    def _decode(self, output: str) -> Any:
+        parsed = self.decode(output, "json", _loads_or_invalid)
+        self._put_empty_bindings(output_digest(output), _bindings_are_empty(parsed))
+        return parsed
+
+    def _put_empty_bindings(self, digest: bytes, empty: bool) -> None:
+        with self._lock:
+            self._empty_bindings[digest] = empty
+            self._empty_bindings.move_to_end(digest)
+            while len(self._empty_bindings) > self.max_facts:
+                self._empty_bindings.popitem(last=False)
+
+    def parse(self, output: str) -> Any:
+        """
+        Decodes a JSON step output, like `json.loads`.
+
+        Raises:
+            json.decoder.JSONDecodeError: If the output is not valid JSON.
+        """
+        parsed = self._decode(output)
+        if parsed is _INVALID_JSON:
+            # Raise the same error as `json.loads`
+            return json.loads(output)
+        return parsed
+
+    def has_empty_bindings(self, output: Any) -> bool:
+        """
+        Returns True if the output is a SPARQL SELECT result without bindings.
+        """
+        if not isinstance(output, str):
+            return False
+        digest = output_digest(output)
+        with self._lock:
+            if digest in self._empty_bindings:
+                self._empty_bindings.move_to_end(digest)
+                return self._empty_bindings[digest]
+        if len(output) >= STREAMING_MIN_LENGTH and streaming_available():
+            # Large outputs are scanned up to the first binding, and are not
+            # decoded or kept
+            empty = _streamed_bindings_are_empty(output)
+            self._put_empty_bindings(digest, empty)
+            return empty
+        return _bindings_are_empty(self._decode(output))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._parsed.clear()
+            self._parsed_bytes = 0
+            self._empty_bindings.clear()
+
+
+def _loads_or_invalid(output: str) -> Any:
+    try:
+        return loads(output)
+    except json.decoder.JSONDecodeError:
+        return _INVALID_JSON
+
+
+def _streamed_bindings_are_empty(output: str) -> bool:
+    has_bindings = False
+    try:
+        for kind, _ in iter_sparql_json(output):
+            if kind == "binding":
+                return False
+            if kind == "bindings":
+                has_bindings = True
+    except ValueError:
+        return False
+    return has_bindings
+
+
+STEP_OUTPUT_CACHE = StepOutputCache()
+
+
+def parse_step_output(output: str) -> Any:
+    return STEP_OUTPUT_CACHE.parse(output)
+
+
+def has_empty_bindings(output: Any) -> bool:
+    return STEP_OUTPUT_CACHE.has_empty_bindings(output)
+
+
+class StepOutputStore:
+    """
+    Shared store of step outputs, which evaluation results reference by ID
+    instead of embedding them.
+
+    Identical outputs are stored once and get the same ID, so the memory for
+    the outputs of a run is proportional to one copy of the distinct outputs,
+    however many results refer to them.
+    """
+
+    def __init__(self):
+        self._outputs = []
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._outputs)
+
+    def add(self, output: Any) -> int:
+        """
+        Adds an output (usually a string) to the store, if not already there.
+
+        Returns:
+            int: The ID of the output.
+        """
+        try:
+            key = (type(output), output)
+            hash(key)
+        except TypeError:
+            # Unhashable outputs, such as lists of retrieved documents
+            key = (type(output), json.dumps(output, sort_keys=True))
+        with self._lock:
+            if key not in self._ids:
+                self._ids[key] = len(self._outputs)
+                self._outputs.append(output)
+            return self._ids[key]
+
+    def get(self, output_id: int) -> Any:
+        return self._outputs[output_id]
+
+    def compact_steps(self, steps: list[dict]) -> list[dict]:
+        """
+        Returns copies of the steps, with the `output` of each replaced by its
+        `output_id` in the store. The steps are not modified.
+        """
+        compact_steps = []
+        for step in steps:
+            compact_step = {}
+            for key, value in step.items():
+                if key == "output":
+                    compact_step["output_id"] = self.add(value)
+                else:
+                    compact_step[key] = value
+            compact_steps.append(compact_step)
+        return compact_steps
+
+    def resolve_steps(self, steps: list[dict]) -> list[dict]:
+        """
+        Returns copies of the steps with their outputs, the inverse of
+        `compact_steps`.
+        """
+        resolved_steps = []
+        for step in steps:
+            resolved_step = {}
+            for key, value in step.items():
+                if key == "output_id":
+                    resolved_step["output"] = self.get(value)
+                else:
+                    resolved_step[key] = value
+            resolved_steps.append(resolved_step)
+        return resolved_steps
+
+
+def get_step_output(step: dict, output_store: StepOutputStore | None = None) -> Any:
+    if "output_id" in step and output_store is not None:
+        return output_store.get(step["output_id"])
+    return step.get("output")
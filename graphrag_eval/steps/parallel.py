@@ -0,0 +1,188 @@
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from . import add_retrieval_metrics, evaluate_steps, get_retrieval_pairs
+from .outputs import StepOutputStore
+from .sparql import SPARQL_FILTER_COUNTS
+
+
+# Only these keys of the steps are needed for scoring
+REFERENCE_STEP_KEYS = (
+    "name", "output", "output_media_type", "required_columns", "ordered", "matches"
+)
+ACTUAL_STEP_KEYS = ("name", "id", "status", "output")
+
+
+def compact_reference_step(step: dict) -> dict:
+    compact = {key: step[key] for key in REFERENCE_STEP_KEYS if key in step}
+    if step["name"] == "retrieval":
+        compact["args"] = {"k": step["args"]["k"]}
+    return compact
+
+
+def compact_actual_step(step: dict) -> dict:
+    return {key: step[key] for key in ACTUAL_STEP_KEYS if key in step}
+
+
+def compact_steps_payload(
+    reference_steps_groups: list[list[dict]],
+    actual_steps: list[dict],
+) -> tuple[list[list[dict]], list[dict]]:
+    """
+    Returns compact copies of the steps for a worker process, with only the
+    outputs that can be compared: those of the last reference group, which
+    is the one scored, and of the successful actual steps with the name of
+    a step in it. Equal string outputs are made the same object, so that
+    each is pickled once.
+    """
+    distinct_outputs = {}
+
+    def shared(output):
+        if isinstance(output, str):
+            return distinct_outputs.setdefault(output, output)
+        return output
+
+    reference_payload = []
+    for group_idx, group in enumerate(reference_steps_groups):
+        compact_group = [compact_reference_step(step) for step in group]
+        for step in compact_group:
+            if group_idx < len(reference_steps_groups) - 1:
+                step.pop("output", None)
+            elif "output" in step:
+                step["output"] = shared(step["output"])
+        reference_payload.append(compact_group)
+    names = {step["name"] for step in reference_steps_groups[-1]}
+    actual_payload = []
+    for step in actual_steps:
+        compact_step = compact_actual_step(step)
+        if "output" in compact_step:
+            if step.get("status") == "success" and step["name"] in names:
+                compact_step["output"] = shared(compact_step["output"])
+            else:
+                del compact_step["output"]
+        actual_payload.append(compact_step)
+    return reference_payload, actual_payload
+
+
+def evaluate_compact_steps(
+    reference_steps_groups: list[list[dict]],
+    actual_steps: list[dict],
+) -> tuple[dict, list[tuple[int, int, str]], dict[str, int]]:
+    """
+    Scores compact steps in a worker process.
+
+    Returns:
+        tuple[dict, list[tuple[int, int, str]], dict[str, int]]: The steps
+        score, the group index, step index and matched actual step ID of
+        each matched reference step, from which the parent computes the
+        retrieval metrics, and the increments of the worker's
+        `SPARQL_FILTER_COUNTS`, to be merged into the parent's.
+    """
+    counts_before = SPARQL_FILTER_COUNTS.as_dict()
+    eval_result = {"steps_score": evaluate_steps(reference_steps_groups, actual_steps)}
+    matches = [
+        (group_idx, step_idx, step["matches"])
+        for group_idx, group in enumerate(reference_steps_groups)
+        for step_idx, step in enumerate(group)
+        if "matches" in step
+    ]
+    filter_counts = {
+        key: count - counts_before.get(key, 0)
+        for key, count in SPARQL_FILTER_COUNTS.as_dict().items()
+        if count != counts_before.get(key, 0)
+    }
+    return eval_result, matches, filter_counts
+
+
+class StepsProcessPool:
+    """
+    Evaluates steps in a pool of worker processes, for CPU-bound corpora.
+
+    `submit` returns a future of the same result as
+    `get_steps_evaluation_result_dict`, including the `matches` annotations
+    of the reference steps, without waiting for it, so that the workers are
+    kept busy however many threads wait for the results. Only the keys and
+    outputs of the steps needed for scoring are sent to a worker process
+    (see `compact_steps_payload`), and the worker's SPARQL filter counts are
+    merged into `SPARQL_FILTER_COUNTS`. Workers are started with "spawn",
+    which is safe when the parent process has threads. With an output
+    store, the results are as from `get_steps_evaluation_result_dict` with
+    that store. Without `score_retrieval`, the results have the retrieval
+    pairs instead of the retrieval metrics, as from
+    `get_steps_evaluation_result_dict`.
+    """
+
+    def __init__(
+        self,
+        processes: int | None = None,
+        output_store: StepOutputStore | None = None,
+    ):
+        self.output_store = output_store
+        self._executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    def submit(
+        self,
+        reference: dict,
+        target: dict,
+        score_retrieval: bool = True,
+    ) -> Future:
+        if self.output_store is None:
+            eval_result = {"actual_steps": target["steps"]}
+        else:
+            eval_result = {"actual_steps": self.output_store.compact_steps(target["steps"])}
+        future = Future()
+        if "reference_steps" not in reference:
+            future.set_result(eval_result)
+            return future
+        reference_steps_groups = reference["reference_steps"]
+        worker_future = self._executor.submit(
+            evaluate_compact_steps,
+            *compact_steps_payload(reference_steps_groups, target["steps"]),
+        )
+
+        def finish(worker_future: Future) -> None:
+            try:
+                steps_result, matches, filter_counts = worker_future.result()
+            except BaseException as e:
+                future.set_exception(e)
+                return
+            SPARQL_FILTER_COUNTS.add(filter_counts)
+            groups = reference_steps_groups
+            if self.output_store is not None:
+                groups = [list(group) for group in reference_steps_groups]
+                for group_idx, step_idx, actual_id in matches:
+                    groups[group_idx][step_idx] = {
+                        **groups[group_idx][step_idx],
+                        "matches": actual_id,
+                    }
+                eval_result["reference_steps"] = groups
+            else:
+                for group_idx, step_idx, actual_id in matches:
+                    groups[group_idx][step_idx]["matches"] = actual_id
+            eval_result.update(steps_result)
+            try:
+                add_retrieval_metrics(
+                    get_retrieval_pairs(groups, target["steps"]), eval_result, score_retrieval
+                )
+            except BaseException as e:
+                future.set_exception(e)
+                return
+            future.set_result(eval_result)
+
+        worker_future.add_done_callback(finish)
+        return future
+
+    def get_steps_evaluation_result_dict(self, reference: dict, target: dict) -> dict:
+        return self.submit(reference, target).result()
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -1,4 +1,16 @@
-from typing import Iterable
+import math
+from typing import Iterable, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is optional; the batched metrics are computed query by query
+    np = None
+
+
+RETRIEVAL_KS = (1, 3, 5, 10)
+# Fewer queries are faster to score one by one than to set up NumPy arrays for
+NUMPY_MIN_QUERIES = 32
 
 
 def recall_at_k(relevant_docs: Iterable, retrieved_docs: list, k: int = 10) -> float:
@@ -53,3 +65,122 @@ def average_precision(relevant_docs: Iterable, retrieved_docs: Iterable) -> floa
         return 0.0
 
     return sum_of_precisions / total_relevant
+
+
+def retrieval_hits(relevant_docs: Iterable, retrieved_docs: Iterable) -> list[bool]:
+    """
+    Marks the retrieved documents that are relevant. A relevant document
+    retrieved more than once is counted only at its first rank.
+    """
+    relevant_set = set(relevant_docs)
+    hits = []
+    for doc_id in retrieved_docs:
+        hits.append(doc_id in relevant_set)
+        relevant_set.discard(doc_id)
+    return hits
+
+
+def _ranking_metrics(hits: list[bool], num_relevant: int, ks: list[int]) -> dict[str, float]:
+    metrics = {}
+    cumulative_hits = 0
+    dcg = 0.0
+    ideal_dcg = 0.0
+    sum_of_precisions = 0.0
+    reciprocal_rank = 0.0
+    ks_left = sorted(ks)
+    for rank in range(1, max(len(hits), ks_left[-1]) + 1):
+        hit = rank <= len(hits) and hits[rank - 1]
+        discount = 1 / math.log2(rank + 1)
+        if hit:
+            cumulative_hits += 1
+            dcg += discount
+            sum_of_precisions += cumulative_hits / rank
+            if not reciprocal_rank:
+                reciprocal_rank = 1 / rank
+        if rank <= num_relevant:
+            ideal_dcg += discount
+        while ks_left and ks_left[0] == rank:
+            k = ks_left.pop(0)
+            metrics[f"recall@{k}"] = cumulative_hits / num_relevant if num_relevant else 0.0
+            metrics[f"precision@{k}"] = cumulative_hits / k
+            metrics[f"ndcg@{k}"] = dcg / ideal_dcg if num_relevant else 0.0
+    metrics["reciprocal_rank"] = reciprocal_rank
+    metrics["average_precision"] = sum_of_precisions / num_relevant if num_relevant else 0.0
+    return metrics
+
+
+def batch_retrieval_metrics(
+    relevant_docs: Sequence[Iterable],
+    retrieved_docs: Sequence[Iterable],
+    ks: Iterable[int] = RETRIEVAL_KS,
+) -> dict[str, list[float]]:
+    """
+    Calculates ranking metrics for many queries and cutoffs at once, with
+    binary relevance: Recall@k, Precision@k and nDCG@k for each k, the
+    Reciprocal Rank (whose mean is MRR) and the Average Precision (whose mean
+    is MAP). The metrics are computed over a single matrix of hits if NumPy
+    is installed and there are at least `NUMPY_MIN_QUERIES` queries, and
+    query by query otherwise.
+
+    Args:
+        relevant_docs (Sequence[Iterable]): The ground truth relevant
+            document IDs of each query.
+        retrieved_docs (Sequence[Iterable]): The retrieved document IDs of
+            each query, ordered by rank.
+        ks (Iterable[int]): The cutoffs, at least 1.
+
+    Returns:
+        dict[str, list[float]]: The values of each metric (e.g., "recall@5",
+        "reciprocal_rank"), one per query, in the order of the queries.
+    """
+    ks = sorted(set(ks))
+    if not ks or ks[0] < 1:
+        raise ValueError("Cutoffs must be positive integers.")
+    relevant_sets = [set(docs) for docs in relevant_docs]
+    hits_per_query = [
+        retrieval_hits(relevant, retrieved)
+        for relevant, retrieved in zip(relevant_sets, retrieved_docs)
+    ]
+    num_relevant = [len(relevant) for relevant in relevant_sets]
+    if np is None or len(hits_per_query) < NUMPY_MIN_QUERIES:
+        per_query = [
+            _ranking_metrics(hits, count, ks)
+            for hits, count in zip(hits_per_query, num_relevant)
+        ]
+        metric_names = [
+            f"{metric}@{k}" for k in ks for metric in ("recall", "precision", "ndcg")
+        ] + ["reciprocal_rank", "average_precision"]
+        return {
+            name: [metrics[name] for metrics in per_query]
+            for name in metric_names
+        }
+
+    max_rank = max([ks[-1]] + [len(hits) for hits in hits_per_query])
+    hits = np.zeros((len(hits_per_query), max_rank), dtype=bool)
+    for query_idx, query_hits in enumerate(hits_per_query):
+        hits[query_idx, :len(query_hits)] = query_hits
+    num_relevant = np.array(num_relevant, dtype=float)
+    has_relevant = num_relevant > 0
+    safe_num_relevant = np.where(has_relevant, num_relevant, 1)
+    ranks = np.arange(1, max_rank + 1)
+    cumulative_hits = np.cumsum(hits, axis=1)
+    discounts = 1 / np.log2(ranks + 1)
+    dcg = np.cumsum(hits * discounts, axis=1)
+    ideal_dcg = np.cumsum(discounts)
+
+    metrics = {}
+    for k in ks:
+        metrics[f"recall@{k}"] = np.where(
+            has_relevant, cumulative_hits[:, k - 1] / safe_num_relevant, 0.0
+        )
+        metrics[f"precision@{k}"] = cumulative_hits[:, k - 1] / k
+        ideal_at_k = ideal_dcg[np.minimum(safe_num_relevant, k).astype(int) - 1]
+        metrics[f"ndcg@{k}"] = np.where(has_relevant, dcg[:, k - 1] / ideal_at_k, 0.0)
+    first_hit_ranks = hits.argmax(axis=1) + 1
+    metrics["reciprocal_rank"] = np.where(hits.any(axis=1), 1 / first_hit_ranks, 0.0)
+    metrics["average_precision"] = np.where(
+        has_relevant,
+        (hits * cumulative_hits / ranks).sum(axis=1) / safe_num_relevant,
+        0.0,
+    )
+    return {name: values.tolist() for name, values in metrics.items()}
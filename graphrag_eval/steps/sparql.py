@@ -1,7 +1,32 @@
+from array import array
 from collections import Counter
-from typing import Union
-import itertools
+from datetime import date, datetime, timezone
+from decimal import ROUND_DOWN, Context, Decimal
+from typing import Any, Callable, Union
 import math
+import threading
+
+from .json_backend import STREAMING_MIN_LENGTH, iter_sparql_json, streaming_available
+from .outputs import STEP_OUTPUT_CACHE, parse_step_output
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is optional; columns are stored as Python arrays without it
+    np = None
+
+
+XSD = "http://www.w3.org/2001/XMLSchema#"
+XSD_NUMERIC_TYPES = {
+    XSD + name
+    for name in (
+        "integer", "int", "long", "short", "byte",
+        "nonNegativeInteger", "positiveInteger", "nonPositiveInteger", "negativeInteger",
+        "unsignedLong", "unsignedInt", "unsignedShort", "unsignedByte",
+        "decimal", "double", "float",
+    )
+}
+NUMBER_DECIMALS = 5
 
 
 def truncate(number, decimals=0):
@@ -38,60 +63,526 @@ def parse_dict2table(
     reference_vars: Union[list[str], tuple[str, ...]],
     reference_var_to_values: dict[str, list],
 ) -> list[str]:
-    result = []
-    num_rows = len(reference_var_to_values[reference_vars[0]])
-    for row_idx in range(num_rows):
-        row = []
-        for reference_var in reference_vars:
-            val = reference_var_to_values[reference_var][row_idx]
-            if isinstance(val, float):
-                val = truncate(val, 5)
-            if isinstance(val, int):
-                print(val)
-                val = float(val)
-                print(str(val))
-            val = str(val)
-            row.append(val)
-        result.append("".join(row))
-    return result
+    columns = [
+        [str(normalize_value(val)) for val in reference_var_to_values[var]]
+        for var in reference_vars
+    ]
+    return ["".join(row) for row in zip(*columns)]
 
 
-def compare_values(
+def canonical_number(number: Decimal) -> str:
+    """
+    Formats a number truncated to `NUMBER_DECIMALS` decimal places, without
+    exponent or trailing zeros, so that equal numbers are formatted equally
+    (e.g., "1", "1.0", "1.000001" and "1E0" are all "1").
+    """
+    if not number.is_finite():
+        return str(number)
+    context = Context(prec=max(28, number.adjusted() + NUMBER_DECIMALS + 2))
+    number = number.quantize(
+        Decimal(1).scaleb(-NUMBER_DECIMALS), rounding=ROUND_DOWN, context=context
+    )
+    if not number:
+        return "0"
+    return format(number.normalize(context), "f")
+
+
+def normalize_typed_value(value: str, datatype: str | None) -> str:
+    """
+    Canonicalizes the lexical form of an RDF literal by its datatype:
+    numbers as by `canonical_number`, booleans as "true" or "false", and
+    date-times with a time zone in UTC. Values of other datatypes, and values
+    that are not valid for their datatype, are kept as they are.
+    """
+    try:
+        if datatype in XSD_NUMERIC_TYPES:
+            return canonical_number(Decimal(value.strip()))
+        if datatype == XSD + "boolean":
+            return {"1": "true", "0": "false"}.get(value.strip(), value.strip())
+        if datatype == XSD + "dateTime":
+            parsed = datetime.fromisoformat(value.strip())
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone(timezone.utc)
+            return parsed.isoformat()
+        if datatype == XSD + "date":
+            return date.fromisoformat(value.strip()).isoformat()
+    except (ValueError, ArithmeticError):
+        pass
+    return value
+
+
+def normalize_value(val):
+    """
+    Normalizes a binding value to the form used for comparing cells.
+    Unbound values (None) are kept as None, and numbers are formatted by
+    `canonical_number`.
+    """
+    if val is None:
+        return None
+    if isinstance(val, float):
+        return canonical_number(Decimal(repr(val)))
+    if isinstance(val, int):
+        return canonical_number(Decimal(val))
+    return str(val)
+
+
+UNBOUND_CODE = 0
+
+
+class ValueCodes:
+    """
+    Interns normalized cell values as integer codes, so that columns are
+    compared as integer arrays rather than value by value. The reference and
+    actual tables must be encoded with the same instance, so that equal values
+    get equal codes. Unbound values have the code `UNBOUND_CODE`.
+
+    Raw values are plain values, normalized by `normalize_value`, or
+    `(value, datatype)` tuples of typed literals, normalized by
+    `normalize_typed_value`.
+    """
+
+    def __init__(self):
+        self._codes = {None: UNBOUND_CODE}
+        # Raw values are mapped to codes directly, so each distinct raw
+        # value is normalized only once
+        self._raw_codes = {None: UNBOUND_CODE}
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def code(self, value) -> int:
+        code = self._raw_codes.get(value)
+        if code is None:
+            if isinstance(value, tuple):
+                normalized = normalize_typed_value(*value)
+            else:
+                normalized = normalize_value(value)
+            code = self._codes.setdefault(normalized, len(self._codes))
+            self._raw_codes[value] = code
+        return code
+
+    def encode_values(self, values: list):
+        # Known values are looked up in bulk; only new ones are normalized
+        codes = list(map(self._raw_codes.get, values))
+        if None in codes:
+            for i, code in enumerate(codes):
+                if code is None:
+                    codes[i] = self.code(values[i])
+        return _to_column(codes)
+
+    def encode_bindings(self, vars_: list[str], bindings: list[dict]) -> list:
+        return [
+            self.encode_values([
+                None if term is None else _raw_value(term)
+                for term in (binding.get(var) for binding in bindings)
+            ])
+            for var in vars_
+        ]
+
+    def encode_result(self, vars_: list[str], result: "dict | SparqlColumns") -> list:
+        if isinstance(result, SparqlColumns):
+            return [self.encode_values(result.column(var)) for var in vars_]
+        return self.encode_bindings(vars_, result["results"]["bindings"])
+
+
+def _raw_value(term: dict):
+    # The raw value of a term for `ValueCodes`
+    if "datatype" in term:
+        return term["value"], term["datatype"]
+    return term["value"]
+
+
+class SparqlColumns:
+    """
+    A SPARQL SELECT result, stored column by column as the raw values of
+    `ValueCodes`, rather than as a dict per binding and term.
+    """
+
+    __slots__ = ("vars", "columns", "num_rows")
+
+    def __init__(self, vars_: list[str], columns: dict[str, list], num_rows: int):
+        self.vars = vars_
+        self.columns = columns
+        self.num_rows = num_rows
+
+    def column(self, var: str) -> list:
+        if var in self.columns:
+            return self.columns[var]
+        return [None] * self.num_rows
+
+
+def _read_sparql_columns(output: str) -> dict | SparqlColumns | None:
+    # Returns None for outputs which are not SPARQL SELECT or ASK results
+    vars_ = []
+    columns = {}
+    num_rows = 0
+    has_bindings = False
+    for kind, value in iter_sparql_json(output):
+        if kind == "var":
+            vars_.append(value)
+        elif kind == "boolean":
+            return None
+        elif kind == "bindings":
+            has_bindings = True
+        elif kind == "binding":
+            for var, term in value.items():
+                if var not in columns:
+                    columns[var] = [None] * num_rows
+                columns[var].append(_raw_value(term))
+            num_rows += 1
+            if len(value) < len(columns):
+                for column in columns.values():
+                    if len(column) < num_rows:
+                        column.append(None)
+    if not has_bindings:
+        return None
+    return SparqlColumns(vars_, columns, num_rows)
+
+
+def _stream_sparql_columns(output: str) -> SparqlColumns | None:
+    try:
+        return _read_sparql_columns(output)
+    except ValueError:
+        # Invalid JSON, for which `parse_step_output` raises the error
+        return None
+
+
+def read_sparql_output(output: str) -> dict | SparqlColumns | Any:
+    """
+    Decodes a step output of media type `application/sparql-results+json`.
+
+    A SELECT result at least `STREAMING_MIN_LENGTH` long is read
+    incrementally into `SparqlColumns` if ijson is installed, so that the
+    bindings are never all in memory as dicts. Other outputs are decoded as
+    by `parse_step_output`. Either way, the result is memoized in
+    `STEP_OUTPUT_CACHE`, so an output is decoded once per run.
+    """
+    if len(output) >= STREAMING_MIN_LENGTH \
+            and streaming_available() \
+            and output[:64].lstrip().startswith("{"):
+        columns = STEP_OUTPUT_CACHE.decode(output, "sparql_columns", _stream_sparql_columns)
+        if columns is not None:
+            return columns
+    return parse_step_output(output)
+
+
+def _to_column(codes: list[int]):
+    if np is not None:
+        return np.array(codes, dtype=np.int64)
+    return array("q", codes)
+
+
+def _sort_column(column):
+    if np is not None:
+        return np.sort(column)
+    return array("q", sorted(column))
+
+
+def _pair_column(column_1, column_2, radix: int):
+    # Encodes each pair of codes in two columns as a single code
+    if np is not None:
+        return column_1 * radix + column_2
+    return array("q", [code_1 * radix + code_2 for code_1, code_2 in zip(column_1, column_2)])
+
+
+def _sorted_rows(columns: list):
+    if np is not None:
+        table = np.stack(columns)
+        return table[:, np.lexsort(table[::-1])].tobytes()
+    return sorted(zip(*columns))
+
+
+_HASH_MASK = 2 ** 64 - 1
+_HASH_MULTIPLIER_1 = 0x9E3779B97F4A7C15
+_HASH_MULTIPLIER_2 = 0xBF58476D1CE4E5B9
+
+
+def null_count(column) -> int:
+    if np is not None:
+        return int(np.count_nonzero(column == UNBOUND_CODE))
+    return column.count(UNBOUND_CODE)
+
+
+def distinct_count(column) -> int:
+    if np is not None:
+        return int(np.count_nonzero(np.bincount(column)))
+    return len(set(column))
+
+
+def multiset_hash(column) -> int:
+    """
+    An order-independent hash of the values of an encoded column: the sum,
+    modulo 2**64, of a mixing function of each code.
+    """
+    if np is not None:
+        with np.errstate(over="ignore"):
+            mixed = column.astype(np.uint64) * np.uint64(_HASH_MULTIPLIER_1)
+            mixed ^= mixed >> np.uint64(31)
+            mixed *= np.uint64(_HASH_MULTIPLIER_2)
+            return int(mixed.sum(dtype=np.uint64))
+    total = 0
+    for code in column:
+        mixed = (code * _HASH_MULTIPLIER_1) & _HASH_MASK
+        mixed ^= mixed >> 31
+        total += (mixed * _HASH_MULTIPLIER_2) & _HASH_MASK
+    return total & _HASH_MASK
+
+
+class FilterCounts:
+    """
+    Thread-safe counts of SPARQL result comparisons, and of how often each
+    filter rejected the actual result.
+
+    Keys:
+        compared: Comparisons of non-empty results.
+        row_count: Different numbers of rows.
+        null_count: A reference column without an actual column with the
+            same number of unbound values.
+        distinct_count: Likewise, with the same number of distinct values.
+        multiset_hash: Likewise, with the same hash of the value multiset.
+        column_values: Likewise, with the same values (in the same order,
+            for ordered results).
+        column_assignment: No assignment of distinct actual columns to the
+            reference columns, under which the rows match.
+        matched: Matching results.
+    """
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def increment(self, key: str) -> None:
+        with self._lock:
+            self._counts[key] += 1
+
+    def add(self, counts: dict[str, int]) -> None:
+        # Merges counts made elsewhere, e.g. in a worker process
+        with self._lock:
+            self._counts.update(counts)
+
+    def as_dict(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+
+SPARQL_FILTER_COUNTS = FilterCounts()
+
+
+def column_fingerprint(column, results_are_ordered: bool) -> bytes:
+    """
+    A hashable signature of an encoded column, equal for two columns if and
+    only if the columns can be matched to each other: for ordered results,
+    the values row by row; for unordered results, the multiset of values.
+    """
+    if results_are_ordered:
+        return column.tobytes()
+    return _sort_column(column).tobytes()
+
+
+def _find_matching(
+    candidates: list[list[int]],
+    assignment: dict[int, int],
+) -> dict[int, int] | None:
+    # Kuhn's augmenting paths; `assignment` maps actual column -> reference
+    # column and is extended in place
+    def augment(ref_idx: int, visited: set[int]) -> bool:
+        for act_idx in candidates[ref_idx]:
+            if act_idx in visited:
+                continue
+            visited.add(act_idx)
+            if act_idx not in assignment or augment(assignment[act_idx], visited):
+                assignment[act_idx] = ref_idx
+                return True
+        return False
+
+    for ref_idx in range(len(candidates)):
+        if not augment(ref_idx, set()):
+            return None
+    return {ref_idx: act_idx for act_idx, ref_idx in assignment.items()}
+
+
+def _search_row_preserving_assignment(
+    reference_columns: list,
+    actual_columns: list,
+    candidates: list[list[int]],
+    radix: int,
+) -> dict[int, int] | None:
+    # Unordered results: matching columns' value multisets is necessary, but
+    # the rows must also match as a multiset. Assign the most constrained
+    # reference columns first and prune with the joint multiset of every
+    # pair of assigned columns. Identical actual columns are interchangeable,
+    # so only one of them is tried per reference column.
+    order = sorted(range(len(reference_columns)), key=lambda i: len(candidates[i]))
+    reference_rows = _sorted_rows(reference_columns)
+    actual_keys = [column.tobytes() for column in actual_columns]
+    pair_fingerprints = {}
+
+    def joint(columns: list, i: int, j: int, side: str) -> bytes:
+        key = (side, i, j)
+        if key not in pair_fingerprints:
+            pair_fingerprints[key] = column_fingerprint(
+                _pair_column(columns[i], columns[j], radix), False
+            )
+        return pair_fingerprints[key]
+
+    assignment = {}
+
+    def extend(depth: int) -> bool:
+        if depth == len(order):
+            actual_rows = _sorted_rows([
+                actual_columns[assignment[i]] for i in range(len(reference_columns))
+            ])
+            return actual_rows == reference_rows
+        ref_idx = order[depth]
+        used = set(assignment.values())
+        tried = set()
+        for act_idx in candidates[ref_idx]:
+            if act_idx in used or actual_keys[act_idx] in tried:
+                continue
+            tried.add(actual_keys[act_idx])
+            if all(
+                joint(reference_columns, prev_ref, ref_idx, "ref")
+                == joint(actual_columns, assignment[prev_ref], act_idx, "act")
+                for prev_ref in order[:depth]
+            ):
+                assignment[ref_idx] = act_idx
+                if extend(depth + 1):
+                    return True
+                del assignment[ref_idx]
+        return False
+
+    return dict(assignment) if extend(0) else None
+
+
+def match_encoded_columns(
+    reference_columns: list,
+    actual_columns: list,
+    results_are_ordered: bool,
+    num_codes: int,
+) -> dict[int, int] | None:
+    """
+    Finds an assignment of distinct actual columns to the reference columns,
+    under which the actual table equals the reference table.
+
+    Args:
+        reference_columns (list): The reference columns, encoded by
+            `ValueCodes`.
+        actual_columns (list): The actual columns, encoded by the same
+            `ValueCodes`.
+        results_are_ordered (bool): Whether the order of rows matters.
+        num_codes (int): The number of distinct codes in the columns.
+
+    Returns:
+        dict[int, int] | None: Mapping from each reference column index to
+        the actual column index matched to it, or None if there is no such
+        mapping.
+    """
+    if len(reference_columns) > len(actual_columns):
+        return None
+    SPARQL_FILTER_COUNTS.increment("compared")
+    num_rows = {len(column) for column in reference_columns + actual_columns}
+    if len(num_rows) > 1:
+        SPARQL_FILTER_COUNTS.increment("row_count")
+        return None
+    if not reference_columns:
+        SPARQL_FILTER_COUNTS.increment("matched")
+        return {}
+
+    # Cheap invariants first: most non-matching results are rejected in
+    # linear time, before any sorting or search
+    filters: list[tuple[str, Callable]] = [
+        ("null_count", null_count),
+        ("distinct_count", distinct_count),
+        ("multiset_hash", multiset_hash),
+        ("column_values", lambda column: column_fingerprint(column, results_are_ordered)),
+    ]
+    candidates = [list(range(len(actual_columns))) for _ in reference_columns]
+    for name, invariant in filters:
+        actual_values = {}
+        for ref_idx, column in enumerate(reference_columns):
+            value = invariant(column)
+            matching = []
+            for act_idx in candidates[ref_idx]:
+                if act_idx not in actual_values:
+                    actual_values[act_idx] = invariant(actual_columns[act_idx])
+                if actual_values[act_idx] == value:
+                    matching.append(act_idx)
+            if not matching:
+                SPARQL_FILTER_COUNTS.increment(name)
+                return None
+            candidates[ref_idx] = matching
+
+    # For ordered results, columns are compared independently, so any
+    # complete bipartite matching of compatible columns is a solution
+    assignment = _find_matching(candidates, {})
+    if assignment is not None and not results_are_ordered:
+        assignment = _search_row_preserving_assignment(
+            reference_columns, actual_columns, candidates, num_codes
+        )
+    SPARQL_FILTER_COUNTS.increment(
+        "column_assignment" if assignment is None else "matched"
+    )
+    return assignment
+
+
+def match_columns(
     reference_vars: list[str],
     reference_var_to_values: dict[str, list],
     actual_vars: Union[list[str], tuple[str, ...]],
     actual_var_to_values: dict[str, list],
     results_are_ordered: bool,
-) -> bool:
+) -> dict[str, str] | None:
+    """
+    Finds an assignment of distinct actual variables to the reference
+    variables, under which the actual table equals the reference table.
 
+    Returns:
+        dict[str, str] | None: Mapping from each reference variable to the
+        actual variable matched to it, or None if there is no such mapping.
+    """
     if len(reference_vars) > len(actual_vars):
-        return False
-    if len(reference_vars) < len(actual_vars):
-        for combination in itertools.combinations(actual_vars, len(reference_vars)):
-            if compare_values(
-                reference_vars,
-                reference_var_to_values,
-                combination,
-                actual_var_to_values,
-                results_are_ordered,
-            ):
-                return True
-        return False
+        return None
+    codes = ValueCodes()
+    reference_columns = [
+        codes.encode_values(reference_var_to_values[var]) for var in reference_vars
+    ]
+    actual_columns = [
+        codes.encode_values(actual_var_to_values[var]) for var in actual_vars
+    ]
+    assignment = match_encoded_columns(
+        reference_columns, actual_columns, results_are_ordered, len(codes)
+    )
+    if assignment is None:
+        return None
+    return {
+        reference_vars[ref_idx]: actual_vars[act_idx]
+        for ref_idx, act_idx in assignment.items()
+    }
 
-    table = parse_dict2table(reference_vars, reference_var_to_values)
-    for permutation in itertools.permutations(actual_vars):
-        actual_table = parse_dict2table(permutation, actual_var_to_values)
-        if (results_are_ordered and table == actual_table) or (
-            not results_are_ordered and Counter(table) == Counter(actual_table)
-        ):
-            return True
 
-    return False
+def compare_values(
+    reference_vars: list[str],
+    reference_var_to_values: dict[str, list],
+    actual_vars: Union[list[str], tuple[str, ...]],
+    actual_var_to_values: dict[str, list],
+    results_are_ordered: bool,
+) -> bool:
+    return match_columns(
+        reference_vars,
+        reference_var_to_values,
+        actual_vars,
+        actual_var_to_values,
+        results_are_ordered,
+    ) is not None
 
 
 def compare_sparql_results(
-    reference_sparql_result: dict,
-    actual_sparql_result: dict,
+    reference_sparql_result: dict | SparqlColumns,
+    actual_sparql_result: dict | SparqlColumns,
     required_vars: list[str],
     results_are_ordered: bool = False,
 ) -> float:
@@ -100,40 +591,50 @@ def compare_sparql_results(
         return 0.0
 
     # ASK
-    if "boolean" in reference_sparql_result:
+    if not isinstance(reference_sparql_result, SparqlColumns) \
+            and "boolean" in reference_sparql_result:
         return float(
-            "boolean" in actual_sparql_result
+            not isinstance(actual_sparql_result, SparqlColumns)
+            and "boolean" in actual_sparql_result
             and reference_sparql_result["boolean"] == actual_sparql_result["boolean"]
         )
 
-    reference_bindings: list[dict] = reference_sparql_result["results"]["bindings"]
-    actual_bindings: list[dict] = actual_sparql_result.get("results", dict()).get(
-        "bindings", []
-    )
-    actual_vars: list[str] = actual_sparql_result["head"].get("vars", [])
+    if isinstance(reference_sparql_result, SparqlColumns):
+        num_reference_rows = reference_sparql_result.num_rows
+    else:
+        num_reference_rows = len(reference_sparql_result["results"]["bindings"])
+    if isinstance(actual_sparql_result, SparqlColumns):
+        num_actual_rows = actual_sparql_result.num_rows
+        actual_vars = actual_sparql_result.vars
+    else:
+        num_actual_rows = len(
+            actual_sparql_result.get("results", dict()).get("bindings", [])
+        )
+        actual_vars = actual_sparql_result["head"].get("vars", [])
 
-    if (not actual_bindings) and (not reference_bindings):
+    if (not num_actual_rows) and (not num_reference_rows):
         return float(len(actual_vars) >= len(required_vars))
-    elif (not actual_bindings) or (not reference_bindings):
+    elif (not num_actual_rows) or (not num_reference_rows):
         return 0.0
     if len(required_vars) > len(actual_vars):
         return 0.0
     if len(required_vars) == 0:
         return 1.0
+    if num_reference_rows != num_actual_rows:
+        SPARQL_FILTER_COUNTS.increment("compared")
+        SPARQL_FILTER_COUNTS.increment("row_count")
+        return 0.0
 
-    reference_var_to_values: dict[str, list] = get_var_to_values(
-        required_vars, reference_bindings
-    )
-    actual_var_to_values: dict[str, list] = get_var_to_values(
-        actual_vars, actual_bindings
-    )
+    # Both tables are encoded column by column with shared value codes
+    codes = ValueCodes()
+    reference_columns = codes.encode_result(required_vars, reference_sparql_result)
+    actual_columns = codes.encode_result(actual_vars, actual_sparql_result)
 
     return float(
-        compare_values(
-            required_vars,
-            reference_var_to_values,
-            actual_vars,
-            actual_var_to_values,
+        match_encoded_columns(
+            reference_columns,
+            actual_columns,
             results_are_ordered,
-        )
+            len(codes),
+        ) is not None
     )
@@ -0,0 +1,185 @@
+import json
+import re
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from .evaluation import iter_evaluation
+from .llm_cache import LLMCache
+from .rate_limit import LLMScheduler
+from .steps.outputs import StepOutputStore
+
+
+def read_jsonl(path: str | Path) -> Iterator[dict]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_jsonl(path: str | Path, records: Iterable[dict]) -> int:
+    """
+    Writes records to a JSONL file as they are produced.
+
+    Args:
+        path (str | Path): The output file path.
+        records (Iterable[dict]): The records to write, one per line.
+
+    Returns:
+        int: The number of records written.
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    return count
+
+
+# A JSON string value after a field name, e.g. `: "q1"`
+_STRING_VALUE = re.compile(rb'\s*:\s*("(?:[^"\\]|\\.)*")')
+
+
+def _read_key(line: bytes, key: str, key_pattern: bytes):
+    # The value of the field `key` of a JSON object line. If the field name
+    # occurs once and its value is a string, only the value is decoded.
+    # The field name may also occur in a nested object, which `__getitem__`
+    # of `JsonlIndex` checks when the record is decoded.
+    start = line.find(key_pattern)
+    if start != -1 and line.find(key_pattern, start + 1) == -1:
+        match = _STRING_VALUE.match(line, start + len(key_pattern))
+        if match:
+            return json.loads(match.group(1))
+    return json.loads(line)[key]
+
+
+class JsonlIndex(Mapping):
+    """
+    Read-only mapping over the records of a JSONL file, keyed by a field.
+
+    Only the byte offset of each record is kept in memory. The file is
+    indexed without decoding the records whose key can be found in their
+    text, and a record is read from the file and decoded on each lookup.
+    """
+
+    def __init__(self, path: str | Path, key: str = "question_id"):
+        self.path = Path(path)
+        self.key = key
+        self._offsets = {}
+        self._lock = threading.Lock()
+        self._file = open(self.path, "rb")
+        key_pattern = json.dumps(key).encode("utf-8")
+        offset = 0
+        for line in self._file:
+            if line.strip():
+                self._offsets[_read_key(line, key, key_pattern)] = offset
+            offset += len(line)
+
+    def __getitem__(self, key) -> dict:
+        offset = self._offsets[key]
+        with self._lock:
+            self._file.seek(offset)
+            line = self._file.readline()
+        record = json.loads(line)
+        if record.get(self.key) != key:
+            # The key was found in a nested object only
+            raise KeyError(key)
+        return record
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def iter_evaluation_jsonl(
+    reference_path: str | Path,
+    responses_path: str | Path,
+    max_workers: int = 1,
+    cache: LLMCache | None = None,
+    checkpoint_path: str | Path | None = None,
+    scheduler: LLMScheduler | None = None,
+    steps_processes: int = 0,
+    output_store: StepOutputStore | None = None,
+    deduplicate: bool = True,
+) -> Iterator[dict]:
+    """
+    Evaluates the responses in a JSONL file against the reference templates
+    in another JSONL file, yielding the evaluation results one at a time.
+
+    Args:
+        reference_path (str | Path): JSONL file with one reference template
+            per line.
+        responses_path (str | Path): JSONL file with one response per line,
+            identified by `question_id`.
+        max_workers (int): The number of questions evaluated concurrently.
+        cache (LLMCache | None): Optional cache of LLM judgments.
+        checkpoint_path (str | Path | None): Optional checkpoint file, for
+            resuming an interrupted evaluation.
+        scheduler (LLMScheduler | None): Optional rate limiter and retrier,
+            shared by all LLM calls.
+        steps_processes (int): If positive, the number of worker processes
+            scoring the steps, for CPU-bound corpora.
+        output_store (StepOutputStore | None): Optional store of the outputs
+            of the actual steps, which the results reference by ID instead
+            of embedding them. The reference steps are then not modified.
+        deduplicate (bool): Whether identical judge inputs in the run are
+            judged once. The judgments that share a result report no cost.
+
+    Returns:
+        Iterator[dict]: The evaluation results, in the order of the
+        reference questions.
+    """
+    with JsonlIndex(responses_path) as responses:
+        yield from iter_evaluation(
+            read_jsonl(reference_path),
+            responses,
+            max_workers,
+            cache,
+            checkpoint_path,
+            scheduler,
+            steps_processes,
+            output_store,
+            deduplicate,
+        )
+
+
+def run_evaluation_jsonl(
+    reference_path: str | Path,
+    responses_path: str | Path,
+    out_path: str | Path,
+    max_workers: int = 1,
+    cache: LLMCache | None = None,
+    checkpoint_path: str | Path | None = None,
+    scheduler: LLMScheduler | None = None,
+    steps_processes: int = 0,
+    output_store: StepOutputStore | None = None,
+    deduplicate: bool = True,
+) -> int:
+    return write_jsonl(
+        out_path,
+        iter_evaluation_jsonl(
+            reference_path,
+            responses_path,
+            max_workers,
+            cache,
+            checkpoint_path,
+            scheduler,
+            steps_processes,
+            output_store,
+            deduplicate,
+        ),
+    )
@@ -1,7 +1,9 @@
+import asyncio
 import builtins
 import io
+from collections import namedtuple
 
-from graphrag_eval import answer_correctness
+from graphrag_eval import LLMCache, LLMScheduler, answer_correctness
 from graphrag_eval.answer_correctness import extract_response_values
 
 
@@ -90,3 +92,247 @@ def test_evaluate_answers(monkeypatch, tmp_path):
     written = out_file_path.read_text().splitlines()
     assert written[0].split("\t") == answer_correctness.OUT_FIELDS
     assert written[1].split("\t") == ["2", "2", "2", "reason", ""]
+
+
+def test_get_correctness_dicts_async(monkeypatch, tmp_path):
+    prompt_file_path = tmp_path / "prompt.md"
+    prompt_file_path.write_text("{question}|{reference_answer}|{candidate_answer}")
+    monkeypatch.setattr(answer_correctness, "OpenAI", lambda: None)
+
+    in_flight = 0
+    max_in_flight = 0
+
+    async def mock_call_llm_async(_, prompt):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        question = prompt.split("|")[0]
+        if question == "Q2":
+            return "Error code: 429"
+        return "2\t4\t1\treason"
+
+    eval_class = answer_correctness.AnswerCorrectnessEvaluator
+    monkeypatch.setattr(eval_class, "call_llm_async", mock_call_llm_async)
+    evaluator = eval_class(prompt_file_path)
+
+    references_and_targets = [
+        (
+            {"question_text": f"Q{i}", "reference_answer": f"Ref{i}"},
+            {"actual_answer": f"Ans{i}"},
+        )
+        for i in range(10)
+    ]
+    results = evaluator.get_correctness_dicts(references_and_targets, max_concurrency=3)
+    assert max_in_flight == 3
+    assert len(results) == 10
+    assert results[2] == {
+        "reference_answer": "Ref2",
+        "answer_eval_error": "Expected 4 tab-separated values: Error code: 429",
+    }
+    assert results[0] == {
+        "reference_answer": "Ref0",
+        "answer_reference_claims_count": 2,
+        "answer_actual_claims_count": 4,
+        "answer_matching_claims_count": 1,
+        "answer_correctness_reason": "reason",
+        "answer_recall": 0.5,
+        "answer_precision": 0.25,
+        "answer_f1": 1 / 3,
+    }
+    assert results[9]["reference_answer"] == "Ref9"
+
+
+def test_call_llm_uses_cache(monkeypatch, tmp_path):
+    prompt_file_path = tmp_path / "prompt.md"
+    prompt_file_path.write_text("{question}|{reference_answer}|{candidate_answer}")
+
+    calls = []
+
+    class MockCompletions:
+        def create(self, model, messages, temperature):
+            calls.append(messages[0]["content"])
+            message = namedtuple("Message", ["content"])("2\t2\t2\treason\n")
+            choice = namedtuple("Choice", ["message"])(message)
+            return namedtuple("Response", ["choices"])([choice])
+
+    class MockOpenAI:
+        chat = namedtuple("Chat", ["completions"])(MockCompletions())
+
+    monkeypatch.setattr(answer_correctness, "OpenAI", MockOpenAI)
+    cache = LLMCache(tmp_path / "cache.sqlite")
+    evaluator = answer_correctness.AnswerCorrectnessEvaluator(prompt_file_path, cache=cache)
+    assert evaluator.evaluate_answer("Q", "Ref", "Ans") == (2, 2, 2, "reason", "")
+    assert evaluator.evaluate_answer("Q", "Ref", "Ans") == (2, 2, 2, "reason", "")
+    assert evaluator.evaluate_answer("Q", "Ref", "Other") == (2, 2, 2, "reason", "")
+    assert calls == ["Q|Ref|Ans", "Q|Ref|Other"]
+    assert cache.hits == 1
+    assert cache.misses == 2
+
+
+def test_call_llm_retries_rate_limited_requests(monkeypatch, tmp_path):
+    import httpx
+    import openai
+
+    prompt_file_path = tmp_path / "prompt.md"
+    prompt_file_path.write_text("{question}|{reference_answer}|{candidate_answer}")
+
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    rate_limit_error = openai.RateLimitError(
+        "Rate limit reached",
+        response=httpx.Response(429, request=request),
+        body=None,
+    )
+    errors = [rate_limit_error, rate_limit_error]
+
+    class MockCompletions:
+        def create(self, model, messages, temperature):
+            if errors:
+                raise errors.pop()
+            message = namedtuple("Message", ["content"])("2\t2\t2\treason\n")
+            choice = namedtuple("Choice", ["message"])(message)
+            return namedtuple("Response", ["choices"])([choice])
+
+    class MockOpenAI:
+        chat = namedtuple("Chat", ["completions"])(MockCompletions())
+
+    monkeypatch.setattr(answer_correctness, "OpenAI", MockOpenAI)
+    scheduler = LLMScheduler(max_retries=2, sleep=lambda _: None)
+    evaluator = answer_correctness.AnswerCorrectnessEvaluator(
+        prompt_file_path, scheduler=scheduler
+    )
+    assert evaluator.evaluate_answer("Q", "Ref", "Ans") == (2, 2, 2, "reason", "")
+    assert scheduler.stats()["requests"] == 3
+    assert scheduler.stats()["rate_limited"] == 2
+
+    # Once the retries are exhausted, the error is reported as before
+    errors.extend([rate_limit_error] * 3)
+    n_ref, n_target, n_matching, _, error = evaluator.evaluate_answer("Q", "Ref", "Ans")
+    assert (n_ref, n_target, n_matching) == (None, None, None)
+    assert "Rate limit reached" in error
+    assert scheduler.stats()["failures"] == 1
+
+
+def test_evaluate_answers_with_workers_and_resume(monkeypatch, tmp_path):
+    prompt_file_path = tmp_path / "prompt.md"
+    prompt_file_path.write_text("{question}|{reference_answer}|{candidate_answer}")
+    in_file_path = tmp_path / "in.tsv"
+    in_file_path.write_text(
+        "Question\tReference answer\tActual answer\n"
+        + "".join(f"Q{i}\tRef{i}\tAns{i}\n" for i in range(25)),
+        encoding="utf-8",
+    )
+    out_file_path = tmp_path / "out.tsv"
+
+    evaluated = []
+
+    def mock_call_llm(_, prompt):
+        question = prompt.split("|")[0]
+        evaluated.append(question)
+        return f"2\t2\t2\treason {question}"
+
+    monkeypatch.setattr(answer_correctness, "PROMPT_FILE_PATH", prompt_file_path)
+    monkeypatch.setattr(answer_correctness, "OpenAI", lambda: None)
+    eval_class = answer_correctness.AnswerCorrectnessEvaluator
+    monkeypatch.setattr(eval_class, "call_llm", mock_call_llm)
+
+    answer_correctness.evaluate_and_write(
+        in_file_path, out_file_path, workers=4, write_batch_size=7
+    )
+    expected = out_file_path.read_text(encoding="utf-8")
+    assert expected.splitlines()[1:] == [
+        f"2\t2\t2\treason Q{i}\t" for i in range(25)
+    ]
+
+    # Simulate an interrupted run: 10 complete rows and a partial one
+    lines = expected.splitlines(keepends=True)
+    out_file_path.write_text("".join(lines[:11]) + "2\t2\t", encoding="utf-8")
+    assert answer_correctness.count_written_rows(out_file_path) == 10
+
+    evaluated.clear()
+    answer_correctness.evaluate_and_write(
+        in_file_path, out_file_path, workers=3, resume=True
+    )
+    assert sorted(evaluated) == sorted(f"Q{i}" for i in range(10, 25))
+    assert out_file_path.read_text(encoding="utf-8") == expected
+
+
+def test_count_written_rows_keeps_complete_multiline_rows(tmp_path):
+    out_file_path = tmp_path / "out.tsv"
+    complete = 'a\tb\n1\t"two\nlines"\n3\t"é"\n'
+    # The partial row ends in a quoted field, within a two-byte character
+    partial = '4\t"unterminated\nfield é'.encode("utf-8")[:-1]
+    out_file_path.write_bytes(complete.encode("utf-8") + partial)
+    assert answer_correctness.count_written_rows(out_file_path) == 2
+    assert out_file_path.read_bytes() == complete.encode("utf-8")
+    assert answer_correctness.count_written_rows(out_file_path) == 2
+
+
+def test_get_correctness_dicts_batch(monkeypatch, tmp_path):
+    from graphrag_eval.mock_server import MockOpenAIServer
+
+    prompt_file_path = tmp_path / "prompt.md"
+    prompt_file_path.write_text("{question}|{reference_answer}|{candidate_answer}")
+
+    def responder(body: dict) -> str:
+        question, _, answer = body["messages"][0]["content"].split("|")
+        if question == "Q3":
+            raise ValueError("Server error")
+        return f"2\t2\t{len(answer)}\treason {question}"
+
+    with MockOpenAIServer(responder, polls_to_complete=2) as server:
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+        cache = LLMCache(tmp_path / "cache.sqlite")
+        evaluator = answer_correctness.AnswerCorrectnessEvaluator(
+            prompt_file_path, cache=cache
+        )
+        references_and_targets = [
+            ({"question_text": "Q1", "reference_answer": "Ref"}, {"actual_answer": "A"}),
+            ({"question_text": "Q2", "reference_answer": "Ref"}, {"actual_answer": "AA"}),
+            ({"question_text": "Q3", "reference_answer": "Ref"}, {"actual_answer": "A"}),
+        ]
+        batch_file_path = tmp_path / "batch.jsonl"
+        results = evaluator.get_correctness_dicts_batch(
+            references_and_targets,
+            batch_file_path=batch_file_path,
+            poll_interval_sec=0.01,
+        )
+        assert results[0]["answer_matching_claims_count"] == 1
+        assert results[0]["answer_correctness_reason"] == "reason Q1"
+        assert results[1]["answer_matching_claims_count"] == 2
+        assert results[1]["answer_recall"] == 1.0
+        assert "Server error" in results[2]["answer_eval_error"]
+        assert len(batch_file_path.read_text().splitlines()) == 3
+        assert len(server.batches) == 1
+
+        # Cached results are not submitted again
+        results_again = evaluator.get_correctness_dicts_batch(
+            references_and_targets[:2],
+            batch_file_path=batch_file_path,
+            poll_interval_sec=0.01,
+        )
+        assert results_again == results[:2]
+        assert len(server.batches) == 1
+    cache.close()
+
+
+def test_get_correctness_dicts_twice_does_not_repeat_requests(tmp_path):
+    from graphrag_eval.load_test import openai_environment
+    from graphrag_eval.mock_server import MockOpenAIServer
+
+    prompt_file_path = tmp_path / "prompt.md"
+    prompt_file_path.write_text("{question}|{reference_answer}|{candidate_answer}")
+    with MockOpenAIServer(lambda _: "2\t2\t1\treason") as server, \
+            openai_environment(server.base_url):
+        evaluator = answer_correctness.AnswerCorrectnessEvaluator(prompt_file_path)
+        # Each call runs in a new event loop, which must not reuse the
+        # connections of the previous one
+        for run in range(2):
+            results = evaluator.get_correctness_dicts([
+                ({"question_text": f"Q{run}{i}", "reference_answer": "Ref"}, {"actual_answer": "A"})
+                for i in range(4)
+            ])
+            assert all("answer_eval_error" not in result for result in results)
+        assert server.stats()["chat_completions"] == 8
@@ -1,12 +1,12 @@
 from collections import namedtuple
 
-from graphrag_eval import answer_relevance
+from graphrag_eval import LLMCache, answer_relevance
 from langevals_ragas.lib.common import RagasResult, Money
 
 
 def test_get_relevance_dict_eval_success(monkeypatch):
     monkeypatch.setattr(
-        answer_relevance.RagasResponseRelevancyEvaluator,
+        answer_relevance.SharedClientsRelevancyEvaluator,
         'evaluate',
         lambda *_: RagasResult(
             status="processed",
@@ -31,7 +31,7 @@ def test_get_relevance_dict_eval_success(monkeypatch):
 
 def test_get_relevance_dict_eval_error(monkeypatch):
     monkeypatch.setattr(
-        answer_relevance.RagasResponseRelevancyEvaluator,
+        answer_relevance.SharedClientsRelevancyEvaluator,
         'evaluate',
         lambda *_: namedtuple('RagasResult', ['status', 'details'])(
             status="error",
@@ -45,3 +45,135 @@ def test_get_relevance_dict_eval_error(monkeypatch):
     assert eval_result_dict == {
         "answer_relevance_error": "details"
     }
+
+
+def test_get_relevance_dict_uses_cache(monkeypatch, tmp_path):
+    calls = []
+
+    def mock_evaluate(_, entry):
+        calls.append(entry.output)
+        return RagasResult(
+            status="processed",
+            score=0.9,
+            details="reason",
+            cost=Money(currency="USD", amount=0.0007),
+        )
+
+    monkeypatch.setattr(
+        answer_relevance.SharedClientsRelevancyEvaluator,
+        'evaluate',
+        mock_evaluate
+    )
+    cache = LLMCache(tmp_path / "cache.sqlite")
+    for _ in range(2):
+        eval_result_dict = answer_relevance.get_relevance_dict(
+            "Why is the sky blue?",
+            "Because of the oxygen in the air",
+            cache=cache,
+        )
+        assert eval_result_dict == {
+            "answer_relevance": 0.9,
+            "answer_relevance_cost": 0.0007,
+            "answer_relevance_reason": "reason",
+        }
+    assert calls == ["Because of the oxygen in the air"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_get_relevance_dicts(monkeypatch):
+    def mock_evaluate(_, entry):
+        if entry.output == "error":
+            return namedtuple('RagasResult', ['status', 'details'])(
+                status="error",
+                details="details",
+            )
+        return RagasResult(
+            status="processed",
+            score=len(entry.output) / 10,
+            details="reason",
+            cost=Money(currency="USD", amount=0.0007),
+        )
+
+    monkeypatch.setattr(
+        answer_relevance.SharedClientsRelevancyEvaluator,
+        'evaluate',
+        mock_evaluate
+    )
+    evaluator = answer_relevance.AnswerRelevanceEvaluator()
+    eval_result_dicts = evaluator.get_relevance_dicts(
+        [("Q1", "a"), ("Q2", "error"), ("Q3", "abc")],
+        max_workers=2,
+    )
+    assert eval_result_dicts == [
+        {
+            "answer_relevance": 0.1,
+            "answer_relevance_cost": 0.0007,
+            "answer_relevance_reason": "reason",
+        },
+        {
+            "answer_relevance_error": "details"
+        },
+        {
+            "answer_relevance": 0.3,
+            "answer_relevance_cost": 0.0007,
+            "answer_relevance_reason": "reason",
+        },
+    ]
+
+
+def test_get_relevance_dicts_prepares_clients_once(monkeypatch):
+    from graphrag_eval.load_test import openai_environment
+    from graphrag_eval.mock_server import MockOpenAIServer
+
+    prepared = []
+
+    def counting_prepare_llm(*args, **kwargs):
+        prepared.append(args)
+        return prepare_llm(*args, **kwargs)
+
+    prepare_llm = answer_relevance.prepare_llm
+    monkeypatch.setattr(answer_relevance, "prepare_llm", counting_prepare_llm)
+    with MockOpenAIServer() as server, openai_environment(server.base_url):
+        evaluator = answer_relevance.AnswerRelevanceEvaluator()
+        eval_result_dicts = evaluator.get_relevance_dicts(
+            [("Q1", "a"), ("Q2", "b"), ("Q3", "c")],
+            max_workers=2,
+        )
+        eval_result_dicts.append(evaluator.get_relevance_dict("Q4", "d"))
+        assert server.stats()["chat_completions"] == 4 * 3
+    assert all("answer_relevance" in eval_result_dict for eval_result_dict in eval_result_dicts)
+    assert len(prepared) == 1
+
+
+def test_langevals_module_is_left_untouched():
+    from langevals_ragas import response_relevancy
+    from langevals_ragas.lib import common
+
+    assert response_relevancy.prepare_llm is common.prepare_llm
+
+
+def test_get_relevance_dict_deduplicates_successes_only(monkeypatch):
+    outcomes = [
+        namedtuple('RagasResult', ['status', 'details'])(status="error", details="details"),
+        RagasResult(
+            status="processed",
+            score=0.9,
+            details="reason",
+            cost=Money(currency="USD", amount=0.0007),
+        ),
+    ]
+    monkeypatch.setattr(
+        answer_relevance.SharedClientsRelevancyEvaluator,
+        'evaluate',
+        lambda *_: outcomes.pop(0)
+    )
+    evaluator = answer_relevance.AnswerRelevanceEvaluator(deduplicate=True)
+    assert evaluator.get_relevance_dict("Q", "A") == {"answer_relevance_error": "details"}
+    costs = []
+    for _ in range(2):
+        relevance_dict = evaluator.get_relevance_dict("Q", "A")
+        assert relevance_dict["answer_relevance"] == 0.9
+        costs.append(relevance_dict["answer_relevance_cost"])
+    assert evaluator.single_flight.calls == 2
+    # Only the judgment that made the call reports its cost
+    assert costs == [0.0007, 0.0]
@@ -1,6 +1,7 @@
 from pathlib import Path
 
 import jsonlines
+import pytest
 import yaml
 from langevals_ragas.lib.common import RagasResult, Money
 
@@ -8,6 +9,7 @@ from graphrag_eval import (
     answer_correctness,
     answer_relevance,
     compute_aggregates,
+    evaluate_question,
     run_evaluation,
 )
 
@@ -28,7 +30,7 @@ def test_run_evaluation_and_compute_aggregates(monkeypatch):
     # Define mock call_llm()
     mock_call_llm = lambda *_: "2\t2\t2\treason"
     monkeypatch.setattr(
-        answer_relevance.RagasResponseRelevancyEvaluator,
+        answer_relevance.SharedClientsRelevancyEvaluator,
         'evaluate',
         lambda *_: RagasResult(
             status="processed",
@@ -56,6 +58,58 @@ def test_run_evaluation_and_compute_aggregates(monkeypatch):
     assert expected_aggregates == aggregates
 
 
+def test_run_evaluation_with_max_workers(monkeypatch):
+    def get_chat_responses(path: Path) -> dict:
+        responses = dict()
+        with jsonlines.open(path, "r") as reader:
+            for obj in reader:
+                responses[obj["question_id"]] = obj
+        return responses
+
+    sample_reference_standard = yaml.safe_load(
+        (Path(__file__).parent / "test_data" / "reference_standard_corpus_1.yaml").read_text(encoding="utf-8")
+    )
+    sample_chat_responses_path = Path(__file__).parent / "test_data" / "chat_responses_1.jsonl"
+
+    # Define mocks
+    mock_call_llm = lambda *_: "2\t2\t2\treason"
+    monkeypatch.setattr(
+        answer_relevance.SharedClientsRelevancyEvaluator,
+        'evaluate',
+        lambda *_: RagasResult(
+            status="processed",
+            score=0.9,
+            details="reason",
+            cost=Money(currency="USD", amount=0.0007)
+        )
+    )
+    monkeypatch.setattr(answer_correctness, "OpenAI", lambda: None)
+    eval_class = answer_correctness.AnswerCorrectnessEvaluator
+    monkeypatch.setattr(eval_class, "call_llm", mock_call_llm)
+
+    # Count relevance evaluator instances
+    instances = []
+
+    class CountingRelevancyEvaluator(answer_relevance.SharedClientsRelevancyEvaluator):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            instances.append(self)
+
+    monkeypatch.setattr(answer_relevance, "SharedClientsRelevancyEvaluator", CountingRelevancyEvaluator)
+
+    # Run
+    evaluation_results = run_evaluation(
+        sample_reference_standard,
+        get_chat_responses(sample_chat_responses_path),
+        max_workers=8,
+    )
+    assert len(instances) == 1
+    expected_evaluation_results = yaml.safe_load(
+        (Path(__file__).parent / "test_data" / "evaluation_1.yaml").read_text(encoding="utf-8")
+    )
+    assert expected_evaluation_results == evaluation_results
+
+
 def test_run_evaluation_and_compute_aggregates_no_actual_steps(monkeypatch):
     def get_chat_responses(path: Path) -> dict:
         responses = dict()
@@ -72,7 +126,7 @@ def test_run_evaluation_and_compute_aggregates_no_actual_steps(monkeypatch):
     # Define mock call_llm()
     mock_call_llm = lambda *_: "2\t2\t2\treason"
     monkeypatch.setattr(
-        answer_relevance.RagasResponseRelevancyEvaluator,
+        answer_relevance.SharedClientsRelevancyEvaluator,
         'evaluate',
         lambda *_: RagasResult(
             status="processed",
@@ -123,3 +177,92 @@ def test_run_evaluation_and_compute_aggregates_all_errors():
         (Path(__file__).parent / "test_data" / "evaluation_summary_2.yaml").read_text(encoding="utf-8")
     )
     assert expected_aggregates == aggregates
+
+
+def test_run_evaluation_judges_identical_inputs_once(monkeypatch):
+    relevance_calls = []
+    correctness_calls = []
+
+    def mock_evaluate(_, entry):
+        relevance_calls.append((entry.input, entry.output))
+        return RagasResult(
+            status="processed",
+            score=0.9,
+            details="reason",
+            cost=Money(currency="USD", amount=0.0007)
+        )
+
+    def mock_call_llm(_, prompt):
+        correctness_calls.append(prompt)
+        return "2\t2\t2\treason"
+
+    monkeypatch.setattr(answer_relevance.SharedClientsRelevancyEvaluator, 'evaluate', mock_evaluate)
+    monkeypatch.setattr(answer_correctness, "OpenAI", lambda: None)
+    monkeypatch.setattr(answer_correctness.AnswerCorrectnessEvaluator, "call_llm", mock_call_llm)
+
+    # Repeated trials of the same question, with the same canned answer
+    reference_standard = [{
+        "template_id": "t1",
+        "questions": [
+            {"id": f"q{i}", "question_text": "Who?", "reference_answer": "Alice"}
+            for i in range(20)
+        ],
+    }]
+    responses = {
+        f"q{i}": {
+            "question_id": f"q{i}",
+            "actual_answer": "Alice" if i % 2 else "I don't know",
+            "input_tokens": 1,
+            "output_tokens": 1,
+            "total_tokens": 2,
+            "elapsed_sec": 0.1,
+        }
+        for i in range(20)
+    }
+    evaluation_results = run_evaluation(reference_standard, responses, max_workers=8)
+
+    assert sorted(relevance_calls) == [("Who?", "Alice"), ("Who?", "I don't know")]
+    assert len(correctness_calls) == 2
+    assert all(result["answer_relevance"] == 0.9 for result in evaluation_results)
+    assert all(result["answer_recall"] == 1.0 for result in evaluation_results)
+    # The shared judgments made no call, and cost nothing
+    assert sum(result["answer_relevance_cost"] for result in evaluation_results) \
+        == pytest.approx(2 * 0.0007)
+
+    relevance_calls.clear()
+    correctness_calls.clear()
+    evaluation_results = run_evaluation(
+        reference_standard, responses, max_workers=8, deduplicate=False
+    )
+    assert len(relevance_calls) == len(correctness_calls) == 20
+    assert sum(result["answer_relevance_cost"] for result in evaluation_results) \
+        == pytest.approx(20 * 0.0007)
+
+
+def test_evaluate_question_builds_default_evaluators(monkeypatch):
+    monkeypatch.setattr(
+        answer_relevance.SharedClientsRelevancyEvaluator,
+        'evaluate',
+        lambda *_: RagasResult(
+            status="processed",
+            score=0.9,
+            details="reason",
+            cost=Money(currency="USD", amount=0.0007)
+        )
+    )
+    monkeypatch.setattr(answer_correctness, "OpenAI", lambda: None)
+    monkeypatch.setattr(
+        answer_correctness.AnswerCorrectnessEvaluator, "call_llm", lambda *_: "2\t2\t2\treason"
+    )
+    question = {"id": "q1", "question_text": "Who?", "reference_answer": "Alice"}
+    actual_result = {
+        "question_id": "q1",
+        "actual_answer": "Alice",
+        "input_tokens": 1,
+        "output_tokens": 1,
+        "total_tokens": 2,
+        "elapsed_sec": 0.1,
+    }
+    eval_result = evaluate_question("t1", question, actual_result)
+    assert eval_result["answer_relevance"] == 0.9
+    assert eval_result["answer_recall"] == 1.0
@@ -0,0 +1,40 @@
+from graphrag_eval.load_test import run_load_test, synthetic_corpus
+from graphrag_eval.rate_limit import LLMScheduler
+
+
+def test_synthetic_corpus():
+    qa_dataset, responses_dict = synthetic_corpus(25, num_templates=10)
+    questions = [question for template in qa_dataset for question in template["questions"]]
+    assert len(qa_dataset) == 10
+    assert len(questions) == len(responses_dict) == 25
+    assert len({question["question_text"] for question in questions}) == 25
+    assert synthetic_corpus(25, num_templates=10) == (qa_dataset, responses_dict)
+
+
+def test_run_load_test_retries_rate_limited_requests():
+    scheduler = LLMScheduler(initial_backoff_sec=0.01, max_backoff_sec=0.05)
+    report = run_load_test(
+        num_questions=6,
+        max_workers=3,
+        rate_limit_rate=0.5,
+        retry_after_sec=0.01,
+        scheduler=scheduler,
+    )
+    assert report["questions"] == 6
+    assert report["questions_per_sec"] > 0
+    # Every rate-limited request is eventually answered
+    assert report["evaluation_errors"] == 0
+    assert report["server"]["rate_limited"] > 0
+    assert report["server"]["chat_completions"] >= 6 * 4
+    assert report["server"]["embeddings"] >= 6 * 2
+    assert report["scheduler"]["failures"] == 0
+    assert report["scheduler"]["retries"] == report["scheduler"]["rate_limited"]
+
+
+def test_scheduler_accounts_for_every_request():
+    scheduler = LLMScheduler()
+    report = run_load_test(num_questions=5, max_workers=3, scheduler=scheduler)
+    assert report["evaluation_errors"] == 0
+    server = report["server"]
+    assert server["requests"] == server["chat_completions"] + server["embeddings"] == 5 * 6
+    assert report["scheduler"]["requests"] == server["requests"]
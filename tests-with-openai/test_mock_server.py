@@ -0,0 +1,78 @@
+import math
+
+import openai
+import pytest
+from openai import OpenAI
+
+from graphrag_eval.mock_server import (
+    MOCK_RESPONSE_CONTENT,
+    MockOpenAIServer,
+    constant_latency,
+    lognormal_latency,
+    uniform_latency,
+)
+
+
+def client(server: MockOpenAIServer) -> OpenAI:
+    return OpenAI(base_url=server.base_url, api_key="sk-test", max_retries=0)
+
+
+def test_chat_completions():
+    with MockOpenAIServer() as server:
+        response = client(server).chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": "Count the claims"}],
+            n=3,
+        )
+        assert [choice.message.content for choice in response.choices] == [MOCK_RESPONSE_CONTENT] * 3
+        assert response.usage.prompt_tokens > 0
+        assert server.stats() == {
+            "requests": 1, "chat_completions": 1, "embeddings": 0, "rate_limited": 0, "errors": 0
+        }
+
+
+def test_embeddings():
+    with MockOpenAIServer() as server:
+        embeddings = client(server).embeddings
+        floats = embeddings.create(
+            model="text-embedding-ada-002", input=["a", "b", "a"], encoding_format="float"
+        )
+        # The OpenAI client requests base64 by default, and decodes it
+        decoded = embeddings.create(model="text-embedding-ada-002", input="a")
+        vectors = [item.embedding for item in floats.data]
+        assert len(vectors[0]) == 1536
+        assert math.isclose(sum(x * x for x in vectors[0]), 1.0)
+        assert vectors[0] == vectors[2] != vectors[1]
+        assert decoded.data[0].embedding == pytest.approx(vectors[0], abs=1e-6)
+        assert len(embeddings.create(model="m", input="a", dimensions=8).data[0].embedding) == 8
+        assert server.stats()["embeddings"] == 3
+
+
+def test_rate_limit_and_errors():
+    with MockOpenAIServer(rate_limit_rate=1.0, retry_after_sec=2.5) as server:
+        with pytest.raises(openai.RateLimitError) as e:
+            client(server).embeddings.create(model="m", input="a")
+        assert e.value.response.headers["retry-after"] == "2.500"
+    with MockOpenAIServer(error_rate=1.0) as server:
+        with pytest.raises(openai.InternalServerError):
+            client(server).embeddings.create(model="m", input="a")
+        assert server.stats()["errors"] == 1
+    with MockOpenAIServer(requests_per_minute=2) as server:
+        for _ in range(2):
+            client(server).embeddings.create(model="m", input="a")
+        with pytest.raises(openai.RateLimitError) as e:
+            client(server).embeddings.create(model="m", input="a")
+        assert 0 < float(e.value.response.headers["retry-after"]) <= 60
+        assert server.stats() == {
+            "requests": 3, "chat_completions": 0, "embeddings": 2, "rate_limited": 1, "errors": 0
+        }
+
+
+def test_latency_distributions():
+    assert constant_latency(0.5)() == 0.5
+    assert all(0.1 <= uniform_latency(0.1, 0.2, seed=0)() <= 0.2 for _ in range(10))
+    latency = lognormal_latency(1.0, seed=0)
+    samples = sorted(latency() for _ in range(1001))
+    assert 0.8 < samples[500] < 1.25
+    with MockOpenAIServer(latency=constant_latency(0.05)) as server:
+        client(server).embeddings.create(model="m", input="a")
@@ -0,0 +1,184 @@
+import json
+import random
+
+import pytest
+
+from graphrag_eval.steps import compare_steps_outputs, json_backend, outputs, sparql
+from graphrag_eval.steps.json_backend import (
+    available_json_backends,
+    get_json_backend,
+    iter_sparql_json,
+    loads,
+    set_json_backend,
+)
+from graphrag_eval.steps.outputs import STEP_OUTPUT_CACHE, StepOutputCache
+from graphrag_eval.steps.sparql import SparqlColumns, read_sparql_output
+
+
+@pytest.fixture(params=json_backend.JSON_BACKENDS)
+def backend(request):
+    if request.param not in available_json_backends():
+        pytest.skip(f"{request.param} is not installed")
+    previous_backend = get_json_backend()
+    set_json_backend(request.param)
+    yield request.param
+    set_json_backend(previous_backend)
+
+
+@pytest.fixture
+def streaming(monkeypatch):
+    # Streams all step outputs, however short
+    pytest.importorskip("ijson")
+    monkeypatch.setattr(outputs, "STREAMING_MIN_LENGTH", 0)
+    monkeypatch.setattr(sparql, "STREAMING_MIN_LENGTH", 0)
+
+
+@pytest.mark.parametrize("document", [
+    '{"head": {"vars": ["x"]}, "results": {"bindings": []}}',
+    '[1, 2.5, "\\u00e9", true, null]',
+    '123456789012345678',
+    '[NaN, Infinity]',
+    '"\\ud800"',
+])
+def test_loads_same_as_json_loads(backend, document):
+    assert repr(loads(document)) == repr(json.loads(document))
+
+
+def test_loads_raises_json_error(backend):
+    with pytest.raises(json.decoder.JSONDecodeError):
+        loads("{")
+
+
+def test_set_unknown_json_backend():
+    with pytest.raises(ValueError):
+        set_json_backend("unknown")
+    assert get_json_backend() in available_json_backends()
+
+
+def test_iter_sparql_json():
+    pytest.importorskip("ijson")
+    document = {
+        "head": {"vars": ["x", "y"]},
+        "results": {"bindings": [
+            {"x": {"type": "uri", "value": "http://example.com/1"}},
+            {"y": {"type": "literal", "value": "1", "datatype": "http://www.w3.org/2001/XMLSchema#integer"}},
+        ]},
+    }
+    assert list(iter_sparql_json(json.dumps(document))) == [
+        ("var", "x"),
+        ("var", "y"),
+        ("bindings", None),
+        ("binding", document["results"]["bindings"][0]),
+        ("binding", document["results"]["bindings"][1]),
+    ]
+    assert list(iter_sparql_json('{"head": {}, "boolean": true}')) == [("boolean", True)]
+    with pytest.raises(ValueError):
+        list(iter_sparql_json('{"head": {'))
+
+
+def random_sparql_output(rng: random.Random, num_rows: int) -> str:
+    vars_ = ["a", "b", "c"]
+    bindings = []
+    for _ in range(num_rows):
+        binding = {}
+        for var in vars_:
+            if rng.random() < 0.2:
+                continue
+            if rng.random() < 0.5:
+                binding[var] = {
+                    "type": "literal",
+                    "value": str(rng.randint(0, 5)),
+                    "datatype": "http://www.w3.org/2001/XMLSchema#integer",
+                }
+            else:
+                binding[var] = {"type": "uri", "value": f"http://example.com/{rng.randint(0, 5)}"}
+        bindings.append(binding)
+    return json.dumps({"head": {"vars": vars_}, "results": {"bindings": bindings}})
+
+
+def test_read_sparql_output_streams_select_results(streaming):
+    output = random_sparql_output(random.Random(0), 20)
+    columns = read_sparql_output(output)
+    assert isinstance(columns, SparqlColumns)
+    assert columns.vars == ["a", "b", "c"]
+    assert columns.num_rows == 20
+    parsed = json.loads(output)
+    for var in columns.vars:
+        assert columns.column(var) == [
+            sparql._raw_value(binding[var]) if var in binding else None
+            for binding in parsed["results"]["bindings"]
+        ]
+    # ASK results and other outputs are decoded in full
+    assert read_sparql_output('{"head": {}, "boolean": true}') == {"head": {}, "boolean": True}
+    assert read_sparql_output('"Turtle"') == "Turtle"
+    with pytest.raises(json.decoder.JSONDecodeError):
+        read_sparql_output('{"head": {')
+
+
+def test_streamed_comparison_same_as_decoded(monkeypatch):
+    pytest.importorskip("ijson")
+    rng = random.Random(1)
+    outputs_pairs = []
+    for _ in range(50):
+        reference_output = random_sparql_output(rng, rng.randint(0, 4))
+        if rng.random() < 0.5:
+            actual_output = reference_output
+        else:
+            actual_output = random_sparql_output(rng, rng.randint(0, 4))
+        outputs_pairs.append((reference_output, actual_output))
+    for reference_output, actual_output in outputs_pairs:
+        for required_columns in (["a"], ["a", "b"], ["c", "b", "a"]):
+            reference = {
+                "name": "sparql_query",
+                "output": reference_output,
+                "output_media_type": "application/sparql-results+json",
+                "required_columns": required_columns,
+            }
+            actual = {"name": "sparql_query", "output": actual_output}
+            expected = compare_steps_outputs(reference, actual)
+            with monkeypatch.context() as m:
+                m.setattr(sparql, "STREAMING_MIN_LENGTH", 0)
+                assert compare_steps_outputs(reference, actual) == expected
+
+
+def test_streamed_outputs_parsed_once(streaming, monkeypatch):
+    parser_calls = []
+
+    def counting_iter_sparql_json(data):
+        parser_calls.append(data)
+        return iter_sparql_json(data)
+
+    monkeypatch.setattr(sparql, "iter_sparql_json", counting_iter_sparql_json)
+    STEP_OUTPUT_CACHE.clear()
+    rng = random.Random(2)
+    reference = {
+        "name": "sparql_query",
+        "output": random_sparql_output(rng, 10),
+        "output_media_type": "application/sparql-results+json",
+        "required_columns": ["a", "b"],
+    }
+    candidates = [
+        {"name": "sparql_query", "output": reference["output"]},
+        {"name": "sparql_query", "output": random_sparql_output(rng, 10)},
+        {"name": "sparql_query", "output": random_sparql_output(rng, 10)},
+    ]
+    for _ in range(3):
+        assert [compare_steps_outputs(reference, actual) for actual in candidates][0] == 1.0
+    # The reference output and two distinct candidates
+    assert len(parser_calls) == 3
+
+
+@pytest.mark.parametrize("output", [
+    '{"head": {"vars": ["x"]}, "results": {"bindings": []}}',
+    '{"head": {"vars": ["x"]}, "results": {"bindings": [{"x": {"type": "uri", "value": "a"}}]}}',
+    '{"head": {"vars": ["x"]}, "results": {"bindings": []',
+    '{"head": {}, "boolean": true}',
+    '"Turtle"',
+])
+def test_streamed_empty_bindings_same_as_decoded(monkeypatch, output):
+    expected = StepOutputCache().has_empty_bindings(output)
+    pytest.importorskip("ijson")
+    monkeypatch.setattr(outputs, "STREAMING_MIN_LENGTH", 0)
+    cache = StepOutputCache()
+    assert cache.has_empty_bindings(output) == expected
+    assert cache.decodes == 0
@@ -1,6 +1,14 @@
 import math
+import random
 
-from graphrag_eval.steps.retrieval import recall_at_k, average_precision
+import pytest
+
+from graphrag_eval.steps import retrieval
+from graphrag_eval.steps.retrieval import (
+    average_precision,
+    batch_retrieval_metrics,
+    recall_at_k,
+)
 
 
 def test_recall_at_k() -> None:
@@ -15,3 +23,50 @@ def test_average_precision() -> None:
     retrieved_items = [1, 3, 2, 4, 5, 6, 7, 8]
     p = average_precision(relevant_items, retrieved_items)
     assert math.isclose(p, 0.6916666666666667)
+
+
+@pytest.fixture(params=["numpy", "python"])
+def metrics_backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        monkeypatch.setattr(retrieval, "NUMPY_MIN_QUERIES", 0)
+    else:
+        monkeypatch.setattr(retrieval, "np", None)
+    return request.param
+
+
+def test_batch_retrieval_metrics(metrics_backend) -> None:
+    metrics = batch_retrieval_metrics(
+        [{1, 3, 5, 7, 9}, {1, 2, 5, 8}, set(), {4}, {"b"}],
+        [[1, 2, 3, 4, 5, 6, 7, 8, 9, 10], [1, 3, 2, 4, 5, 6, 7, 8], [1, 2], [1, 2, 3], ["a", "b"]],
+        [1, 5],
+    )
+    assert metrics["recall@5"] == pytest.approx([0.6, 0.75, 0.0, 0.0, 1.0])
+    assert metrics["precision@1"] == pytest.approx([1.0, 1.0, 0.0, 0.0, 0.0])
+    assert metrics["precision@5"] == pytest.approx([0.6, 0.6, 0.0, 0.0, 0.2])
+    assert metrics["ndcg@1"] == pytest.approx([1.0, 1.0, 0.0, 0.0, 0.0])
+    assert metrics["ndcg@5"][4] == pytest.approx(1 / math.log2(3))
+    assert metrics["reciprocal_rank"] == pytest.approx([1.0, 1.0, 0.0, 0.0, 0.5])
+    assert metrics["average_precision"] == pytest.approx([0.678730, 0.691667, 0.0, 0.0, 0.5], abs=1e-6)
+
+
+def test_batch_retrieval_metrics_agree_with_per_query_metrics(metrics_backend) -> None:
+    rng = random.Random(0)
+    relevant_docs = []
+    retrieved_docs = []
+    for _ in range(200):
+        relevant_docs.append(set(rng.sample(range(30), rng.randint(0, 8))))
+        retrieved_docs.append(rng.sample(range(30), rng.randint(0, 15)))
+    metrics = batch_retrieval_metrics(relevant_docs, retrieved_docs, [1, 3, 10, 20])
+    for i, (relevant, retrieved) in enumerate(zip(relevant_docs, retrieved_docs)):
+        for k in [1, 3, 10, 20]:
+            assert metrics[f"recall@{k}"][i] == pytest.approx(recall_at_k(relevant, retrieved, k))
+            assert 0.0 <= metrics[f"ndcg@{k}"][i] <= 1.0 + 1e-9
+        assert metrics["average_precision"][i] == pytest.approx(
+            average_precision(relevant, retrieved)
+        )
+
+
+def test_batch_retrieval_metrics_invalid_k() -> None:
+    with pytest.raises(ValueError):
+        batch_retrieval_metrics([{1}], [[1]], [0])
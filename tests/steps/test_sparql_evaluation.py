@@ -1,8 +1,22 @@
 import copy
+import itertools
+import random
+from collections import Counter
+
+import pytest
 
 from graphrag_eval import (
+    SPARQL_FILTER_COUNTS,
+    ValueCodes,
+    XSD,
     get_var_to_values,
     compare_sparql_results,
+    compare_values,
+    match_columns,
+    multiset_hash,
+    normalize_typed_value,
+    normalize_value,
+    parse_dict2table,
 )
 
 
@@ -827,3 +841,257 @@ def test_compare_sparql_results_equal_binding_values_numerical_values() -> None:
         )
         == True
     )
+
+
+def brute_force_compare_values(
+    reference_vars, reference_var_to_values, actual_vars, actual_var_to_values, results_are_ordered
+):
+    reference_rows = list(zip(*(reference_var_to_values[var] for var in reference_vars)))
+    for permutation in itertools.permutations(actual_vars, len(reference_vars)):
+        actual_rows = list(zip(*(actual_var_to_values[var] for var in permutation)))
+        if results_are_ordered and reference_rows == actual_rows:
+            return True
+        if not results_are_ordered and Counter(reference_rows) == Counter(actual_rows):
+            return True
+    return False
+
+
+@pytest.fixture(params=["numpy", "python"])
+def columns_backend(request, monkeypatch):
+    # Columns are NumPy arrays if NumPy is installed, or Python arrays
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        from graphrag_eval.steps import sparql
+        monkeypatch.setattr(sparql, "np", None)
+    return request.param
+
+
+def test_compare_values_agrees_with_brute_force(columns_backend):
+    rng = random.Random(42)
+    for _ in range(500):
+        num_rows = rng.randint(0, 5)
+        num_reference_vars = rng.randint(1, 3)
+        num_actual_vars = rng.randint(num_reference_vars, 5)
+        reference_vars = [f"r{i}" for i in range(num_reference_vars)]
+        actual_vars = [f"a{i}" for i in range(num_actual_vars)]
+        values = ["x", "y", None]
+        reference_var_to_values = {
+            var: [rng.choice(values) for _ in range(num_rows)]
+            for var in reference_vars
+        }
+        # Build actual columns partly from shuffled copies of reference rows
+        row_order = list(range(num_rows))
+        rng.shuffle(row_order)
+        actual_var_to_values = {}
+        for var in actual_vars:
+            if rng.random() < 0.6:
+                source = reference_var_to_values[rng.choice(reference_vars)]
+                actual_var_to_values[var] = [source[i] for i in row_order]
+            else:
+                actual_var_to_values[var] = [rng.choice(values) for _ in range(num_rows)]
+        for results_are_ordered in (False, True):
+            expected = brute_force_compare_values(
+                reference_vars,
+                reference_var_to_values,
+                actual_vars,
+                actual_var_to_values,
+                results_are_ordered,
+            )
+            assert compare_values(
+                reference_vars,
+                reference_var_to_values,
+                actual_vars,
+                actual_var_to_values,
+                results_are_ordered,
+            ) == expected
+
+
+def test_match_columns(columns_backend):
+    reference_var_to_values = {"person": ["1", "2"], "name": ["A", "B"]}
+    actual_var_to_values = {"n": ["B", "A"], "x": ["z", "z"], "p": ["2", "1"]}
+    assert match_columns(
+        ["person", "name"], reference_var_to_values, ["n", "x", "p"], actual_var_to_values, False
+    ) == {"person": "p", "name": "n"}
+    assert match_columns(
+        ["person", "name"], reference_var_to_values, ["n", "x", "p"], actual_var_to_values, True
+    ) is None
+    # Same column value multisets, but different rows
+    actual_var_to_values = {"p": ["1", "2"], "n": ["B", "A"]}
+    assert match_columns(
+        ["person", "name"], reference_var_to_values, ["p", "n"], actual_var_to_values, False
+    ) is None
+
+
+def test_compare_values_many_columns(columns_backend):
+    num_rows = 50
+    reference_vars = [f"r{i}" for i in range(10)]
+    reference_var_to_values = {
+        var: [f"{var}-{row}" for row in range(num_rows)] for var in reference_vars
+    }
+    actual_vars = [f"a{i}" for i in range(12)]
+    actual_var_to_values = {
+        actual_var: list(reversed(reference_var_to_values[reference_var]))
+        for actual_var, reference_var in zip(actual_vars, reversed(reference_vars))
+    }
+    actual_var_to_values["a10"] = ["extra"] * num_rows
+    actual_var_to_values["a11"] = list(reversed(reference_var_to_values["r0"]))
+    assert compare_values(
+        reference_vars, reference_var_to_values, actual_vars, actual_var_to_values, False
+    )
+    assert not compare_values(
+        reference_vars, reference_var_to_values, actual_vars, actual_var_to_values, True
+    )
+
+
+def test_compare_sparql_results_many_rows(columns_backend):
+    num_rows = 100_000
+    rng = random.Random(0)
+    rows = [(f"http://example.com/{i}", str(i % 1000), rng.choice(["a", "b"])) for i in range(num_rows)]
+    reference = {
+        "head": {"vars": ["s", "n", "c"]},
+        "results": {"bindings": [
+            {
+                "s": {"type": "uri", "value": s},
+                "n": {"type": "literal", "value": n},
+                "c": {"type": "literal", "value": c},
+            }
+            for s, n, c in rows
+        ]},
+    }
+    rng.shuffle(rows)
+    actual = {
+        "head": {"vars": ["c2", "s2", "n2"]},
+        "results": {"bindings": [
+            {
+                "s2": {"type": "uri", "value": s},
+                "n2": {"type": "literal", "value": n},
+                "c2": {"type": "literal", "value": c},
+            }
+            for s, n, c in rows
+        ]},
+    }
+    assert compare_sparql_results(reference, actual, ["s", "n", "c"]) == 1.0
+    assert compare_sparql_results(reference, actual, ["s", "n", "c"], True) == 0.0
+    actual["results"]["bindings"][0]["c2"]["value"] = "z"
+    assert compare_sparql_results(reference, actual, ["s", "n", "c"]) == 0.0
+
+
+def test_multiset_hash(columns_backend):
+    codes = ValueCodes()
+    column = codes.encode_values(["a", "b", None, "a"])
+    assert multiset_hash(column) == multiset_hash(codes.encode_values(["a", None, "a", "b"]))
+    assert multiset_hash(column) != multiset_hash(codes.encode_values(["a", "b", None, "b"]))
+    assert 0 <= multiset_hash(column) < 2 ** 64
+
+
+def test_multiset_hash_same_with_and_without_numpy(monkeypatch):
+    pytest.importorskip("numpy")
+    from graphrag_eval.steps import sparql
+
+    codes = ValueCodes()
+    column = codes.encode_values([str(i) for i in range(1000)])
+    with_numpy = multiset_hash(column)
+    monkeypatch.setattr(sparql, "np", None)
+    assert multiset_hash(codes.encode_values([str(i) for i in range(1000)])) == with_numpy
+
+
+def test_sparql_filter_counts(columns_backend):
+    def result(var_to_values: dict) -> dict:
+        num_rows = len(next(iter(var_to_values.values())))
+        return {
+            "head": {"vars": list(var_to_values)},
+            "results": {"bindings": [
+                {
+                    var: {"type": "literal", "value": values[row]}
+                    for var, values in var_to_values.items()
+                    if values[row] is not None
+                }
+                for row in range(num_rows)
+            ]},
+        }
+
+    reference = result({"x": ["1", "2", "2"], "y": ["a", "b", None]})
+    SPARQL_FILTER_COUNTS.reset()
+    assert compare_sparql_results(reference, result({"x": ["1", "2"]}), ["x"]) == 0.0
+    assert compare_sparql_results(
+        reference, result({"x": ["1", "2", "2"], "y": ["a", "b", "c"]}), ["x", "y"]
+    ) == 0.0
+    assert compare_sparql_results(
+        reference, result({"x": ["1", "2", "3"], "y": ["a", "b", None]}), ["x", "y"]
+    ) == 0.0
+    assert compare_sparql_results(
+        reference, result({"x": ["1", "1", "2"], "y": ["a", "b", None]}), ["x", "y"]
+    ) == 0.0
+    assert compare_sparql_results(
+        reference, result({"x": ["2", "2", "1"], "y": ["b", None, "a"]}), ["x", "y"], True
+    ) == 0.0
+    assert compare_sparql_results(
+        reference, result({"x": ["2", "1", "2"], "y": ["a", "b", None]}), ["x", "y"]
+    ) == 0.0
+    assert compare_sparql_results(
+        reference, result({"x": ["2", "2", "1"], "y": ["b", None, "a"]}), ["x", "y"]
+    ) == 1.0
+    assert SPARQL_FILTER_COUNTS.as_dict() == {
+        "compared": 7,
+        "row_count": 1,
+        "null_count": 1,
+        "distinct_count": 1,
+        "multiset_hash": 1,
+        "column_values": 1,
+        "column_assignment": 1,
+        "matched": 1,
+    }
+
+
+def test_normalize_value():
+    assert normalize_value(None) is None
+    assert normalize_value("1") == "1"
+    assert normalize_value(1) == normalize_value(1.0) == "1"
+    assert normalize_value(1.0000012) == "1"
+    assert normalize_value(-2.675) == "-2.675"
+    assert normalize_value(0.1) == "0.1"
+
+
+def test_normalize_typed_value():
+    assert normalize_typed_value("1", XSD + "integer") == "1"
+    assert normalize_typed_value("+01", XSD + "int") == "1"
+    assert normalize_typed_value("1.000", XSD + "decimal") == "1"
+    assert normalize_typed_value("1.0E2", XSD + "double") == "100"
+    assert normalize_typed_value("0.1234567", XSD + "double") == "0.12345"
+    assert normalize_typed_value("-0.0", XSD + "double") == "0"
+    assert normalize_typed_value("INF", XSD + "double") == "Infinity"
+    assert normalize_typed_value("12345678901234567890123456789012345", XSD + "integer") \
+        == "12345678901234567890123456789012345"
+    assert normalize_typed_value("1", XSD + "boolean") == "true"
+    assert normalize_typed_value("false", XSD + "boolean") == "false"
+    assert normalize_typed_value("2024-01-01T12:00:00+02:00", XSD + "dateTime") \
+        == normalize_typed_value("2024-01-01T10:00:00Z", XSD + "dateTime")
+    assert normalize_typed_value("2024-01-01", XSD + "date") == "2024-01-01"
+    # Invalid values and other datatypes are kept as they are
+    assert normalize_typed_value("one", XSD + "integer") == "one"
+    assert normalize_typed_value("1.0", XSD + "string") == "1.0"
+    assert normalize_typed_value("1.0", None) == "1.0"
+
+
+def test_compare_sparql_results_typed_literals(columns_backend):
+    def result(var: str, terms: list[tuple[str, str]]) -> dict:
+        return {
+            "head": {"vars": [var]},
+            "results": {"bindings": [
+                {var: {"type": "literal", "value": value, "datatype": XSD + datatype}}
+                for value, datatype in terms
+            ]},
+        }
+
+    reference = result("n", [("1", "integer"), ("2.5", "decimal"), ("true", "boolean")])
+    actual = result("m", [("2.50", "decimal"), ("1.0E0", "double"), ("1", "boolean")])
+    assert compare_sparql_results(reference, actual, ["n"]) == 1.0
+    actual = result("m", [("2.51", "decimal"), ("1.0E0", "double"), ("1", "boolean")])
+    assert compare_sparql_results(reference, actual, ["n"]) == 0.0
+
+
+def test_parse_dict2table(capsys):
+    table = parse_dict2table(["x", "y"], {"x": [1, 2.0, None], "y": ["a", "b", "c"]})
+    assert table == ["1a", "2b", "Nonec"]
+    assert capsys.readouterr().out == ""
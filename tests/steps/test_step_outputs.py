@@ -0,0 +1,151 @@
+import copy
+import json
+import sys
+from pathlib import Path
+
+import jsonlines
+import pytest
+import yaml
+
+from graphrag_eval import compute_aggregates, run_evaluation
+from graphrag_eval.steps.outputs import (
+    MIN_PARSED_OUTPUTS,
+    STEP_OUTPUT_CACHE,
+    StepOutputCache,
+    StepOutputStore,
+    retained_size,
+)
+
+
+def test_parse_is_memoized():
+    cache = StepOutputCache()
+    output = '{"head": {"vars": ["x"]}, "results": {"bindings": []}}'
+    parsed = cache.parse(output)
+    assert parsed == json.loads(output)
+    assert cache.parse(output) is parsed
+    assert cache.has_empty_bindings(output)
+    assert cache.decodes == 1
+
+
+def test_invalid_json():
+    cache = StepOutputCache()
+    with pytest.raises(json.decoder.JSONDecodeError):
+        cache.parse("not json")
+    assert not cache.has_empty_bindings("not json")
+    assert not cache.has_empty_bindings([1, 2, 3])
+    assert cache.decodes == 1
+
+
+def test_facts_outlive_parsed_outputs():
+    cache = StepOutputCache(max_parsed_bytes=10)
+    empty = '{"results": {"bindings": []}}'
+    not_empty = '{"results": {"bindings": [{"x": {"type": "literal", "value": "1"}}]}}'
+    cache.parse(empty)
+    cache.parse(not_empty)
+    cache.parse("[]")
+    assert len(cache._parsed) == MIN_PARSED_OUTPUTS
+    assert cache.has_empty_bindings(empty)
+    assert not cache.has_empty_bindings(not_empty)
+    assert cache.decodes == 3
+
+
+def test_cache_keeps_digests_not_outputs():
+    cache = StepOutputCache(max_parsed_bytes=10_000)
+    outputs = [json.dumps({"results": {"bindings": [{"x": {"value": "v" * 100 + str(i)}}]}}) for i in range(20)]
+    for output in outputs:
+        assert not cache.has_empty_bindings(output)
+    assert all(decoder == "json" and len(digest) == 16 for decoder, digest in cache._parsed)
+    assert all(len(digest) == 16 for digest in cache._empty_bindings)
+    assert len(cache._empty_bindings) == 20
+    # Bounded by the size of the parsed outputs, not of their sources
+    assert cache._parsed_bytes <= 10_000
+    assert cache._parsed_bytes == sum(size for _, size in cache._parsed.values())
+    assert min(size for _, size in cache._parsed.values()) > len(outputs[0])
+
+
+def test_retained_size():
+    small = retained_size({"a": 1})
+    assert retained_size({"a": [1, 2, 3]}) > small
+    # Shared keys are counted once
+    key = "k" * 1000
+    rows = [{key: i} for i in range(10)]
+    assert retained_size(rows) < 10 * sys.getsizeof(key)
+
+
+def test_each_output_decoded_once_per_run():
+    test_data_dir = Path(__file__).parent.parent / "test_data"
+    reference_standard = yaml.safe_load(
+        (test_data_dir / "reference_standard_corpus_1.yaml").read_text(encoding="utf-8")
+    )
+    with jsonlines.open(test_data_dir / "chat_responses_1.jsonl", "r") as reader:
+        responses = {obj["question_id"]: obj for obj in reader}
+    outputs = {
+        step["output"]
+        for response in responses.values()
+        for step in response.get("steps", [])
+        if step["status"] == "success"
+    } | {
+        step["output"]
+        for template in reference_standard
+        for question in template["questions"]
+        for group in question.get("reference_steps", [])
+        for step in group
+    }
+
+    STEP_OUTPUT_CACHE.clear()
+    decodes_before = STEP_OUTPUT_CACHE.decodes
+    compute_aggregates(run_evaluation(reference_standard, responses))
+    assert STEP_OUTPUT_CACHE.decodes - decodes_before <= len(outputs)
+
+
+def test_output_store_deduplicates_outputs():
+    store = StepOutputStore()
+    steps = [
+        {"name": "sparql", "output": "result", "status": "success", "id": "1"},
+        {"name": "retrieval", "output": [{"id": "d1"}], "status": "success", "id": "2"},
+        {"name": "sparql", "output": "result", "status": "success", "id": "3"},
+        {"name": "sparql", "status": "error", "id": "4"},
+    ]
+    compact_steps = store.compact_steps(steps)
+    assert [step.get("output_id") for step in compact_steps] == [0, 1, 0, None]
+    assert all("output" not in step for step in compact_steps)
+    assert len(store) == 2
+    assert store.resolve_steps(compact_steps) == steps
+
+
+@pytest.mark.parametrize("steps_processes", [0, 2])
+def test_run_evaluation_with_output_store(steps_processes):
+    test_data_dir = Path(__file__).parent.parent / "test_data"
+    reference_standard = yaml.safe_load(
+        (test_data_dir / "reference_standard_corpus_1.yaml").read_text(encoding="utf-8")
+    )
+    with jsonlines.open(test_data_dir / "chat_responses_1.jsonl", "r") as reader:
+        responses = {obj["question_id"]: obj for obj in reader}
+    original_reference_standard = copy.deepcopy(reference_standard)
+
+    store = StepOutputStore()
+    evaluation_results = run_evaluation(
+        reference_standard, responses, steps_processes=steps_processes, output_store=store
+    )
+    aggregates = compute_aggregates(evaluation_results, output_store=store)
+
+    # The reference data is not modified
+    assert reference_standard == original_reference_standard
+    for result in evaluation_results:
+        if "actual_steps" in result:
+            assert all("output" not in step for step in result["actual_steps"])
+            result["actual_steps"] = store.resolve_steps(result["actual_steps"])
+    expected_evaluation_results = yaml.safe_load(
+        (test_data_dir / "evaluation_1.yaml").read_text(encoding="utf-8")
+    )
+    assert expected_evaluation_results == evaluation_results
+    expected_aggregates = yaml.safe_load(
+        (test_data_dir / "evaluation_summary_1.yaml").read_text(encoding="utf-8")
+    )
+    assert expected_aggregates == aggregates
+
+
+def test_output_store_cannot_be_used_with_checkpoint(tmp_path):
+    with pytest.raises(ValueError):
+        run_evaluation([], {}, checkpoint_path=tmp_path / "checkpoint.jsonl",
+                       output_store=StepOutputStore())
@@ -1,10 +1,13 @@
+import copy
+import math
+
 from graphrag_eval import (
     compare_steps_outputs,
     match_group_by_output,
     collect_possible_matches_by_name_and_status,
     get_steps_matches
 )
-from graphrag_eval.steps import evaluate_steps
+from graphrag_eval.steps import evaluate_steps, get_steps_evaluation_result_dict, score_steps
 
 
 sparkle_expected_step = {
@@ -136,6 +139,48 @@ def test_retrieval_evaluation():
     assert compare_steps_outputs(retrieval_expected_step, retrieval_actual_step) == 0.6
 
 
+def test_get_steps_evaluation_result_dict_retrieval_metrics():
+    reference = {"reference_steps": [[dict(retrieval_expected_step)]]}
+    target = {"steps": [retrieval_actual_step]}
+    result = get_steps_evaluation_result_dict(reference, target)
+    assert result["steps_score"] == 0.6
+    assert result["retrieval_recall"] == 0.6
+    assert result["retrieval_precision"] == 0.6
+    assert result["retrieval_reciprocal_rank"] == 1.0
+    assert math.isclose(result["retrieval_average_precision"], 0.6787301587301586)
+    assert 0.0 < result["retrieval_ndcg"] < 1.0
+
+    # No relevant document in the top k: the step is not matched, and scores
+    # 0, even though a relevant document is ranked lower
+    reference = {"reference_steps": [[dict(retrieval_expected_step)]]}
+    target = {"steps": [dict(retrieval_actual_step, output=[2, 4, 6, 8, 10, 1])]}
+    result = get_steps_evaluation_result_dict(reference, target)
+    assert result["steps_score"] == 0.0
+    assert result["retrieval_recall"] == 0.0
+    assert result["retrieval_reciprocal_rank"] == 0.0
+
+    # Failed retrieval steps are not matched
+    reference = {"reference_steps": [[dict(retrieval_expected_step)]]}
+    target = {"steps": [retrieval_error_step]}
+    result = get_steps_evaluation_result_dict(reference, target)
+    assert result["retrieval_recall"] == 0.0
+
+    # Only the matched step is scored, not the last retrieval
+    reference = {"reference_steps": [[dict(retrieval_expected_step)]]}
+    target = {"steps": [
+        retrieval_actual_step,
+        dict(retrieval_actual_step, id="call_5", output=[2, 4]),
+    ]}
+    result = get_steps_evaluation_result_dict(reference, target)
+    assert reference["reference_steps"][0][0]["matches"] == "call_4"
+    assert result["retrieval_recall"] == 0.6
+
+    # Without reference retrieval steps, there are no retrieval metrics
+    reference = {"reference_steps": [[dict(calculation_expected_step)]]}
+    target = {"steps": [retrieval_actual_step]}
+    assert "retrieval_recall" not in get_steps_evaluation_result_dict(reference, target)
+
+
 def test_match_group_by_output():
     expected_steps = [
         [
@@ -268,3 +313,16 @@ def test_evaluate_steps_last_group():
     assert evaluate_steps(expected_groups, [calculation_actual_step]) == 0.0
     assert evaluate_steps(expected_groups, [retrieval_error_step]) == 0.0
     assert evaluate_steps(expected_groups, []) == 0.0
+
+
+def test_score_steps_does_not_modify_reference_steps():
+    expected_groups = [
+        [dict(sparkle_expected_step), dict(retrieval_expected_step)]
+    ]
+    original_groups = copy.deepcopy(expected_groups)
+    actual_steps = [retrieval_actual_step, sparkle_actual_step]
+    score, annotated_groups = score_steps(expected_groups, actual_steps)
+    assert expected_groups == original_groups
+    assert score == evaluate_steps(copy.deepcopy(expected_groups), actual_steps)
+    assert [step["matches"] for step in annotated_groups[-1]] \
+        == [sparkle_actual_step["id"], retrieval_actual_step["id"]]
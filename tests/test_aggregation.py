@@ -0,0 +1,114 @@
+import math
+import random
+from pathlib import Path
+from statistics import mean, median
+
+import yaml
+
+from graphrag_eval import (
+    EvaluationAggregator,
+    QuantileSketch,
+    SeriesStats,
+    compute_aggregates,
+    stats_for_series,
+)
+
+
+def load_evaluation_results() -> list[dict]:
+    return yaml.safe_load(
+        (Path(__file__).parent / "test_data" / "evaluation_1.yaml").read_text(
+            encoding="utf-8"
+        )
+    )
+
+
+def test_series_stats_same_as_stats_for_series():
+    rng = random.Random(0)
+    for values in [
+        [],
+        [1],
+        [1.5],
+        [1, 2],
+        [1, 3],
+        [1, 2.0, 3],
+        [rng.randint(0, 100) for _ in range(101)],
+    ]:
+        series = SeriesStats()
+        for value in values:
+            series.add(value)
+        assert series.summary() == stats_for_series(values)
+
+
+def test_series_stats_sum_is_exact():
+    series = SeriesStats()
+    for value in [0.1, 0.2, 0.3]:
+        series.add(value)
+    assert series.summary()["sum"] == math.fsum([0.1, 0.2, 0.3])
+    assert series.summary()["mean"] == mean([0.1, 0.2, 0.3])
+
+
+def test_series_stats_merge_order_does_not_matter():
+    rng = random.Random(1)
+    values = [rng.choice([1e16, -1e16, 1.0, 0.1, rng.randint(0, 10)]) for _ in range(200)]
+    summaries = []
+    for _ in range(3):
+        rng.shuffle(values)
+        parts = [SeriesStats() for _ in range(4)]
+        for i, value in enumerate(values):
+            parts[i % 4].add(value)
+        for part in parts[1:]:
+            parts[0].merge(part)
+        summaries.append(parts[0].summary())
+    assert summaries[0] == summaries[1] == summaries[2]
+    assert summaries[0]["sum"] == math.fsum(values)
+    assert summaries[0]["mean"] == mean(values)
+    series = SeriesStats()
+    for value in [3, 4]:
+        series.add(value)
+    assert series.int_sum == 7 and not series.float_partials
+    assert series.summary()["sum"] == 7 and isinstance(series.summary()["sum"], int)
+
+
+def test_quantile_sketch_is_exact_up_to_its_size():
+    sketch = QuantileSketch(size=100)
+    values = list(range(100, 0, -1))
+    for value in values:
+        sketch.add(value)
+    assert sketch.is_exact
+    assert sketch.median() == median(values)
+
+
+def test_quantile_sketch_approximates_median():
+    rng = random.Random(1)
+    values = [rng.random() for _ in range(100_000)]
+    sketch = QuantileSketch(size=256)
+    for value in values:
+        sketch.add(value)
+    assert not sketch.is_exact
+    assert sum(len(level) for level in sketch.levels) < 256 * 10
+    assert abs(sketch.median() - median(values)) < 0.02
+
+
+def test_aggregator_same_as_compute_aggregates():
+    evaluation_results = load_evaluation_results()
+    aggregator = EvaluationAggregator()
+    for sample in evaluation_results:
+        aggregator.add(sample)
+    expected_aggregates = yaml.safe_load(
+        (Path(__file__).parent / "test_data" / "evaluation_summary_1.yaml").read_text(
+            encoding="utf-8"
+        )
+    )
+    assert aggregator.summary() == expected_aggregates
+    assert compute_aggregates(iter(evaluation_results)) == expected_aggregates
+
+
+def test_merge_aggregators():
+    evaluation_results = load_evaluation_results()
+    partial_aggregators = [EvaluationAggregator() for _ in range(3)]
+    for i, sample in enumerate(evaluation_results):
+        partial_aggregators[i % 3].add(sample)
+    aggregator = EvaluationAggregator()
+    for partial_aggregator in partial_aggregators:
+        aggregator.merge(partial_aggregator)
+    assert aggregator.summary() == compute_aggregates(evaluation_results)
@@ -0,0 +1,105 @@
+from itertools import islice
+from pathlib import Path
+
+import jsonlines
+import pytest
+import yaml
+
+from graphrag_eval import EvaluationCheckpoint, evaluation, iter_evaluation, run_evaluation
+
+
+TEST_DATA_DIR = Path(__file__).parent / "test_data"
+
+
+def load_reference_standard() -> list[dict]:
+    return yaml.safe_load(
+        (TEST_DATA_DIR / "reference_standard_corpus_1.yaml").read_text(encoding="utf-8")
+    )
+
+
+def load_chat_responses() -> dict:
+    with jsonlines.open(TEST_DATA_DIR / "chat_responses_1.jsonl", "r") as reader:
+        return {obj["question_id"]: obj for obj in reader}
+
+
+def test_checkpoint_discards_incomplete_line(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    with EvaluationCheckpoint(path) as checkpoint:
+        checkpoint.append({"question_id": "a", "steps_score": 1})
+        checkpoint.append({"question_id": "b", "steps_score": 0.5})
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"question_id": "c", "steps_')
+
+    with EvaluationCheckpoint(path) as checkpoint:
+        assert len(checkpoint) == 2
+        assert "c" not in checkpoint
+        assert checkpoint.get("b") == {"question_id": "b", "steps_score": 0.5}
+        checkpoint.append({"question_id": "c", "steps_score": 0})
+    assert path.read_text(encoding="utf-8").splitlines()[-1] == \
+        '{"question_id": "c", "steps_score": 0}'
+
+
+def test_checkpoint_skips_malformed_lines(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    with EvaluationCheckpoint(path) as checkpoint:
+        checkpoint.append({"question_id": "a", "steps_score": 1})
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"steps_score": 0.5}\n')
+        f.write('{"question_id": "b", "steps_\n')
+        f.write('{"question_id": "c", "steps_score": 0}\n')
+        f.write('{"question_id": "d"')
+
+    with pytest.warns(UserWarning, match="malformed line") as record:
+        with EvaluationCheckpoint(path) as checkpoint:
+            assert len(checkpoint) == 2
+            assert checkpoint.get("a") == {"question_id": "a", "steps_score": 1}
+            assert checkpoint.get("c") == {"question_id": "c", "steps_score": 0}
+            checkpoint.append({"question_id": "d", "steps_score": 0})
+    assert len(record) == 2
+    # The malformed lines are kept, and skipped again
+    with pytest.warns(UserWarning), EvaluationCheckpoint(path) as checkpoint:
+        assert checkpoint.get("d") == {"question_id": "d", "steps_score": 0}
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_resume_evaluation(monkeypatch, tmp_path, max_workers):
+    checkpoint_path = tmp_path / "checkpoint.jsonl"
+    expected_evaluation_results = yaml.safe_load(
+        (TEST_DATA_DIR / "evaluation_1.yaml").read_text(encoding="utf-8")
+    )
+
+    # Interrupted run
+    evaluation_results = iter_evaluation(
+        load_reference_standard(),
+        load_chat_responses(),
+        max_workers=max_workers,
+        checkpoint_path=checkpoint_path,
+    )
+    first_results = list(islice(evaluation_results, 15))
+    evaluation_results.close()
+    assert first_results == expected_evaluation_results[:15]
+    with open(checkpoint_path, "a", encoding="utf-8") as f:
+        f.write('{"question_id": ')
+
+    # Resumed run
+    evaluated_question_ids = []
+    evaluate_question = evaluation.evaluate_question
+
+    def counting_evaluate_question(template_id, question, *args):
+        evaluated_question_ids.append(question["id"])
+        return evaluate_question(template_id, question, *args)
+
+    monkeypatch.setattr(evaluation, "evaluate_question", counting_evaluate_question)
+    evaluation_results = run_evaluation(
+        load_reference_standard(),
+        load_chat_responses(),
+        max_workers=max_workers,
+        checkpoint_path=checkpoint_path,
+    )
+    assert evaluation_results == expected_evaluation_results
+    with EvaluationCheckpoint(checkpoint_path) as checkpoint:
+        assert len(checkpoint) == len(expected_evaluation_results)
+        assert not any(question_id in evaluated_question_ids for question_id in [
+            result["question_id"] for result in first_results
+        ])
+    assert len(evaluated_question_ids) < len(expected_evaluation_results)
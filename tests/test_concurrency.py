@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from graphrag_eval.concurrency import SingleFlight, ordered_map, run_concurrently
+
+
+def test_ordered_map_keeps_order():
+    assert list(ordered_map(lambda x: x * x, range(20), max_workers=4)) \
+        == [x * x for x in range(20)]
+
+
+def test_run_concurrently_keeps_order():
+    assert run_concurrently([lambda: 1, lambda: 2, lambda: 3]) == [1, 2, 3]
+    assert run_concurrently([]) == []
+
+
+def test_run_concurrently_on_executor():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        threads = run_concurrently([threading.current_thread] * 3, executor)
+    assert threads[-1] is threading.current_thread()
+    assert threading.current_thread() not in threads[:-1]
+
+
+def test_single_flight_collapses_concurrent_calls():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def judge(key):
+        calls.append(key)
+        release.wait(timeout=5)
+        return f"result of {key}"
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(single_flight.do, "k", judge, "k") for _ in range(8)]
+        # Wait until all callers but the first are waiting for its result
+        deadline = time.monotonic() + 5
+        while single_flight.shared < 7 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        release.set()
+        assert [future.result() for future in futures] == ["result of k"] * 8
+    assert calls == ["k"]
+    assert single_flight.do("k", judge, "k") == "result of k"
+    assert single_flight.do("other", judge, "other") == "result of other"
+    assert calls == ["k", "other"]
+    assert (single_flight.calls, single_flight.shared) == (2, 8)
+
+
+def test_single_flight_does_not_keep_errors():
+    single_flight = SingleFlight()
+    outcomes = [ValueError("failed"), "result"]
+
+    def judge():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    with pytest.raises(ValueError):
+        single_flight.do("k", judge)
+    assert single_flight.do("k", judge) == "result"
+    assert single_flight.do("k", judge) == "result"
+    assert single_flight.calls == 2
+
+
+def test_single_flight_does_not_keep_error_results():
+    single_flight = SingleFlight(is_error=lambda result: "error" in result)
+    outcomes = [{"error": "failed"}, {"score": 1}]
+    assert single_flight.do("k", outcomes.pop, 0) == {"error": "failed"}
+    assert single_flight.do("k", outcomes.pop, 0) == {"score": 1}
+    assert single_flight.do("k", outcomes.pop, 0) == {"score": 1}
+    assert single_flight.calls == 2
+
+
+def test_single_flight_async():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def judge(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key.upper()
+
+    async def run():
+        return await asyncio.gather(*(
+            single_flight.do_async(key, judge, key) for key in ["a", "b", "a", "a"]
+        ))
+
+    assert asyncio.run(run()) == ["A", "B", "A", "A"]
+    assert calls == ["a", "b"]
+
+
+def test_single_flight_keeps_the_most_recently_used_results():
+    single_flight = SingleFlight(max_results=2)
+    for key in ["a", "b", "a", "c", "a", "b"]:
+        single_flight.do(key, str.upper, key)
+    # "b" is dropped when "c" is kept, as "a" was used more recently
+    assert (single_flight.calls, single_flight.shared) == (4, 2)
+    assert list(single_flight._results) == ["a", "b"]
+
+
+def test_single_flight_without_kept_results():
+    single_flight = SingleFlight(max_results=0)
+    for _ in range(3):
+        assert single_flight.do("k", str.upper, "k") == "K"
+    assert (single_flight.calls, single_flight.shared) == (3, 0)
+
+
+def test_single_flight_shared_result():
+    single_flight = SingleFlight(shared_result=lambda result: {**result, "cost": 0})
+    results = [single_flight.do("k", lambda: {"score": 1, "cost": 5}) for _ in range(3)]
+    assert results == [{"score": 1, "cost": 5}, {"score": 1, "cost": 0}, {"score": 1, "cost": 0}]
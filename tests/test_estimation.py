@@ -0,0 +1,151 @@
+from pathlib import Path
+
+import jsonlines
+import pytest
+import yaml
+
+from graphrag_eval import estimate_evaluation, estimate_tokens
+from graphrag_eval import estimation
+
+
+TEST_DATA_DIR = Path(__file__).parent / "test_data"
+PROMPT_FILE_PATH = Path(__file__).parent.parent / "prompts" / "template.md"
+
+QA_DATASET = [
+    {
+        "template_id": "t1",
+        "questions": [
+            {"id": "q1", "question_text": "Who?", "reference_answer": "Alice"},
+            {"id": "q2", "question_text": "Where?", "reference_answer": "Sofia"},
+        ],
+    },
+    {
+        "template_id": "t2",
+        "questions": [
+            {"id": "q3", "question_text": "What?"},
+        ],
+    },
+]
+
+
+def test_estimate_evaluation():
+    responses = {
+        "q1": {"question_id": "q1", "actual_answer": "Alice and Bob"},
+        "q2": {"question_id": "q2", "error": "Timeout"},
+        "q3": {"question_id": "q3", "actual_answer": "A graph"},
+    }
+    estimate = estimate_evaluation(
+        QA_DATASET,
+        responses,
+        prompt_file_path=PROMPT_FILE_PATH,
+        count_tokens=estimate_tokens,
+        prices={"gpt-4o-mini": (1.0, 2.0), "text-embedding-ada-002": (0.5, 0.0)},
+        llm_latency_sec=2.0,
+        embedding_latency_sec=0.5,
+    )
+    prompt = PROMPT_FILE_PATH.read_text(encoding="utf-8").format(
+        question="Who?", reference_answer="Alice", candidate_answer="Alice and Bob"
+    )
+    relevance_input_tokens = 3 * (estimation.RELEVANCE_PROMPT_TOKENS + estimate_tokens("Alice and Bob"))
+    t1 = estimate["per_template"]["t1"]
+    assert t1["questions"] == 2
+    assert t1["correctness_calls"] == 1
+    assert t1["relevance_calls"] == 3
+    assert t1["embedding_calls"] == 2
+    assert t1["input_tokens"] == estimate_tokens(prompt) + relevance_input_tokens
+    assert t1["output_tokens"] == estimation.CORRECTNESS_OUTPUT_TOKENS + 90
+    assert t1["embedding_tokens"] == estimate_tokens("Who?") + 90
+    assert t1["cost_usd"] == pytest.approx(
+        (t1["input_tokens"] + 2 * t1["output_tokens"] + 0.5 * t1["embedding_tokens"]) / 1e6
+    )
+    # The correctness judge runs while the relevance judge makes its calls
+    assert t1["wall_time_sec"] == pytest.approx(3 * 2.0 + 2 * 0.5)
+
+    t2 = estimate["per_template"]["t2"]
+    assert t2["correctness_calls"] == 0
+    assert t2["relevance_calls"] == 3
+
+    total = estimate["total"]
+    assert total["questions"] == 3
+    assert total["input_tokens"] == t1["input_tokens"] + t2["input_tokens"]
+    assert total["wall_time_sec"] == pytest.approx(2 * (3 * 2.0 + 2 * 0.5))
+
+
+def test_estimate_evaluation_wall_time_bounds():
+    kwargs = dict(
+        qa_dataset=QA_DATASET,
+        prompt_file_path=PROMPT_FILE_PATH,
+        count_tokens=estimate_tokens,
+        llm_latency_sec=1.0,
+        embedding_latency_sec=0.0,
+    )
+    # Without responses, only questions with reference answers are judged
+    total = estimate_evaluation(**kwargs)["total"]
+    assert total["wall_time_sec"] == pytest.approx(6.0)
+    assert estimate_evaluation(max_workers=3, **kwargs)["total"]["wall_time_sec"] \
+        == pytest.approx(2.0)
+    requests = total["correctness_calls"] + total["relevance_calls"] + total["embedding_calls"]
+    assert estimate_evaluation(max_workers=3, requests_per_minute=requests, **kwargs)["total"][
+        "wall_time_sec"] == pytest.approx(60.0)
+    tokens = total["input_tokens"] + total["output_tokens"]
+    assert estimate_evaluation(max_workers=3, tokens_per_minute=tokens / 2, **kwargs)["total"][
+        "wall_time_sec"] == pytest.approx(120.0)
+
+
+def test_estimate_evaluation_of_corpus():
+    reference_standard = yaml.safe_load(
+        (TEST_DATA_DIR / "reference_standard_corpus_1.yaml").read_text(encoding="utf-8")
+    )
+    with jsonlines.open(TEST_DATA_DIR / "chat_responses_1.jsonl", "r") as reader:
+        responses = {obj["question_id"]: obj for obj in reader}
+    estimate = estimate_evaluation(
+        reference_standard, responses, prompt_file_path=PROMPT_FILE_PATH
+    )
+    assert estimate["total"]["questions"] == sum(
+        len(template["questions"]) for template in reference_standard
+    )
+    assert set(estimate["per_template"]) == {
+        template["template_id"] for template in reference_standard
+    }
+
+
+def test_token_counter_does_not_download_encodings(monkeypatch, tmp_path):
+    tiktoken = pytest.importorskip("tiktoken")
+
+    def download(*_):
+        raise AssertionError("An encoding was downloaded")
+
+    monkeypatch.setenv("TIKTOKEN_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(tiktoken.load, "read_file", download)
+    assert estimation.get_token_counter("gpt-4o-mini") is estimate_tokens
+
+
+@pytest.mark.parametrize("cache_dir_variable", ["TIKTOKEN_CACHE_DIR", "DATA_GYM_CACHE_DIR"])
+def test_tiktoken_cache_path_is_where_tiktoken_caches(monkeypatch, tmp_path, cache_dir_variable):
+    tiktoken = pytest.importorskip("tiktoken")
+    tiktoken_ext = pytest.importorskip("tiktoken_ext.openai_public")
+    downloaded = []
+
+    def download(blobpath):
+        downloaded.append(blobpath)
+        raise ConnectionError("No network")
+
+    monkeypatch.delenv("TIKTOKEN_CACHE_DIR", raising=False)
+    monkeypatch.setenv(cache_dir_variable, str(tmp_path))
+    monkeypatch.setattr(tiktoken.load, "read_file", download)
+    # tiktoken downloads the encoding from the expected URL
+    with pytest.raises(ConnectionError):
+        tiktoken_ext.o200k_base()
+    assert downloaded == [estimation.TIKTOKEN_ENCODING_URL.format("o200k_base")]
+    # and caches it at the expected path
+    monkeypatch.setattr(tiktoken.load, "read_file", lambda _: b"encoding")
+    tiktoken.load.read_file_cached(downloaded[0])
+    assert estimation._tiktoken_cache_path("o200k_base").read_bytes() == b"encoding"
+
+
+def test_token_counter_without_tiktoken_cache(monkeypatch):
+    pytest.importorskip("tiktoken")
+    # An empty directory disables tiktoken's cache, so any load downloads
+    monkeypatch.setenv("TIKTOKEN_CACHE_DIR", "")
+    assert estimation._tiktoken_cache_path("o200k_base") is None
+    assert estimation.get_token_counter("gpt-4o-mini") is estimate_tokens
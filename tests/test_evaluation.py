@@ -1,14 +1,20 @@
+import copy
+import threading
 from pathlib import Path
 
 import jsonlines
+import pytest
 import yaml
 
 from graphrag_eval import (
     compute_aggregates,
+    evaluate_question,
     evaluate_steps,
     run_evaluation,
     stats_for_series,
 )
+from graphrag_eval import steps
+from graphrag_eval.steps import get_steps_evaluation_result_dict, retrieval
 
 
 def test_stats_for_series():
@@ -119,6 +125,119 @@ def test_run_evaluation_and_compute_aggregates_all_errors():
     assert expected_aggregates == aggregates
 
 
+def test_run_evaluation_with_max_workers():
+    def get_chat_responses(path: Path) -> dict:
+        responses = dict()
+        with jsonlines.open(path, "r") as reader:
+            for obj in reader:
+                responses[obj["question_id"]] = obj
+        return responses
+
+    sample_reference_standard = yaml.safe_load(
+        (
+            Path(__file__).parent / "test_data" / "reference_standard_corpus_1.yaml"
+        ).read_text(encoding="utf-8")
+    )
+    sample_chat_responses_path = (
+        Path(__file__).parent / "test_data" / "chat_responses_1.jsonl"
+    )
+
+    evaluation_results = run_evaluation(
+        sample_reference_standard,
+        get_chat_responses(sample_chat_responses_path),
+        max_workers=4,
+    )
+    expected_evaluation_results = yaml.safe_load(
+        (Path(__file__).parent / "test_data" / "evaluation_1.yaml").read_text(
+            encoding="utf-8"
+        )
+    )
+    assert expected_evaluation_results == evaluation_results
+
+
+def test_run_evaluation_with_steps_processes():
+    sample_reference_standard = yaml.safe_load(
+        (
+            Path(__file__).parent / "test_data" / "reference_standard_corpus_1.yaml"
+        ).read_text(encoding="utf-8")
+    )
+    with jsonlines.open(
+        Path(__file__).parent / "test_data" / "chat_responses_1.jsonl", "r"
+    ) as reader:
+        chat_responses = {obj["question_id"]: obj for obj in reader}
+
+    evaluation_results = run_evaluation(
+        sample_reference_standard,
+        chat_responses,
+        steps_processes=2,
+    )
+    expected_evaluation_results = yaml.safe_load(
+        (Path(__file__).parent / "test_data" / "evaluation_1.yaml").read_text(
+            encoding="utf-8"
+        )
+    )
+    assert expected_evaluation_results == evaluation_results
+
+
+def test_steps_processes_keep_max_workers_and_filter_counts(monkeypatch):
+    from graphrag_eval import evaluation
+    from graphrag_eval.steps.sparql import SPARQL_FILTER_COUNTS
+
+    sample_reference_standard = yaml.safe_load(
+        (
+            Path(__file__).parent / "test_data" / "reference_standard_corpus_1.yaml"
+        ).read_text(encoding="utf-8")
+    )
+    with jsonlines.open(
+        Path(__file__).parent / "test_data" / "chat_responses_1.jsonl", "r"
+    ) as reader:
+        chat_responses = {obj["question_id"]: obj for obj in reader}
+
+    SPARQL_FILTER_COUNTS.reset()
+    run_evaluation(copy.deepcopy(sample_reference_standard), chat_responses)
+    serial_counts = SPARQL_FILTER_COUNTS.as_dict()
+    assert serial_counts
+
+    thread_counts = []
+    ordered_map = evaluation.ordered_map
+
+    def recording_ordered_map(fn, items, max_workers):
+        thread_counts.append(max_workers)
+        return ordered_map(fn, items, max_workers)
+
+    monkeypatch.setattr(evaluation, "ordered_map", recording_ordered_map)
+    SPARQL_FILTER_COUNTS.reset()
+    run_evaluation(sample_reference_standard, chat_responses, steps_processes=2)
+    # The LLM judges run on as many threads as requested, and the SPARQL
+    # comparisons in the worker processes are counted
+    assert thread_counts == [1]
+    assert SPARQL_FILTER_COUNTS.as_dict() == serial_counts
+
+
+def test_compact_steps_payload():
+    from graphrag_eval.steps.parallel import compact_steps_payload
+
+    output = "".join(["re", "sult"])
+    reference_steps = [
+        [{"name": "sparql", "output": "first group", "args": {"query": "..."}}],
+        [{"name": "sparql", "output": "result", "args": {"query": "..."}}],
+    ]
+    actual_steps = [
+        {"name": "sparql", "output": output, "status": "success", "id": "1", "args": {}},
+        {"name": "sparql", "output": "failed", "status": "error", "id": "2"},
+        {"name": "other", "output": "other", "status": "success", "id": "3"},
+    ]
+    reference_payload, actual_payload = compact_steps_payload(reference_steps, actual_steps)
+    assert reference_payload == [[{"name": "sparql"}], [{"name": "sparql", "output": "result"}]]
+    assert actual_payload == [
+        {"name": "sparql", "output": "result", "status": "success", "id": "1"},
+        {"name": "sparql", "status": "error", "id": "2"},
+        {"name": "other", "status": "success", "id": "3"},
+    ]
+    # Equal outputs are pickled once
+    assert actual_payload[0]["output"] is reference_payload[1][0]["output"]
+
+
 def test_get_steps_matches():
     expected_calls = [
         [
@@ -256,3 +375,136 @@ def test_evaluate_steps_expected_select_actual_ask_and_then_select():
     assert evaluate_steps(expected_calls, actual_calls) == 1
     assert "matches" in expected_calls[-1][0]
     assert expected_calls[-1][0]["matches"] == "call_3qJK186HZj1twnr6x976slHN"
+
+
+def test_evaluate_question_runs_judges_and_steps_concurrently():
+    # Each part waits for the other two, so it fails if they run one by one
+    barrier = threading.Barrier(3, timeout=5)
+
+    class RelevanceEvaluator:
+        def get_relevance_dict(self, question_text, actual_answer):
+            barrier.wait()
+            return {"answer_relevance": 0.9}
+
+    class CorrectnessEvaluator:
+        def get_correctness_dict(self, question, actual_result):
+            barrier.wait()
+            return {"answer_recall": 1.0}
+
+    def steps_evaluator(question, actual_result):
+        barrier.wait()
+        return {"actual_steps": actual_result["steps"], "steps_score": 1.0}
+
+    question = {"id": "q1", "question_text": "Why?", "reference_answer": "Because"}
+    actual_result = {
+        "question_id": "q1",
+        "actual_answer": "Because",
+        "steps": [],
+        "input_tokens": 1,
+        "output_tokens": 2,
+        "total_tokens": 3,
+        "elapsed_sec": 0.5,
+    }
+    eval_result = evaluate_question(
+        "t1",
+        question,
+        actual_result,
+        CorrectnessEvaluator(),
+        RelevanceEvaluator(),
+        steps_evaluator,
+    )
+    assert list(eval_result) == [
+        "template_id",
+        "question_id",
+        "question_text",
+        "reference_answer",
+        "status",
+        "actual_answer",
+        "answer_relevance",
+        "answer_recall",
+        "actual_steps",
+        "steps_score",
+        "input_tokens",
+        "output_tokens",
+        "total_tokens",
+        "elapsed_sec",
+    ]
+
+
+def retrieval_corpus(num_questions: int) -> tuple[list[dict], dict]:
+    questions = []
+    responses = {}
+    for i in range(num_questions):
+        question_id = f"q{i}"
+        questions.append({
+            "id": question_id,
+            "question_text": f"Question {i}",
+            "reference_steps": [[{
+                "name": "retrieval",
+                "args": {"query": f"Question {i}", "k": 1 + i % 5},
+                "output": [i, i + 1, i + 2],
+            }]],
+        })
+        responses[question_id] = {
+            "question_id": question_id,
+            "steps": [{
+                "name": "retrieval",
+                "args": {"query": f"Question {i}", "k": 5},
+                "id": f"call_{i}",
+                "status": "success",
+                "output": [i + 2, i + 10, i, i + 11, i + 1][:1 + i % 5],
+            }],
+            "input_tokens": 1,
+            "output_tokens": 1,
+            "total_tokens": 2,
+            "elapsed_sec": 0.1,
+        }
+    return [{"template_id": "t", "questions": questions}], responses
+
+
+@pytest.mark.parametrize("steps_processes", [0, 2])
+def test_run_evaluation_scores_retrieval_in_one_batch(monkeypatch, tmp_path, steps_processes):
+    pytest.importorskip("numpy")
+    batch_sizes = []
+    batch_retrieval_metrics = retrieval.batch_retrieval_metrics
+
+    def counting_batch_retrieval_metrics(relevant_docs, *args):
+        batch_sizes.append(len(relevant_docs))
+        return batch_retrieval_metrics(relevant_docs, *args)
+
+    monkeypatch.setattr(steps, "batch_retrieval_metrics", counting_batch_retrieval_metrics)
+    qa_dataset, responses = retrieval_corpus(40)
+    expected_evaluation_results = []
+    for question in copy.deepcopy(qa_dataset[0]["questions"]):
+        actual_result = responses[question["id"]]
+        expected = {
+            "template_id": "t",
+            "question_id": question["id"],
+            "question_text": question["question_text"],
+            "reference_steps": question["reference_steps"],
+            "status": "success",
+            **get_steps_evaluation_result_dict(question, actual_result),
+            "input_tokens": 1,
+            "output_tokens": 1,
+            "total_tokens": 2,
+            "elapsed_sec": 0.1,
+        }
+        expected_evaluation_results.append(expected)
+    assert batch_sizes == [1] * 40
+    batch_sizes.clear()
+
+    checkpoint_path = tmp_path / "checkpoint.jsonl"
+    evaluation_results = run_evaluation(
+        qa_dataset,
+        responses,
+        checkpoint_path=checkpoint_path,
+        steps_processes=steps_processes,
+    )
+    # All retrieval steps are scored in one pass, over NumPy arrays
+    assert batch_sizes == [40]
+    assert batch_sizes[0] >= retrieval.NUMPY_MIN_QUERIES
+    assert evaluation_results == expected_evaluation_results
+    assert [list(result) for result in evaluation_results] \
+        == [list(result) for result in expected_evaluation_results]
+    with jsonlines.open(checkpoint_path) as reader:
+        assert list(reader) == expected_evaluation_results
@@ -0,0 +1,71 @@
+from graphrag_eval import LLMCache, make_cache_key
+
+
+def test_make_cache_key():
+    key = make_cache_key("answer_correctness", "gpt-4o-mini", 0.0, "prompt")
+    assert key == make_cache_key("answer_correctness", "gpt-4o-mini", 0.0, "prompt")
+    assert key != make_cache_key("answer_correctness", "gpt-4o-mini", 0.5, "prompt")
+    assert key != make_cache_key("answer_correctness", "gpt-4o", 0.0, "prompt")
+    assert key != make_cache_key("answer_correctness", "gpt-4o-mini", 0.0, "prompt 2")
+
+
+def test_get_and_put(tmp_path):
+    cache = LLMCache(tmp_path / "cache.sqlite")
+    assert cache.get("a") is None
+    cache.put("a", "2\t2\t2\treason")
+    assert cache.get("a") == "2\t2\t2\treason"
+    cache.put_json("b", {"answer_relevance": 0.9})
+    assert cache.get_json("b") == {"answer_relevance": 0.9}
+    assert cache.stats() == {
+        "hits": 2,
+        "misses": 1,
+        "evictions": 0,
+        "size_bytes": len("2\t2\t2\treason") + len('{"answer_relevance": 0.9}'),
+    }
+    cache.close()
+
+    # Entries persist across instances
+    cache = LLMCache(tmp_path / "cache.sqlite")
+    assert cache.get("a") == "2\t2\t2\treason"
+    assert cache.size_bytes == len("2\t2\t2\treason") + len('{"answer_relevance": 0.9}')
+    cache.close()
+
+
+def test_eviction_of_least_recently_used(tmp_path):
+    cache = LLMCache(tmp_path / "cache.sqlite", max_size_bytes=25)
+    cache.put("a", "x" * 10)
+    cache.put("b", "y" * 10)
+    assert cache.get("a") == "x" * 10
+    cache.put("c", "z" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") == "x" * 10
+    assert cache.get("c") == "z" * 10
+    assert cache.evictions == 1
+    assert cache.size_bytes == 20
+    cache.close()
+
+
+def test_disabled_cache(tmp_path):
+    cache = LLMCache(tmp_path / "cache.sqlite", enabled=False)
+    cache.put("a", "value")
+    assert cache.get("a") is None
+    assert cache.misses == 1
+    assert not (tmp_path / "cache.sqlite").exists()
+
+
+def test_hits_do_not_write_until_put_or_close(tmp_path):
+    cache = LLMCache(tmp_path / "cache.sqlite", max_size_bytes=25)
+    cache.put("a", "x" * 10)
+    cache.put("b", "y" * 10)
+    changes = cache._connection.total_changes
+    for _ in range(10):
+        assert cache.get("a") == "x" * 10
+    assert cache._connection.total_changes == changes
+    cache.close()
+
+    # The access times were written on close, so "b" is the least recently used
+    cache = LLMCache(tmp_path / "cache.sqlite", max_size_bytes=25)
+    cache.put("c", "z" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") == "x" * 10
+    cache.close()
@@ -0,0 +1,176 @@
+import asyncio
+
+import pytest
+
+from graphrag_eval import LLMScheduler, TokenBucket, is_retryable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    async def async_sleep(self, seconds: float) -> None:
+        self.sleep(seconds)
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+
+
+class APITimeoutError(Exception):
+    pass
+
+
+def test_is_retryable():
+    assert is_retryable(StatusError(429))
+    assert is_retryable(StatusError(500))
+    assert is_retryable(StatusError(503))
+    assert is_retryable(APITimeoutError())
+    assert not is_retryable(StatusError(400))
+    assert not is_retryable(StatusError(401))
+    assert not is_retryable(ValueError())
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock)
+    # A minute's worth of tokens is available at once
+    assert bucket.reserve(60) == 0.0
+    # Then tokens are refilled at one per second
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    assert bucket.reserve(1) == pytest.approx(2.0)
+    clock.now += 10
+    assert bucket.reserve(1) == 0.0
+    # Requests larger than the capacity take a full bucket
+    assert bucket.reserve(1000) == pytest.approx(53.0)
+
+
+def test_scheduler_throttles_requests():
+    clock = FakeClock()
+    scheduler = LLMScheduler(
+        requests_per_minute=120,
+        tokens_per_minute=600,
+        clock=clock,
+        sleep=clock.sleep,
+    )
+    for _ in range(4):
+        assert scheduler.call(lambda x: x * 2, 21, estimated_tokens=200) == 42
+    # The 4th request exceeds the token budget by 200 tokens, i.e. 20 seconds
+    assert clock.sleeps == [pytest.approx(20.0)]
+    assert scheduler.stats() == {
+        "requests": 4,
+        "retries": 0,
+        "rate_limited": 0,
+        "failures": 0,
+        "throttled_sec": pytest.approx(20.0),
+        "backoff_sec": 0.0,
+    }
+
+
+def test_scheduler_reserves_several_requests_per_call():
+    clock = FakeClock()
+    scheduler = LLMScheduler(requests_per_minute=60, clock=clock, sleep=clock.sleep)
+    for _ in range(13):
+        scheduler.call(lambda: None, num_requests=5)
+    # 65 requests, 5 beyond the budget of a minute, i.e. 5 seconds
+    assert clock.sleeps == [pytest.approx(5.0)]
+    assert scheduler.stats()["requests"] == 65
+
+
+def test_scheduler_retries_with_backoff():
+    clock = FakeClock()
+    scheduler = LLMScheduler(
+        max_retries=3,
+        initial_backoff_sec=1.0,
+        max_backoff_sec=3.0,
+        clock=clock,
+        sleep=clock.sleep,
+    )
+    errors = [StatusError(429), StatusError(500), APITimeoutError()]
+
+    def flaky():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert scheduler.call(flaky) == "ok"
+    assert len(clock.sleeps) == 3
+    for attempt, delay in enumerate(clock.sleeps):
+        assert 0 <= delay <= min(3.0, 2 ** attempt)
+    stats = scheduler.stats()
+    assert stats["requests"] == 4
+    assert stats["retries"] == 3
+    assert stats["rate_limited"] == 1
+    assert stats["failures"] == 0
+    assert stats["backoff_sec"] == pytest.approx(sum(clock.sleeps))
+
+
+def test_scheduler_gives_up():
+    clock = FakeClock()
+    scheduler = LLMScheduler(max_retries=2, clock=clock, sleep=clock.sleep)
+
+    def rate_limited():
+        raise StatusError(429)
+
+    with pytest.raises(StatusError):
+        scheduler.call(rate_limited)
+    assert scheduler.stats()["requests"] == 3
+    assert scheduler.stats()["failures"] == 1
+
+    def bad_request():
+        raise StatusError(400)
+
+    # Errors that are not retryable are raised at once
+    with pytest.raises(StatusError):
+        scheduler.call(bad_request)
+    assert scheduler.stats()["requests"] == 4
+    assert scheduler.stats()["retries"] == 2
+    assert scheduler.stats()["failures"] == 2
+
+
+def test_scheduler_respects_retry_after():
+    class Response:
+        headers = {"retry-after": "7"}
+
+    error = StatusError(429)
+    error.response = Response()
+    errors = [error]
+
+    def flaky():
+        if errors:
+            raise errors.pop()
+        return "ok"
+
+    clock = FakeClock()
+    scheduler = LLMScheduler(clock=clock, sleep=clock.sleep)
+    assert scheduler.call(flaky) == "ok"
+    assert clock.sleeps == [7.0]
+
+
+def test_scheduler_call_async():
+    clock = FakeClock()
+    scheduler = LLMScheduler(
+        requests_per_minute=60,
+        clock=clock,
+        async_sleep=clock.async_sleep,
+    )
+    errors = [StatusError(503)]
+
+    async def flaky(x):
+        if errors:
+            raise errors.pop()
+        return x
+
+    assert asyncio.run(scheduler.call_async(flaky, "ok")) == "ok"
+    assert scheduler.stats()["requests"] == 2
+    assert scheduler.stats()["retries"] == 1
@@ -0,0 +1,87 @@
+import sys
+from pathlib import Path
+
+import yaml
+
+from graphrag_eval import (
+    EvaluationRecord,
+    EvaluationTable,
+    compute_aggregates,
+    compute_table_aggregates,
+    to_dicts,
+    to_records,
+)
+
+
+TEST_DATA_DIR = Path(__file__).parent / "test_data"
+
+
+def load_evaluation_results() -> list[dict]:
+    return yaml.safe_load(
+        (TEST_DATA_DIR / "evaluation_1.yaml").read_text(encoding="utf-8")
+    )
+
+
+def test_records_round_trip():
+    results = load_evaluation_results()
+    results.append({
+        "template_id": "t",
+        "question_id": "q",
+        "question_text": "Why?",
+        "status": "success",
+        "answer_f1": None,
+        "custom_metric": 1,
+    })
+    records = to_records(results)
+    assert to_dicts(records) == results
+    assert records[-1].answer_f1 is None
+    assert records[-1].extra == {"answer_f1": None, "custom_metric": 1}
+
+
+def test_records_are_slotted():
+    result = {
+        field: 1.0
+        for field in EvaluationRecord.__slots__
+        if field not in {"template_id", "question_id", "question_text", "extra"}
+    }
+    record = EvaluationRecord("t", "q", "Why?", **result)
+    assert not hasattr(record, "__dict__")
+    assert sys.getsizeof(record) + sys.getsizeof(record.extra) \
+        < sys.getsizeof(record.to_dict())
+
+
+def test_table_aggregates_same_as_compute_aggregates():
+    results = load_evaluation_results()
+    expected_aggregates = yaml.safe_load(
+        (TEST_DATA_DIR / "evaluation_summary_1.yaml").read_text(encoding="utf-8")
+    )
+    assert compute_aggregates(results) == expected_aggregates
+    table = EvaluationTable.from_results(results)
+    assert len(table) == len(results)
+    assert compute_table_aggregates(table) == expected_aggregates
+    table = EvaluationTable.from_results(to_records(results))
+    assert compute_table_aggregates(table) == expected_aggregates
+
+
+def test_table_keeps_integer_and_float_values():
+    results = [
+        {
+            "template_id": "t",
+            "question_id": f"q{i}",
+            "question_text": "Why?",
+            "status": "success",
+            "steps_score": steps_score,
+            "elapsed_sec": 2,
+        }
+        for i, steps_score in enumerate([1, 0, 0.5])
+    ]
+    table = EvaluationTable.from_results(results)
+    column = table.columns["steps_score"]
+    assert list(column.values()) == [1, 0, 0.5]
+    assert [type(value) for value in column.values()] == [int, int, float]
+    expected_aggregates = compute_aggregates(results)
+    aggregates = compute_table_aggregates(table)
+    assert aggregates == expected_aggregates
+    assert aggregates["micro"]["steps_score"]["min"] == 0
+    assert type(aggregates["micro"]["steps_score"]["min"]) is int
+    assert type(aggregates["micro"]["elapsed_sec"]["sum"]) is int
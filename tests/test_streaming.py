@@ -0,0 +1,94 @@
+import json
+from pathlib import Path
+
+import yaml
+
+from graphrag_eval import (
+    JsonlIndex,
+    iter_evaluation_jsonl,
+    read_jsonl,
+    run_evaluation_jsonl,
+)
+
+
+TEST_DATA_DIR = Path(__file__).parent / "test_data"
+
+
+def write_reference_jsonl(path: Path) -> None:
+    reference_standard = yaml.safe_load(
+        (TEST_DATA_DIR / "reference_standard_corpus_1.yaml").read_text(encoding="utf-8")
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        for template in reference_standard:
+            f.write(json.dumps(template) + "\n")
+
+
+def test_jsonl_index(tmp_path):
+    path = tmp_path / "responses.jsonl"
+    path.write_text(
+        '{"question_id": "a", "actual_answer": "A"}\n'
+        '\n'
+        '{"question_id": "b", "actual_answer": "B \\u00e9"}\n',
+        encoding="utf-8",
+    )
+    with JsonlIndex(path) as index:
+        assert len(index) == 2
+        assert list(index) == ["a", "b"]
+        assert index["b"] == {"question_id": "b", "actual_answer": "B é"}
+        assert index["a"] == {"question_id": "a", "actual_answer": "A"}
+        assert "c" not in index
+
+
+def test_jsonl_index_decodes_records_on_lookup_only(monkeypatch, tmp_path):
+    path = tmp_path / "responses.jsonl"
+    path.write_text(
+        '{"actual_answer": "\\"question_id\\": \\"x\\"", "question_id": "a"}\n'
+        '{"question_id" : "b\\u00e9", "steps": [{"question_id": "c"}]}\n'
+        '{"steps": [{"question_id": "d"}]}\n',
+        encoding="utf-8",
+    )
+    decoded = []
+    loads = json.loads
+    monkeypatch.setattr(json, "loads", lambda s: decoded.append(s) or loads(s))
+    with JsonlIndex(path) as index:
+        # Only the record with the key twice is decoded to index it
+        assert sum(len(s) > 10 for s in decoded) == 1
+        assert list(index) == ["a", "bé", "d"]
+        assert index["a"]["actual_answer"] == '"question_id": "x"'
+        assert index["bé"]["steps"] == [{"question_id": "c"}]
+        # The key was only in a nested object
+        assert "d" not in index
+
+
+def test_run_evaluation_jsonl(tmp_path):
+    reference_path = tmp_path / "reference.jsonl"
+    write_reference_jsonl(reference_path)
+    out_path = tmp_path / "out" / "evaluation.jsonl"
+
+    count = run_evaluation_jsonl(
+        reference_path,
+        TEST_DATA_DIR / "chat_responses_1.jsonl",
+        out_path,
+    )
+
+    expected_evaluation_results = yaml.safe_load(
+        (TEST_DATA_DIR / "evaluation_1.yaml").read_text(encoding="utf-8")
+    )
+    assert count == len(expected_evaluation_results)
+    assert list(read_jsonl(out_path)) == expected_evaluation_results
+
+
+def test_iter_evaluation_jsonl_with_max_workers(tmp_path):
+    reference_path = tmp_path / "reference.jsonl"
+    write_reference_jsonl(reference_path)
+
+    evaluation_results = iter_evaluation_jsonl(
+        reference_path,
+        TEST_DATA_DIR / "chat_responses_1.jsonl",
+        max_workers=3,
+    )
+
+    expected_evaluation_results = yaml.safe_load(
+        (TEST_DATA_DIR / "evaluation_1.yaml").read_text(encoding="utf-8")
+    )
+    assert list(evaluation_results) == expected_evaluation_results